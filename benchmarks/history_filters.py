@@ -0,0 +1,151 @@
+"""
+Benchmark of the filtered /v1/history queries.
+
+Fills a temporary copy of query_log, with the same indexes, with a multi-million
+row fixture: rows inserted in time order over 30 days, for domains following a
+skewed popularity. The temporary tables, with copies of domain and
+resolution_address, shadow the real ones for the benchmark session only, so
+the real tables are neither read nor modified.
+
+For each kind of history request, the query built by the endpoint is run with
+EXPLAIN (ANALYZE, BUFFERS) and its plan and execution time are printed.
+
+Usage:
+    PYTHONPATH=src python benchmarks/history_filters.py [rows]
+
+The POSTGRES_* environment variables select the database, as for the app.
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from db.database import engine
+from routers.history import HISTORY_PAGE_SIZE, history_statement
+
+FIXTURE_DAYS = 30
+FIXTURE_DOMAINS = 100000
+
+
+def populate(connection, rows: int):
+    """Creates and fills the temporary query_log, domains and addresses."""
+    for table in ("query_log", "domain", "resolution_address"):
+        connection.execute(
+            text(
+                f"CREATE TEMP TABLE {table} "
+                f"(LIKE public.{table} INCLUDING ALL) ON COMMIT PRESERVE ROWS"
+            )
+        )
+    connection.execute(
+        text(
+            """
+            INSERT INTO domain ("domainID", name, "resolutionID")
+            SELECT g, 'd' || g || '.example', g
+            FROM generate_series(0, :domains - 1) AS g
+            """
+        ),
+        {"domains": FIXTURE_DOMAINS},
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO resolution_address ("resolutionID", address)
+            SELECT g, '93.184.216.34' FROM generate_series(0, :domains - 1) AS g
+            """
+        ),
+        {"domains": FIXTURE_DOMAINS},
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO query_log
+                ("queryID", "domainID", "resolutionID", created_time)
+            SELECT g, id, id, now() - make_interval(secs => (:rows - g) * :step)
+            FROM (
+                SELECT g, floor(power(random(), 3) * :domains)::int AS id
+                FROM generate_series(1, :rows) AS g
+            ) AS fixture
+            """
+        ),
+        {"rows": rows, "domains": FIXTURE_DOMAINS, "step": FIXTURE_DAYS * 86400 / rows},
+    )
+    # Summarize the BRIN ranges filled after the index was created, as
+    # autosummarize does in the background for a live table
+    connection.execute(
+        text(
+            "SELECT brin_summarize_new_values(indexrelid) FROM pg_index "
+            "JOIN pg_class ON pg_class.oid = indexrelid "
+            "JOIN pg_am ON pg_am.oid = relam "
+            "WHERE indrelid = 'query_log'::regclass AND amname = 'brin'"
+        )
+    )
+    for table in ("query_log", "domain", "resolution_address"):
+        connection.execute(text(f"ANALYZE {table}"))
+
+
+def explain(connection, title: str, statement):
+    """Prints the plan and execution time of a statement."""
+    compiled = statement.compile(dialect=postgresql.dialect())
+    plan = connection.exec_driver_sql(
+        "EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) " + str(compiled), compiled.params
+    ).scalars()
+    print(f"\n== {title}")
+    for line in plan:
+        print(f"   {line}")
+
+
+def main(rows: int = 2000000):
+    now = datetime.now(timezone.utc)
+    with engine.connect() as connection:
+        print(f"Populating {rows} rows...")
+        populate(connection, rows)
+        # Rows the deep page starts after
+        middle = connection.execute(
+            text('SELECT created_time, "queryID" FROM query_log WHERE "queryID" = :id'),
+            {"id": rows // 2},
+        ).one()
+        limit = HISTORY_PAGE_SIZE + 1
+
+        explain(connection, "Latest page", history_statement(limit))
+        explain(
+            connection,
+            "Page half-way through the table",
+            history_statement(limit, after=tuple(middle)),
+        )
+        explain(
+            connection,
+            "Popular domain in the last hour",
+            history_statement(
+                limit, domain="d0.example", since=now - timedelta(hours=1)
+            ),
+        )
+        explain(
+            connection,
+            "Rare domain, whole history",
+            history_statement(limit, domain=f"d{FIXTURE_DOMAINS - 1}.example"),
+        )
+        explain(
+            connection,
+            "One hour ten days ago",
+            history_statement(
+                limit,
+                since=now - timedelta(days=10, hours=1),
+                until=now - timedelta(days=10),
+            ),
+        )
+        explain(
+            connection,
+            "Count of a day, BRIN range scan",
+            text(
+                "SELECT count(*) FROM query_log "
+                "WHERE created_time >= now() - interval '2 days' "
+                "AND created_time < now() - interval '1 day'"
+            ),
+        )
+        connection.rollback()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,131 @@
+"""
+Benchmark of the history page read path.
+
+Fills temporary query_log, domain and resolution_address tables, shadowing the
+real ones for the benchmark session, then reads maximum-size history pages
+with history_statement and serializes them in two ways:
+    - models: the rows validated into QueryLogResponse models, then dumped to
+      JSON, as the endpoint used to do.
+    - direct: the rows serialized straight to JSON bytes, as the endpoint does
+      now.
+
+Both produce the same bytes. The rows per second of each path are printed,
+for the query and serialization together and for the serialization alone.
+
+Usage:
+    PYTHONPATH=src python benchmarks/history_serialization.py [pages]
+
+The POSTGRES_* environment variables select the database, as for the app.
+"""
+
+import asyncio
+import sys
+from time import perf_counter
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import async_engine
+from routers.history import (
+    HISTORY_MAX_PAGE_SIZE,
+    QueryLogResponse,
+    history_statement,
+    serialize_history,
+)
+
+FIXTURE_ROWS = 100000
+HISTORY_PAGE = TypeAdapter(List[QueryLogResponse])
+
+
+async def populate(connection):
+    """Creates and fills the temporary query_log, domains and addresses."""
+    for table in ("query_log", "domain", "resolution_address"):
+        await connection.execute(
+            text(
+                f"CREATE TEMP TABLE {table} "
+                f"(LIKE public.{table} INCLUDING ALL) ON COMMIT PRESERVE ROWS"
+            )
+        )
+    await connection.execute(
+        text(
+            """
+            INSERT INTO domain ("domainID", name, "resolutionID")
+            SELECT g, 'd' || g || '.example', g FROM generate_series(0, 999) AS g
+            """
+        )
+    )
+    await connection.execute(
+        text(
+            """
+            INSERT INTO resolution_address ("resolutionID", address)
+            SELECT g, '93.184.216.34' FROM generate_series(0, 999) AS g
+            """
+        )
+    )
+    await connection.execute(
+        text(
+            """
+            INSERT INTO query_log
+                ("queryID", "domainID", "resolutionID", created_time)
+            SELECT g, g % 1000, g % 1000,
+                   now() - make_interval(secs => :rows - g)
+            FROM generate_series(1, :rows) AS g
+            """
+        ),
+        {"rows": FIXTURE_ROWS},
+    )
+    for table in ("query_log", "domain", "resolution_address"):
+        await connection.execute(text(f"ANALYZE {table}"))
+
+
+async def model_page(session: AsyncSession, limit: int) -> bytes:
+    """Reads a page and serializes it through a model per row."""
+    rows = (await session.execute(history_statement(limit))).all()
+    return HISTORY_PAGE.dump_json(
+        HISTORY_PAGE.validate_python(rows, from_attributes=True)
+    )
+
+
+async def direct_page(session: AsyncSession, limit: int) -> bytes:
+    """Reads and serializes a page from projected rows."""
+    rows = (await session.execute(history_statement(limit))).all()
+    return serialize_history(rows)
+
+
+def report(title: str, rows: int, elapsed: float):
+    """Prints the throughput of a run."""
+    print(f"{title:<28} {rows / elapsed:>12,.0f} rows/s")
+
+
+async def main(pages: int = 200):
+    limit = HISTORY_MAX_PAGE_SIZE
+    async with async_engine.connect() as connection:
+        await populate(connection)
+        session = AsyncSession(bind=connection)
+        assert await model_page(session, limit) == await direct_page(session, limit)
+
+        for title, read_page in (("models", model_page), ("direct", direct_page)):
+            start = perf_counter()
+            for _ in range(pages):
+                await read_page(session, limit)
+            report(f"{title}: query + serialize", pages * limit, perf_counter() - start)
+
+        rows = (await session.execute(history_statement(limit))).all()
+        start = perf_counter()
+        for _ in range(pages):
+            HISTORY_PAGE.dump_json(
+                HISTORY_PAGE.validate_python(rows, from_attributes=True)
+            )
+        report("models: serialize only", pages * limit, perf_counter() - start)
+        start = perf_counter()
+        for _ in range(pages):
+            serialize_history(rows)
+        report("direct: serialize only", pages * limit, perf_counter() - start)
+        await connection.rollback()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:2])))
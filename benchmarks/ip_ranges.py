@@ -0,0 +1,67 @@
+"""
+Benchmark of the CIDR range index.
+
+Builds an index from random customer lists on top of the built-in ranges and
+measures the build time and the classification throughput, compared with a
+linear scan of the networks on a small sample.
+
+Usage:
+    PYTHONPATH=src python benchmarks/ip_ranges.py [networks] [lookups]
+"""
+
+import ipaddress
+import random
+import sys
+from time import perf_counter
+
+from helpers.ip.ranges import RangeIndex, builtin_networks
+
+
+def random_networks(count: int, rng: random.Random):
+    """Returns `count` random IPv4 networks split between two lists."""
+    networks = []
+    for i in range(count):
+        prefix = rng.randint(12, 32)
+        address = ipaddress.IPv4Address(rng.getrandbits(32))
+        network = ipaddress.ip_network(f"{address}/{prefix}", strict=False)
+        networks.append((network, "allow" if i % 2 else "deny"))
+    return networks
+
+
+def main(count: int = 300000, lookups: int = 1000000):
+    rng = random.Random(0)
+    networks = builtin_networks() + random_networks(count, rng)
+    addresses = [
+        str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(lookups)
+    ]
+
+    start = perf_counter()
+    index = RangeIndex(networks)
+    build = perf_counter() - start
+    print(
+        f"build: {len(networks)} networks -> {index.segments()} segments "
+        f"in {build:.2f}s"
+    )
+
+    start = perf_counter()
+    for address in addresses:
+        index.classify(address)
+    elapsed = perf_counter() - start
+    print(
+        f"classify: {lookups} addresses in {elapsed:.2f}s "
+        f"({lookups / elapsed:,.0f}/s, {elapsed / lookups * 1e6:.2f}us each)"
+    )
+
+    sample = [ipaddress.IPv4Address(address) for address in addresses[:20]]
+    start = perf_counter()
+    for address in sample:
+        [label for network, label in networks if address in network]
+    elapsed = perf_counter() - start
+    print(
+        f"linear scan: {len(sample)} addresses in {elapsed:.2f}s "
+        f"({elapsed / len(sample) * 1e6:,.0f}us each)"
+    )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,57 @@
+"""add query stats rollups
+
+Revision ID: 5d2b8f1a9c47
+Revises: e4a7c1d9b305
+Create Date: 2026-10-18 19:02:11.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2b8f1a9c47'
+down_revision: Union[str, None] = 'e4a7c1d9b305'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('query_stats_minute',
+    sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('queries', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket')
+    )
+    op.create_table('domain_stats_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('domain', sa.String(), nullable=False),
+    sa.Column('queries', sa.BigInteger(), nullable=False),
+    sa.Column('last_seen', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'domain')
+    )
+    # Count the queries logged so far, the writer keeps the counts up to date
+    # from there
+    op.execute(
+        """
+        INSERT INTO query_stats_minute (bucket, queries)
+        SELECT date_trunc('minute', created_time), count(*)
+        FROM query_log
+        GROUP BY 1
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO domain_stats_daily (day, domain, queries, last_seen)
+        SELECT (created_time AT TIME ZONE 'UTC')::date, domain, count(*),
+               max(created_time)
+        FROM query_log
+        GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('domain_stats_daily')
+    op.drop_table('query_stats_minute')
@@ -0,0 +1,40 @@
+"""add query_log keyset index
+
+Revision ID: 7c3f9a2e4b18
+Revises: d45e71dabb1c
+Create Date: 2026-10-18 16:20:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3f9a2e4b18'
+down_revision: Union[str, None] = 'd45e71dabb1c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so a large query_log keeps taking inserts meanwhile,
+    # which cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_query_log_created_time_queryID',
+            'query_log',
+            ['created_time', 'queryID'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_query_log_created_time_queryID',
+            table_name='query_log',
+            postgresql_concurrently=True,
+        )
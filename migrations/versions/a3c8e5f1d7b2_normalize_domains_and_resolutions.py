@@ -0,0 +1,177 @@
+"""normalize domains and resolutions
+
+Revision ID: a3c8e5f1d7b2
+Revises: 5d2b8f1a9c47
+Create Date: 2026-10-18 21:14:52.906118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c8e5f1d7b2'
+down_revision: Union[str, None] = '5d2b8f1a9c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('domain',
+    sa.Column('domainID', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('resolutionID', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('domainID'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('resolution',
+    sa.Column('resolutionID', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('domainID', sa.Integer(), nullable=False),
+    sa.Column('first_seen', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('last_seen', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['domainID'], ['domain.domainID'], ),
+    sa.PrimaryKeyConstraint('resolutionID')
+    )
+    op.create_index('ix_resolution_domainID_first_seen', 'resolution', ['domainID', 'first_seen'], unique=False)
+    op.create_table('resolution_address',
+    sa.Column('resolutionID', sa.Integer(), nullable=False),
+    sa.Column('address', postgresql.INET(), nullable=False),
+    sa.ForeignKeyConstraint(['resolutionID'], ['resolution.resolutionID'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('resolutionID', 'address')
+    )
+    op.create_index('ix_resolution_address_address', 'resolution_address', ['address'], unique=False, postgresql_using='gist', postgresql_ops={'address': 'inet_ops'})
+
+    op.add_column('query_log', sa.Column('domainID', sa.Integer(), nullable=True))
+    op.add_column('query_log', sa.Column('resolutionID', sa.Integer(), nullable=True))
+
+    # Backfill: intern the domains, then group the successive lookups of each
+    # domain answered with the same addresses into one resolution. The
+    # addresses were stored as the text of a list, in JSON, Python or Postgres
+    # array syntax, and what does not parse as an address is left out.
+    op.execute(
+        """
+        CREATE FUNCTION pg_temp.try_inet(value text) RETURNS inet
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        BEGIN
+            RETURN value::inet;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END $$
+        """
+    )
+    # Names are folded like db.resolutions.domain_key, so the lookups of a
+    # domain in different cases share it
+    op.execute("INSERT INTO domain (name) SELECT DISTINCT lower(rtrim(domain, '.')) FROM query_log ORDER BY 1")
+    op.execute(
+        """
+        CREATE TEMP TABLE backfill_lookup ON COMMIT DROP AS
+        WITH lookup AS (
+            SELECT q."queryID", q.created_time, d."domainID",
+                   ARRAY(
+                       SELECT DISTINCT address
+                       FROM (
+                           SELECT pg_temp.try_inet(btrim(token, ' ''"')) AS address
+                           FROM regexp_split_to_table(
+                               btrim(q.client_ip, ' {}[]'), ','
+                           ) AS token
+                       ) AS parsed
+                       WHERE address IS NOT NULL
+                       ORDER BY address
+                   ) AS addresses
+            FROM query_log q JOIN domain d ON d.name = lower(rtrim(q.domain, '.'))
+        ), changes AS (
+            SELECT *,
+                   CASE WHEN addresses = lag(addresses) OVER (
+                       PARTITION BY "domainID" ORDER BY created_time, "queryID"
+                   ) THEN 0 ELSE 1 END AS changed
+            FROM lookup
+        )
+        SELECT "queryID", created_time, "domainID", addresses,
+               sum(changed) OVER (
+                   PARTITION BY "domainID" ORDER BY created_time, "queryID"
+               ) AS run
+        FROM changes
+        """
+    )
+    op.execute(
+        """
+        CREATE TEMP TABLE backfill_run ON COMMIT DROP AS
+        SELECT nextval('"resolution_resolutionID_seq"') AS "resolutionID",
+               "domainID", run, min(addresses) AS addresses,
+               min(created_time) AS first_seen, max(created_time) AS last_seen
+        FROM backfill_lookup
+        GROUP BY "domainID", run
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO resolution ("resolutionID", "domainID", first_seen, last_seen)
+        SELECT "resolutionID", "domainID", first_seen, last_seen FROM backfill_run
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO resolution_address ("resolutionID", address)
+        SELECT "resolutionID", unnest(addresses) FROM backfill_run
+        """
+    )
+    op.execute(
+        """
+        UPDATE domain d SET "resolutionID" = latest."resolutionID"
+        FROM (
+            SELECT DISTINCT ON ("domainID") "domainID", "resolutionID"
+            FROM backfill_run
+            ORDER BY "domainID", run DESC
+        ) AS latest
+        WHERE latest."domainID" = d."domainID"
+        """
+    )
+    op.execute(
+        """
+        UPDATE query_log q
+        SET "domainID" = l."domainID", "resolutionID" = r."resolutionID"
+        FROM backfill_lookup l JOIN backfill_run r USING ("domainID", run)
+        WHERE q."queryID" = l."queryID" AND q.created_time = l.created_time
+        """
+    )
+
+    op.alter_column('query_log', 'domainID', nullable=False)
+    op.drop_index('ix_query_log_domain_created_time', table_name='query_log')
+    op.drop_column('query_log', 'client_ip')
+    op.drop_column('query_log', 'domain')
+    op.create_index('ix_query_log_domainID_created_time', 'query_log', ['domainID', 'created_time', 'queryID'], unique=False)
+    op.create_foreign_key('query_log_domainID_fkey', 'query_log', 'domain', ['domainID'], ['domainID'])
+    op.create_foreign_key('query_log_resolutionID_fkey', 'query_log', 'resolution', ['resolutionID'], ['resolutionID'])
+
+
+def downgrade() -> None:
+    op.add_column('query_log', sa.Column('domain', sa.VARCHAR(), nullable=True))
+    op.add_column('query_log', sa.Column('client_ip', sa.VARCHAR(), nullable=True))
+    op.execute(
+        """
+        UPDATE query_log q
+        SET domain = d.name,
+            client_ip = COALESCE((
+                SELECT array_agg(host(a.address) ORDER BY a.address)::text
+                FROM resolution_address a
+                WHERE a."resolutionID" = q."resolutionID"
+            ), '{}')
+        FROM domain d
+        WHERE d."domainID" = q."domainID"
+        """
+    )
+    op.alter_column('query_log', 'domain', nullable=False)
+    op.drop_constraint('query_log_resolutionID_fkey', 'query_log', type_='foreignkey')
+    op.drop_constraint('query_log_domainID_fkey', 'query_log', type_='foreignkey')
+    op.drop_index('ix_query_log_domainID_created_time', table_name='query_log')
+    op.drop_column('query_log', 'resolutionID')
+    op.drop_column('query_log', 'domainID')
+    op.create_index('ix_query_log_domain_created_time', 'query_log', ['domain', 'created_time', 'queryID'], unique=False)
+    op.drop_index('ix_resolution_address_address', table_name='resolution_address', postgresql_using='gist')
+    op.drop_table('resolution_address')
+    op.drop_index('ix_resolution_domainID_first_seen', table_name='resolution')
+    op.drop_table('resolution')
+    op.drop_table('domain')
@@ -0,0 +1,58 @@
+"""add query_log filter indexes
+
+Revision ID: b81d5e0f6c42
+Revises: 7c3f9a2e4b18
+Create Date: 2026-10-18 17:02:13.904512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d5e0f6c42'
+down_revision: Union[str, None] = '7c3f9a2e4b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # B-tree led by domain, also ordered like the history pages so the
+        # newest entries of a domain are read straight from the index
+        op.create_index(
+            'ix_query_log_domain_created_time',
+            'query_log',
+            ['domain', 'created_time', 'queryID'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        # Rows are inserted in time order, a BRIN index covers time ranges in
+        # a few pages. Ranges filled after the build are only summarized by
+        # vacuum unless autosummarize is on, and unsummarized ranges always
+        # have to be scanned
+        op.create_index(
+            'ix_query_log_created_time_brin',
+            'query_log',
+            ['created_time'],
+            unique=False,
+            postgresql_using='brin',
+            postgresql_with={'autosummarize': 'on'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_query_log_created_time_brin',
+            table_name='query_log',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_query_log_domain_created_time',
+            table_name='query_log',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,40 @@
+"""count resolution lookups
+
+Revision ID: c7d2f4a8e6b1
+Revises: a3c8e5f1d7b2
+Create Date: 2026-10-18 22:03:37.512840
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2f4a8e6b1'
+down_revision: Union[str, None] = 'a3c8e5f1d7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('resolution', sa.Column('lookups', sa.BigInteger(), server_default='0', nullable=False))
+    # Count the lookups logged so far, the writer counts them from there
+    op.execute(
+        """
+        UPDATE resolution r SET lookups = counted.lookups
+        FROM (
+            SELECT "resolutionID", count(*) AS lookups
+            FROM query_log
+            WHERE "resolutionID" IS NOT NULL
+            GROUP BY 1
+        ) AS counted
+        WHERE counted."resolutionID" = r."resolutionID"
+        """
+    )
+    op.alter_column('resolution', 'lookups', server_default=None)
+
+
+def downgrade() -> None:
+    op.drop_column('resolution', 'lookups')
@@ -0,0 +1,125 @@
+"""partition query_log by created_time
+
+Revision ID: e4a7c1d9b305
+Revises: b81d5e0f6c42
+Create Date: 2026-10-18 17:48:26.731044
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c1d9b305'
+down_revision: Union[str, None] = 'b81d5e0f6c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ('ix_query_log_queryID', '("queryID")'),
+    ('ix_query_log_created_time_queryID', '(created_time, "queryID")'),
+    ('ix_query_log_domain_created_time', '(domain, created_time, "queryID")'),
+    (
+        'ix_query_log_created_time_brin',
+        'USING brin (created_time) WITH (autosummarize = on)',
+    ),
+)
+
+
+def upgrade() -> None:
+    # Keep the current table aside, its indexes free their names for the
+    # partitioned table
+    op.execute('ALTER TABLE query_log RENAME TO query_log_legacy')
+    op.execute(
+        'ALTER TABLE query_log_legacy '
+        'RENAME CONSTRAINT query_log_pkey TO query_log_legacy_pkey'
+    )
+    for name, _ in INDEXES:
+        legacy = name.replace('query_log', 'query_log_legacy', 1)
+        op.execute(f'ALTER INDEX "{name}" RENAME TO "{legacy}"')
+
+    # The partition key has to be part of the primary key
+    op.execute(
+        """
+        CREATE TABLE query_log (
+            "queryID" integer NOT NULL
+                DEFAULT nextval('"query_log_queryID_seq"'::regclass),
+            domain varchar NOT NULL,
+            client_ip varchar,
+            created_time timestamp with time zone NOT NULL DEFAULT now(),
+            CONSTRAINT query_log_pkey PRIMARY KEY ("queryID", created_time)
+        ) PARTITION BY RANGE (created_time)
+        """
+    )
+    # The IDs keep going on, and the sequence must outlive the legacy table
+    op.execute('ALTER SEQUENCE "query_log_queryID_seq" OWNED BY query_log."queryID"')
+    for name, definition in INDEXES:
+        op.execute(f'CREATE INDEX "{name}" ON query_log {definition}')
+    # Catches rows outside of the partitions created by the maintenance task
+    op.execute('CREATE TABLE query_log_default PARTITION OF query_log DEFAULT')
+
+    # The existing rows become a single partition ending at the next UTC
+    # midnight, dropped whole once they are all past the retention. A valid
+    # check constraint lets SET NOT NULL and ATTACH skip scanning the table,
+    # and the indexes matching those of the parent are attached as they are.
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            boundary timestamptz := (
+                date_trunc('day', now() AT TIME ZONE 'UTC') + interval '1 day'
+            ) AT TIME ZONE 'UTC';
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM query_log_legacy) THEN
+                DROP TABLE query_log_legacy;
+                RETURN;
+            END IF;
+            UPDATE query_log_legacy SET created_time = now()
+            WHERE created_time IS NULL;
+            EXECUTE format(
+                'ALTER TABLE query_log_legacy ADD CONSTRAINT query_log_legacy_bound '
+                'CHECK (created_time IS NOT NULL AND created_time < %L)',
+                boundary
+            );
+            ALTER TABLE query_log_legacy ALTER COLUMN created_time SET NOT NULL;
+            -- Replaced by the primary key of the parent when attached
+            ALTER TABLE query_log_legacy DROP CONSTRAINT query_log_legacy_pkey;
+            EXECUTE format(
+                'ALTER TABLE query_log ATTACH PARTITION query_log_legacy '
+                'FOR VALUES FROM (MINVALUE) TO (%L)',
+                boundary
+            );
+            ALTER TABLE query_log_legacy DROP CONSTRAINT query_log_legacy_bound;
+        END
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE query_log_unpartitioned (
+            "queryID" integer NOT NULL
+                DEFAULT nextval('"query_log_queryID_seq"'::regclass),
+            domain varchar NOT NULL,
+            client_ip varchar,
+            created_time timestamp with time zone DEFAULT now()
+        )
+        """
+    )
+    op.execute('INSERT INTO query_log_unpartitioned SELECT * FROM query_log')
+    op.execute(
+        'ALTER SEQUENCE "query_log_queryID_seq" '
+        'OWNED BY query_log_unpartitioned."queryID"'
+    )
+    op.execute('DROP TABLE query_log')
+    op.execute('ALTER TABLE query_log_unpartitioned RENAME TO query_log')
+    op.execute(
+        'ALTER TABLE query_log '
+        'ADD CONSTRAINT query_log_pkey PRIMARY KEY ("queryID")'
+    )
+    for name, definition in INDEXES:
+        op.execute(f'CREATE INDEX "{name}" ON query_log {definition}')
@@ -4,20 +4,48 @@ This module initializes the database connection using SQLAlchemy, sets up the
 engine, session maker, and declarative base. It provides helper functions to
 obtain a database session and to check the database connection.
 
+Endpoints use `AsyncSession`s over the asyncpg driver, so their queries run
+on the event loop instead of holding a threadpool thread each. The sync engine
+remains for the background jobs running in the threadpool, such as the query
+log writer and the partition maintenance.
+
+Read-only endpoints take their session from `get_read_db`, bound to one of the
+read replicas listed in DATABASE_REPLICA_URLS when one is healthy, and to the
+primary otherwise (see `db.replicas`). Everything else goes to the primary
+through `get_db`.
+
+All the engines size and instrument their connection pools with `db.pool`, and
+`warm_up_pools` opens their connections before the app serves. The statements
+they run are timed, and the slow ones logged, by `db.statements`.
+
 Attributes:
     logger (Logger): The logger instance for logging information.
     DATABASE_URL (str): The database URL fetched from environment variables.
-    engine (Engine): The SQLAlchemy engine connected to the database.
+    engine (Engine): The SQLAlchemy engine connected to the database, its pool
+        labelled "primary-sync".
+    async_engine (AsyncEngine): The asyncpg engine connected to the database,
+        its pool labelled "primary".
+    DATABASE_REPLICA_URLS (List[str]): The URLs of the read replicas, from the
+        comma-separated environment variable. Empty by default.
+    replicas (ReplicaSet): The read replicas, each with its own async engine,
+        its pool labelled like the replica.
     SessionLocal (sessionmaker): The session maker for creating database sessions.
+    AsyncSessionLocal (async_sessionmaker): The session maker for creating
+        async database sessions.
     Base (declarative_base): The declarative base class for ORM models.
 """
 
+import asyncio
 import os
 
 from fastapi import HTTPException
-from sqlalchemy import create_engine, text
+from sqlalchemy import URL, create_engine, make_url, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from db.pool import instrument, pool_options, warm_up
+from db.replicas import ReplicaSet, replica_label
+from db.statements import trace_statements
 from helpers.log.logger import init_log
 
 # Initialize loggers
@@ -32,29 +60,110 @@ POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 DATABASE_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"  # noqa: E501  # pylint: disable=C0301
 # SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+engine = trace_statements(
+    instrument(create_engine(DATABASE_URL, **pool_options("primary-sync")))
+)
+
+
+def async_url(url: str) -> URL:
+    """Returns a database URL with its driver replaced by asyncpg."""
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+# Async engine of the endpoints
+async_engine = trace_statements(
+    instrument(
+        create_async_engine(
+            async_url(DATABASE_URL), **pool_options("primary", asynchronous=True)
+        )
+    )
+)
+
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+# Read replicas, pre-ping drops the connections of a replica that went away and
+# the connect timeout keeps an unreachable one from stalling the health checks
+replicas = ReplicaSet(
+    async_engine,
+    [
+        trace_statements(
+            instrument(
+                create_async_engine(
+                    async_url(url),
+                    connect_args={"timeout": 2},
+                    **pool_options(
+                        replica_label(async_url(url)),
+                        asynchronous=True,
+                        pool_pre_ping=True,
+                    ),
+                )
+            )
+        )
+        for url in DATABASE_REPLICA_URLS
+    ],
+)
 
 # SessionLocal class for managing sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Loaded attributes stay readable after commit, nothing is lazily reloaded
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
 
 # Base class for creating models
 Base = declarative_base()
 
 
 # Dependency to get DB session
-def get_db():
-    """Provide a database session.
+async def get_db():
+    """Provide an async database session.
 
-    This function yields a database session
+    This function yields a database session on the primary
 
     Yields:
-        SessionLocal: A database session.
+        AsyncSession: A database session.
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+# Dependency to get a read-only DB session
+async def get_read_db():
+    """Provide an async database session for read-only queries.
+
+    The session is bound to a healthy read replica, or to the primary when no
+    replica is usable, so it must not be used to write.
+
+    Yields:
+        AsyncSession: A database session.
+    """
+    async with AsyncSessionLocal(bind=replicas.read_engine()) as db:
+        yield db
+
+
+async def warm_up_pools():
+    """Opens the connections of the pools of the endpoints and background jobs.
+
+    The replicas are warmed up once checked, only the healthy ones are used.
+    """
+    await asyncio.gather(
+        warm_up(async_engine),
+        warm_up(engine),
+        *(warm_up(replica) for replica in replicas.healthy()),
+    )
+
+
+async def dispose_engines():
+    """Closes the pooled connections of the async engines.
+
+    Connections belong to the event loop that opened them, so they must be
+    closed before the loop ends.
+    """
+    await replicas.dispose()
+    await async_engine.dispose()
 
 
 def check_db_connection():
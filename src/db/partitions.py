@@ -0,0 +1,347 @@
+"""Maintenance of the `query_log` range partitions.
+
+`query_log` is partitioned by range of `created_time`, one partition per
+period of QUERY_LOG_PARTITION_DAYS days aligned on the Unix epoch in UTC, named
+after the day it starts (`query_log_p20261018`). A default partition catches
+rows outside of every period, and the rows logged before partitioning make up
+a single `query_log_legacy` partition.
+
+A background task periodically:
+    - creates the partitions of the current period and of the next
+      QUERY_LOG_PARTITIONS_AHEAD ones, moving their rows out of the default
+      partition if some landed there,
+    - detaches and drops the partitions whose whole range is older than
+      QUERY_LOG_RETENTION_DAYS, so retention costs a catalog change instead of
+      a bulk DELETE and the vacuuming after it.
+
+Every pass runs in one transaction holding an advisory lock, so several app
+instances can run the task against the same database.
+
+Environment Variables:
+    QUERY_LOG_PARTITION_DAYS (int): Length of a partition in days. Defaults to 1.
+    QUERY_LOG_PARTITIONS_AHEAD (int): Number of future partitions kept ready.
+        Defaults to 3.
+    QUERY_LOG_RETENTION_DAYS (int): Age in days after which partitions are
+        dropped, 0 keeps them forever. Defaults to 0.
+    QUERY_LOG_MAINTENANCE_INTERVAL (float): Seconds between maintenance passes.
+        Defaults to 3600.
+
+Classes:
+    Partition: A partition of `query_log` and its range.
+    PartitionMaintainer: Background task creating and dropping partitions.
+
+Functions:
+    period_start: Returns the start of the partition period containing a time.
+    partition_name: Returns the name of the partition starting at a time.
+    plan_partitions: Returns the partitions to create and to drop.
+    list_partitions: Returns the range partitions of `query_log`.
+    maintain_partitions: Runs one maintenance pass.
+
+Metrics:
+    QUERY_LOG_PARTITIONS: A gauge of the number of `query_log` partitions.
+    QUERY_LOG_PARTITIONS_CREATED: A counter of partitions created.
+    QUERY_LOG_PARTITIONS_DROPPED: A counter of partitions dropped.
+"""
+
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+from sqlalchemy import text
+
+from db.database import engine
+from helpers.log.logger import init_log
+
+# Initialize loggers
+logger = init_log()
+
+QUERY_LOG_PARTITION_DAYS = int(os.getenv("QUERY_LOG_PARTITION_DAYS", "1"))
+QUERY_LOG_PARTITIONS_AHEAD = int(os.getenv("QUERY_LOG_PARTITIONS_AHEAD", "3"))
+QUERY_LOG_RETENTION_DAYS = int(os.getenv("QUERY_LOG_RETENTION_DAYS", "0"))
+QUERY_LOG_MAINTENANCE_INTERVAL = float(
+    os.getenv("QUERY_LOG_MAINTENANCE_INTERVAL", "3600")
+)
+
+PARENT_TABLE = "query_log"
+DEFAULT_PARTITION = "query_log_default"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Key of the advisory lock serializing the maintenance passes
+MAINTENANCE_LOCK = 0x71756572
+
+# Define Prometheus metrics
+QUERY_LOG_PARTITIONS = Gauge(
+    "query_log_partitions", "Number of range partitions of the query log"
+)
+QUERY_LOG_PARTITIONS_CREATED = Counter(
+    "query_log_partitions_created_total", "Total number of query log partitions created"
+)
+QUERY_LOG_PARTITIONS_DROPPED = Counter(
+    "query_log_partitions_dropped_total", "Total number of query log partitions dropped"
+)
+
+# Bound of a range partition as printed by pg_get_expr
+_BOUND = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+
+
+class Partition(NamedTuple):
+    """
+    A range partition of `query_log`.
+
+    Attributes:
+        name (str): The name of the partition table.
+        lower (Optional[datetime]): The inclusive lower bound, None for MINVALUE.
+        upper (Optional[datetime]): The exclusive upper bound, None for MAXVALUE.
+    """
+
+    name: str
+    lower: Optional[datetime]
+    upper: Optional[datetime]
+
+
+def period_start(moment: datetime, days: int = QUERY_LOG_PARTITION_DAYS) -> datetime:
+    """
+    Returns the start of the partition period containing a time.
+
+    Args:
+        moment (datetime): An aware datetime.
+        days (int): The length of a period in days.
+
+    Returns:
+        datetime: The UTC midnight starting the period.
+    """
+    elapsed = (moment - EPOCH).days
+    return EPOCH + timedelta(days=elapsed - elapsed % days)
+
+
+def partition_name(start: datetime) -> str:
+    """Returns the name of the partition starting at `start`."""
+    return f"{PARENT_TABLE}_p{start:%Y%m%d}"
+
+
+def _uncovered(
+    start: datetime, end: datetime, partitions: List[Partition]
+) -> List[Tuple[datetime, datetime]]:
+    """Returns the parts of [start, end) outside of every partition."""
+    pieces = [(start, end)]
+    for partition in partitions:
+        lower = partition.lower or datetime.min.replace(tzinfo=timezone.utc)
+        upper = partition.upper or datetime.max.replace(tzinfo=timezone.utc)
+        remaining = []
+        for low, high in pieces:
+            if upper <= low or lower >= high:
+                remaining.append((low, high))
+                continue
+            if low < lower:
+                remaining.append((low, lower))
+            if upper < high:
+                remaining.append((upper, high))
+        pieces = remaining
+    return pieces
+
+
+def plan_partitions(
+    partitions: List[Partition],
+    now: datetime,
+    days: int = QUERY_LOG_PARTITION_DAYS,
+    ahead: int = QUERY_LOG_PARTITIONS_AHEAD,
+    retention_days: int = QUERY_LOG_RETENTION_DAYS,
+) -> Tuple[List[Tuple[datetime, datetime]], List[str]]:
+    """
+    Returns the partitions to create and to drop.
+
+    The ranges to create are the parts of the current and next `ahead` periods
+    not covered by an existing partition, which only differ from whole periods
+    when the period length was changed.
+
+    Args:
+        partitions (List[Partition]): The existing range partitions.
+        now (datetime): The current time.
+        days (int): The length of a partition in days.
+        ahead (int): The number of future partitions to keep ready.
+        retention_days (int): Age in days after which partitions are dropped,
+            0 keeps them forever.
+
+    Returns:
+        Tuple[List[Tuple[datetime, datetime]], List[str]]: The (lower, upper)
+        bounds of the partitions to create, and the names of the partitions to
+        drop.
+    """
+    create = []
+    start = period_start(now, days)
+    for _ in range(ahead + 1):
+        end = start + timedelta(days=days)
+        create.extend(_uncovered(start, end, partitions))
+        start = end
+    drop = []
+    if retention_days > 0:
+        cutoff = now - timedelta(days=retention_days)
+        drop = [
+            partition.name
+            for partition in partitions
+            if partition.upper is not None and partition.upper <= cutoff
+        ]
+    return create, drop
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    """Parses a bound printed by pg_get_expr in the UTC time zone."""
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    # '2026-10-18 00:00:00+00'
+    return datetime.fromisoformat(value.strip("'") + ":00")
+
+
+def list_partitions(connection) -> List[Partition]:
+    """
+    Returns the range partitions of `query_log`, without the default one.
+
+    Args:
+        connection (Connection): A connection in a transaction, whose time zone
+            is set to UTC for the duration of the transaction.
+
+    Returns:
+        List[Partition]: The partitions, in no particular order.
+    """
+    connection.execute(text("SET LOCAL TimeZone = 'UTC'"))
+    rows = connection.execute(
+        text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"
+        ),
+        {"parent": PARENT_TABLE},
+    )
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND.fullmatch(bound)
+        if match is None:
+            continue
+        partitions.append(
+            Partition(name, _parse_bound(match[1]), _parse_bound(match[2]))
+        )
+    return partitions
+
+
+def create_partition(connection, lower: datetime, upper: datetime) -> str:
+    """
+    Creates the partition of `query_log` for [lower, upper).
+
+    The partition is created as a plain table, filled with the rows of its
+    range found in the default partition, then attached, which a default
+    partition holding rows of the range would otherwise prevent.
+
+    Args:
+        connection (Connection): A connection in a transaction.
+        lower (datetime): The inclusive lower bound.
+        upper (datetime): The exclusive upper bound.
+
+    Returns:
+        str: The name of the new partition.
+    """
+    name = partition_name(lower)
+    bounds = {"lower": lower, "upper": upper}
+    connection.execute(
+        text(
+            f"CREATE TABLE {name} "
+            f"(LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+    )
+    if connection.execute(
+        text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}
+    ).scalar():
+        connection.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                "WHERE created_time >= :lower AND created_time < :upper "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+            ),
+            bounds,
+        )
+    # Bounds are literals in DDL, formatted by the server in the UTC session
+    literals = connection.execute(
+        text("SELECT quote_literal(:lower), quote_literal(:upper)"), bounds
+    ).one()
+    connection.execute(
+        text(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ({literals[0]}) TO ({literals[1]})"
+        )
+    )
+    return name
+
+
+def drop_partition(connection, name: str):
+    """Detaches a partition of `query_log` and drops it."""
+    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    connection.execute(text(f"DROP TABLE {name}"))
+
+
+def maintain_partitions(
+    now: Optional[datetime] = None,
+    days: int = QUERY_LOG_PARTITION_DAYS,
+    ahead: int = QUERY_LOG_PARTITIONS_AHEAD,
+    retention_days: int = QUERY_LOG_RETENTION_DAYS,
+) -> Tuple[List[str], List[str]]:
+    """
+    Creates the missing partitions and drops the expired ones.
+
+    Nothing is done if another pass holds the maintenance lock.
+
+    Args:
+        now (Optional[datetime]): The current time, defaults to the clock.
+        days (int): The length of a partition in days.
+        ahead (int): The number of future partitions to keep ready.
+        retention_days (int): Age in days after which partitions are dropped,
+            0 keeps them forever.
+
+    Returns:
+        Tuple[List[str], List[str]]: The names of the created and of the
+        dropped partitions.
+    """
+    now = now or datetime.now(timezone.utc)
+    with engine.begin() as connection:
+        locked = connection.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK}
+        ).scalar()
+        if not locked:
+            return [], []
+        partitions = list_partitions(connection)
+        create, drop = plan_partitions(partitions, now, days, ahead, retention_days)
+        created = [create_partition(connection, *bounds) for bounds in create]
+        for name in drop:
+            drop_partition(connection, name)
+    QUERY_LOG_PARTITIONS.set(len(partitions) + len(created) - len(drop))
+    QUERY_LOG_PARTITIONS_CREATED.inc(len(created))
+    QUERY_LOG_PARTITIONS_DROPPED.inc(len(drop))
+    if created or drop:
+        logger.info(
+            f"Query log partitions created: {created or 'none'}, "
+            f"dropped: {drop or 'none'}"
+        )
+    return created, drop
+
+
+class PartitionMaintainer:
+    """
+    Background task keeping the `query_log` partitions up to date.
+
+    Attributes:
+        interval (float): Seconds between maintenance passes.
+    """
+
+    def __init__(self, interval: float = QUERY_LOG_MAINTENANCE_INTERVAL):
+        self.interval = interval
+
+    async def run(self):
+        """Runs a maintenance pass now, then every `interval` seconds."""
+        while True:
+            try:
+                await run_in_threadpool(maintain_partitions)
+            except Exception as e:
+                logger.error(f"Query log partition maintenance failed: {str(e)}")
+            await asyncio.sleep(self.interval)
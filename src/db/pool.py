@@ -0,0 +1,254 @@
+"""Configuration, telemetry and warm-up of the database connection pools.
+
+Every engine of the app gets its pool settings from `pool_options`, read from
+the environment so each deployment sizes its pools to its database, and its
+pool is instrumented by `instrument`:
+    - the checked-out, overflow and idle connections are exported as gauges,
+      read from the pool when metrics are collected;
+    - the time taken by each checkout is observed, once the time spent opening
+      a new connection for it is taken out, so it measures the wait for a free
+      connection, and the checkouts given up after the pool timeout are
+      counted;
+    - the time taken to open each connection, TCP, TLS and authentication
+      included, is observed.
+
+Pools open connections on demand, so `warm_up` opens the connections of a pool
+at startup, concurrently, and returns them to it, keeping those connect costs
+off the first requests.
+
+The pools are labelled with their logging name, which SQLAlchemy keeps when a
+disposed pool is recreated.
+
+Environment Variables:
+    DB_POOL_SIZE (int): Connections kept open by each pool. Defaults to 5.
+    DB_MAX_OVERFLOW (int): Connections opened above the pool size under load,
+        closed when returned. Defaults to 10.
+    DB_POOL_TIMEOUT (float): Seconds a checkout waits for a connection before
+        failing. Defaults to 30.
+    DB_POOL_RECYCLE (int): Seconds after which a connection is replaced on its
+        next checkout, -1 to keep connections open. Defaults to 1800.
+    DB_POOL_PRE_PING (bool): Whether connections are tested on checkout.
+        Defaults to false.
+    DB_POOL_WARMUP (int): Connections opened by each pool at startup, up to
+        the pool size, 0 to open them on demand. Defaults to DB_POOL_SIZE.
+
+Classes:
+    TimedQueuePool: Queue pool observing its checkout times.
+    TimedAsyncAdaptedQueuePool: Async queue pool observing its checkout times.
+
+Functions:
+    pool_options(label, asynchronous, **overrides): Returns the engine
+        arguments of a pool.
+    instrument(engine): Exports the telemetry of the pool of an engine.
+    warm_up(engine, size): Opens connections of the pool of an engine.
+
+Metrics:
+    DB_POOL_CHECKED_OUT: A gauge of the connections in use, by pool.
+    DB_POOL_OVERFLOW: A gauge of the connections open above the pool size.
+    DB_POOL_IDLE: A gauge of the open connections waiting in the pool.
+    DB_POOL_CHECKOUT_WAIT: A histogram of the wait for a free connection.
+    DB_POOL_CHECKOUT_TIMEOUTS: A counter of the checkouts that timed out.
+    DB_POOL_CONNECT_DURATION: A histogram of the time to open a connection.
+"""
+
+import asyncio
+import logging
+import os
+from time import perf_counter
+from typing import Union
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from helpers.log.logger import init_log
+
+# Initialize loggers
+logger = init_log()
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+
+# Define Prometheus metrics
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections checked out of each pool", ["pool"]
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open above the size of each pool", ["pool"]
+)
+DB_POOL_IDLE = Gauge("db_pool_idle", "Open connections waiting in each pool", ["pool"])
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time waited for a free connection of each pool",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Total number of checkouts given up after the pool timeout",
+    ["pool"],
+)
+DB_POOL_CONNECT_DURATION = Histogram(
+    "db_pool_connect_duration_seconds",
+    "Time to open a database connection, by pool",
+    ["pool"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+# Keys of the connection record info, the start and duration of the connect
+_CONNECT_START = "pool_connect_start"
+_CONNECT_DURATION = "pool_connect_duration"
+
+
+class _TimedCheckout:
+    """Pool mixin observing the wait of each checkout."""
+
+    def connect(self):
+        label = self._orig_logging_name
+        start = perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.labels(pool=label).inc()
+            raise
+        # Opening a connection is not waiting for one
+        opened = connection.info.pop(_CONNECT_DURATION, 0.0)
+        DB_POOL_CHECKOUT_WAIT.labels(pool=label).observe(
+            max(perf_counter() - start - opened, 0.0)
+        )
+        return connection
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    """`QueuePool` observing the wait of each checkout."""
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """`AsyncAdaptedQueuePool` observing the wait of each checkout."""
+
+
+# Pool loggers are named after the pool class, outside of the "sqlalchemy"
+# logger, so keep them at the level SQLAlchemy gives its own loggers
+for _pool_class in (TimedQueuePool, TimedAsyncAdaptedQueuePool):
+    logging.getLogger(f"{_pool_class.__module__}.{_pool_class.__name__}").setLevel(
+        logging.WARN
+    )
+
+
+def pool_options(label: str, asynchronous: bool = False, **overrides) -> dict:
+    """
+    Returns the engine arguments of a pool configured from the environment.
+
+    Args:
+        label (str): The label of the pool in the metrics.
+        asynchronous (bool): Whether the engine is an async engine.
+        **overrides: Engine arguments replacing the configured ones.
+
+    Returns:
+        dict: The keyword arguments of `create_engine` or `create_async_engine`.
+    """
+    options = {
+        "poolclass": TimedAsyncAdaptedQueuePool if asynchronous else TimedQueuePool,
+        "pool_logging_name": label,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    options.update(overrides)
+    return options
+
+
+def instrument(engine: Union[Engine, AsyncEngine]) -> Union[Engine, AsyncEngine]:
+    """
+    Exports the telemetry of the pool of an engine created with `pool_options`.
+
+    Args:
+        engine (Union[Engine, AsyncEngine]): The engine.
+
+    Returns:
+        Union[Engine, AsyncEngine]: The engine.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    label = sync_engine.pool._orig_logging_name
+
+    @event.listens_for(sync_engine, "do_connect")
+    def connect_started(dialect, connection_record, cargs, cparams):
+        connection_record.info[_CONNECT_START] = perf_counter()
+
+    @event.listens_for(sync_engine, "connect")
+    def connected(dbapi_connection, connection_record):
+        start = connection_record.info.pop(_CONNECT_START, None)
+        if start is not None:
+            duration = perf_counter() - start
+            connection_record.info[_CONNECT_DURATION] = duration
+            DB_POOL_CONNECT_DURATION.labels(pool=label).observe(duration)
+
+    # Read from the current pool, disposing an engine replaces it
+    DB_POOL_CHECKED_OUT.labels(pool=label).set_function(
+        lambda: sync_engine.pool.checkedout()
+    )
+    DB_POOL_OVERFLOW.labels(pool=label).set_function(
+        lambda: max(sync_engine.pool.overflow(), 0)
+    )
+    DB_POOL_IDLE.labels(pool=label).set_function(lambda: sync_engine.pool.checkedin())
+    return engine
+
+
+async def warm_up(
+    engine: Union[Engine, AsyncEngine], size: int = DB_POOL_WARMUP
+) -> int:
+    """
+    Opens connections of the pool of an engine, and returns them to the pool.
+
+    The connections are opened concurrently, those of a sync engine in the
+    threadpool. Failures are logged, the pool then opens the missing
+    connections on demand.
+
+    Args:
+        engine (Union[Engine, AsyncEngine]): The engine.
+        size (int): The number of connections, capped at the pool size.
+
+    Returns:
+        int: The number of connections opened.
+    """
+    pool = getattr(engine, "sync_engine", engine).pool
+    size = min(size, pool.size())
+    if size <= 0:
+        return 0
+    if isinstance(engine, AsyncEngine):
+
+        async def checkout():
+            return await engine.connect()
+
+        connections = await asyncio.gather(
+            *(checkout() for _ in range(size)), return_exceptions=True
+        )
+        opened = [c for c in connections if not isinstance(c, BaseException)]
+        for connection in opened:
+            await connection.close()
+    else:
+        connections = await asyncio.gather(
+            *(run_in_threadpool(engine.connect) for _ in range(size)),
+            return_exceptions=True,
+        )
+        opened = [c for c in connections if not isinstance(c, BaseException)]
+        await run_in_threadpool(lambda: [connection.close() for connection in opened])
+
+    failures = [c for c in connections if isinstance(c, BaseException)]
+    if failures:
+        logger.warning(
+            f"Pool {pool._orig_logging_name} warmed up with {len(opened)} of "
+            f"{size} connections: {failures[0]}"
+        )
+    else:
+        logger.info(f"Pool {pool._orig_logging_name} warmed up with {size} connections")
+    return len(opened)
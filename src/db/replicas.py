@@ -0,0 +1,232 @@
+"""Routing of read-only queries to streaming replicas.
+
+A `ReplicaSet` holds one async engine, with its own connection pool, per
+configured read replica, and picks the engine of each read-only session.
+Replicas are checked concurrently in the background: a replica is used only
+while it answers and its replication lag stays under the configured maximum,
+and reads go round-robin over the usable replicas. When none is usable, reads
+fall back to the primary, so replicas never make the app less available than
+the primary alone.
+
+The lag is the age of the last replayed transaction, or 0 when the replica has
+replayed everything it received while its WAL receiver is streaming and heard
+from the primary recently, so a replica of an idle primary is not seen as
+lagging. A replica whose receiver has disconnected also has replayed all it
+received, but it is no longer receiving anything, so it gets the age of its
+last replayed transaction, or is unusable when it never replayed one. Reading
+the receiver state takes the privileges of pg_read_all_stats (or pg_monitor);
+without them, an idle replica is seen as lagging. A server that is not in
+recovery, such as the primary itself, has no lag. A check taking longer than
+the check interval counts as a failure.
+
+Environment Variables:
+    DB_REPLICA_MAX_LAG (float): Largest lag in seconds of a replica used for
+        reads. Defaults to 5.
+    DB_REPLICA_CHECK_INTERVAL (float): Seconds between health checks.
+        Defaults to 5.
+    DB_REPLICA_RECEIVER_TIMEOUT (float): Longest silence in seconds of the
+        primary before the WAL receiver of a replica is not trusted to be up to
+        date. Defaults to 60.
+
+Classes:
+    ReplicaSet: Health-checked read replicas with fallback to the primary.
+
+Functions:
+    lag_of(state): Returns the replication lag of a server from its state.
+    replica_lag(engine): Measures the replication lag of a server.
+    replica_label(engine): Returns the metrics label of a server.
+
+Metrics:
+    DB_REPLICA_HEALTHY: A gauge of the state of each replica, 1 when usable.
+    DB_REPLICA_LAG: A gauge of the last measured lag of each replica.
+    DB_READS_ROUTED: A counter of read sessions, by target.
+"""
+
+import asyncio
+import itertools
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Union
+
+from prometheus_client import Counter, Gauge
+from sqlalchemy import URL, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from helpers.log.logger import init_log
+
+# Initialize loggers
+logger = init_log()
+
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+DB_REPLICA_RECEIVER_TIMEOUT = float(os.getenv("DB_REPLICA_RECEIVER_TIMEOUT", "60"))
+
+# Replication state of a server, the receiver columns are NULL on a primary
+LAG_QUERY = text(
+    """
+    SELECT pg_is_in_recovery() AS in_recovery,
+           pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() AS caught_up,
+           receiver.status AS receiver_status,
+           EXTRACT(EPOCH FROM now() - receiver.last_msg_receipt_time)
+               AS receipt_age,
+           EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+               AS replay_age
+    FROM (SELECT 1) AS server
+    LEFT JOIN pg_stat_wal_receiver AS receiver ON true
+    """
+)
+
+# Define Prometheus metrics
+DB_REPLICA_HEALTHY = Gauge(
+    "db_replica_healthy", "Whether each read replica is used, 1 or 0", ["replica"]
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Last measured replication lag of each replica",
+    ["replica"],
+)
+DB_READS_ROUTED = Counter(
+    "db_reads_routed_total", "Total number of read sessions, by target", ["target"]
+)
+
+
+def lag_of(state: Mapping[str, Any]) -> float:
+    """
+    Returns the replication lag of a server from its replication state.
+
+    Args:
+        state (Mapping[str, Any]): The row of `LAG_QUERY`.
+
+    Returns:
+        float: The lag in seconds, 0 for a server that is not a replica, and
+        infinite for a replica that is not streaming and never replayed a
+        transaction.
+    """
+    if not state["in_recovery"]:
+        return 0.0
+    receipt_age = state["receipt_age"]
+    heard = receipt_age is not None and receipt_age <= DB_REPLICA_RECEIVER_TIMEOUT
+    streaming = state["receiver_status"] == "streaming" and heard
+    if state["caught_up"] and streaming:
+        return 0.0
+    if state["replay_age"] is None:
+        return float("inf")
+    return max(float(state["replay_age"]), 0.0)
+
+
+async def replica_lag(engine: AsyncEngine) -> float:
+    """
+    Measures the replication lag of a server.
+
+    Args:
+        engine (AsyncEngine): The engine of the server.
+
+    Returns:
+        float: The lag in seconds, see `lag_of`.
+
+    Raises:
+        Exception: Any connection or query error.
+    """
+    async with engine.connect() as connection:
+        return lag_of((await connection.execute(LAG_QUERY)).mappings().one())
+
+
+def replica_label(engine: Union[AsyncEngine, URL]) -> str:
+    """Returns the host:port/database label of an engine or URL, no credentials."""
+    url = getattr(engine, "url", engine)
+    return f"{url.host}:{url.port or 5432}/{url.database}"
+
+
+class ReplicaSet:
+    """
+    Read replicas of the primary database, with health and lag checks.
+
+    Attributes:
+        primary (AsyncEngine): The engine of the primary, used for the reads
+            when no replica is usable.
+        replicas (List[AsyncEngine]): The engines of the replicas.
+        max_lag (float): Largest lag in seconds of a usable replica.
+        interval (float): Seconds between health checks, and longest check.
+        measure_lag (Callable[[AsyncEngine], Awaitable[float]]): Function
+            measuring the lag of a replica, raising if it cannot be reached.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[AsyncEngine],
+        max_lag: float = DB_REPLICA_MAX_LAG,
+        interval: float = DB_REPLICA_CHECK_INTERVAL,
+        measure_lag: Callable[[AsyncEngine], Awaitable[float]] = replica_lag,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.interval = interval
+        self.measure_lag = measure_lag
+        # Replicas are only used once a check has found them healthy
+        self._healthy: List[AsyncEngine] = []
+        self._turns = itertools.count()
+
+    def healthy(self) -> List[AsyncEngine]:
+        """Returns the replicas passing the last health check."""
+        return list(self._healthy)
+
+    async def _measure(self, replica: AsyncEngine) -> float:
+        """Measures the lag of a replica within the check interval."""
+        return await asyncio.wait_for(self.measure_lag(replica), self.interval)
+
+    async def check(self) -> Dict[str, bool]:
+        """
+        Checks every replica and updates the replicas used for reads.
+
+        Returns:
+            Dict[str, bool]: Whether each replica, by label, is usable.
+        """
+        lags = await asyncio.gather(
+            *(self._measure(replica) for replica in self.replicas),
+            return_exceptions=True,
+        )
+        healthy, states = [], {}
+        for replica, lag in zip(self.replicas, lags):
+            label = replica_label(replica)
+            if isinstance(lag, Exception):
+                logger.warning(f"Read replica {label} is unreachable: {lag!r}")
+                usable = False
+            else:
+                DB_REPLICA_LAG.labels(replica=label).set(lag)
+                usable = lag <= self.max_lag
+                if not usable:
+                    logger.warning(f"Read replica {label} lags by {lag:.1f}s")
+            if usable:
+                healthy.append(replica)
+            if usable != (replica in self._healthy):
+                logger.info(f"Read replica {label} {'in' if usable else 'out of'} use")
+            DB_REPLICA_HEALTHY.labels(replica=label).set(int(usable))
+            states[label] = usable
+        self._healthy = healthy
+        return states
+
+    def read_engine(self) -> AsyncEngine:
+        """Returns the engine of the next read session."""
+        healthy = self._healthy
+        if not healthy:
+            DB_READS_ROUTED.labels(target="primary").inc()
+            return self.primary
+        DB_READS_ROUTED.labels(target="replica").inc()
+        return healthy[next(self._turns) % len(healthy)]
+
+    async def watch(self):
+        """Checks the replicas every `interval` seconds."""
+        if not self.replicas:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Read replica check failed: {str(e)}")
+
+    async def dispose(self):
+        """Closes the pooled connections of the replicas."""
+        for replica in self.replicas:
+            await replica.dispose()
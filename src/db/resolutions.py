@@ -0,0 +1,265 @@
+"""Normalized storage of the logged domain resolutions.
+
+Query logs do not repeat the domain name and the resolved addresses of each
+lookup. Domain names are interned in the `domain` table, and successive lookups
+of a domain answered with the same address set share one `resolution` row,
+whose addresses are stored once as `inet` values in `resolution_address`. A
+query log row is then three integers and a timestamp.
+
+Each batch written by the query log writer is turned into query log rows by
+`record_resolutions`, in the transaction of the insert: unknown domains are
+added, lookups answered like the latest resolution of their domain extend it
+and are counted in it, and any other answer starts a new resolution, which
+becomes the latest one. Resolutions thus grow with the changes of the answers,
+not with the number of lookups.
+
+Domain names are compared like DNS does, whatever their case and trailing
+dot, so they are stored folded by `domain_key`, as the DNS cache keys them, and
+the lookups of `Example.com.` and `example.com` share their domain and
+resolutions.
+
+The domain rows of a batch are locked, in ID order, for the rest of the
+transaction, so concurrent writers extend the resolutions of a domain one after
+the other and cannot deadlock on them.
+
+Metrics:
+    RESOLUTIONS_STARTED: A counter of the resolutions recorded, one per change
+    of the answer of a domain.
+
+Functions:
+    domain_key: Folds a domain name to the name it is stored under.
+    address_set: Parses the resolved addresses of a lookup.
+    intern_domains: Returns the ID and latest resolution of domain names.
+    record_resolutions: Records the resolutions of a batch of lookups.
+"""
+
+import ipaddress
+from datetime import datetime, timezone
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from prometheus_client import Counter
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from models.resolution import Domain, Resolution, ResolutionAddress
+
+# Define Prometheus metrics
+RESOLUTIONS_STARTED = Counter(
+    "resolutions_started_total",
+    "Total number of resolutions recorded, one per change of a domain's answer",
+)
+
+Address = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+
+def domain_key(name: str) -> str:
+    """
+    Folds a domain name to the name it is stored under.
+
+    Args:
+        name (str): The domain name, as given by the client.
+
+    Returns:
+        str: The name in lowercase, without its trailing dot.
+    """
+    return name.rstrip(".").lower()
+
+
+def address_set(addresses: Optional[Iterable[str]]) -> FrozenSet[Address]:
+    """
+    Parses the resolved addresses of a lookup.
+
+    Args:
+        addresses (Optional[Iterable[str]]): The addresses, None or empty when
+            the lookup was not answered. Invalid addresses are left out.
+
+    Returns:
+        FrozenSet[Address]: The distinct addresses.
+    """
+    parsed = set()
+    for address in addresses or ():
+        try:
+            parsed.add(ipaddress.ip_address(str(address)))
+        except ValueError:
+            continue
+    return frozenset(parsed)
+
+
+def intern_domains(
+    connection, names: Iterable[str]
+) -> Dict[str, Tuple[int, Optional[int]]]:
+    """
+    Returns the ID and latest resolution of domain names, adding unknown ones.
+
+    The domain rows are locked until the end of the transaction.
+
+    Args:
+        connection (Connection): A connection in a transaction.
+        names (Iterable[str]): The domain names, in any case.
+
+    Returns:
+        Dict[str, Tuple[int, Optional[int]]]: The domain ID and latest
+        resolution ID of each name folded by `domain_key`, the resolution None
+        for new domains.
+    """
+    names = sorted({domain_key(name) for name in names})
+
+    def locked(wanted: List[str]) -> Dict[str, Tuple[int, Optional[int]]]:
+        statement = (
+            select(Domain.name, Domain.domainID, Domain.resolutionID)
+            .where(Domain.name.in_(wanted))
+            .order_by(Domain.domainID)
+            # Does not block the foreign key checks of other inserts
+            .with_for_update(key_share=True)
+        )
+        return {
+            name: (domain_id, resolution_id)
+            for name, domain_id, resolution_id in connection.execute(statement)
+        }
+
+    domains = locked(names)
+    missing = [name for name in names if name not in domains]
+    if missing:
+        # Only insert unknown names, conflicts would still use up IDs
+        connection.execute(
+            insert(Domain).on_conflict_do_nothing(index_elements=[Domain.name]),
+            [{"name": name} for name in missing],
+        )
+        domains.update(locked(missing))
+    return domains
+
+
+def _latest_addresses(
+    connection, resolution_ids: List[int]
+) -> Dict[int, FrozenSet[Address]]:
+    """Returns the address set of each of the given resolutions."""
+    addresses: Dict[int, set] = {
+        resolution_id: set() for resolution_id in resolution_ids
+    }
+    if resolution_ids:
+        statement = select(
+            ResolutionAddress.resolutionID, ResolutionAddress.address
+        ).where(ResolutionAddress.resolutionID.in_(resolution_ids))
+        for resolution_id, address in connection.execute(statement):
+            addresses[resolution_id].add(ipaddress.ip_address(str(address)))
+    return {
+        resolution_id: frozenset(answer) for resolution_id, answer in addresses.items()
+    }
+
+
+def record_resolutions(connection, rows: List[dict]) -> List[dict]:
+    """
+    Records the resolutions of a batch of lookups.
+
+    Lookups are taken in time order. A lookup answered with the address set of
+    the latest resolution of its domain extends that resolution and adds to
+    its lookup count, any other starts a new one.
+
+    Args:
+        connection (Connection): A connection in a transaction.
+        rows (List[dict]): The lookups, with their "domain", "client_ip" (the
+            resolved addresses) and "created_time". Rows without a creation
+            time are dated now.
+
+    Returns:
+        List[dict]: The query log rows of the lookups, in the order of `rows`,
+        keyed by column name.
+    """
+    if not rows:
+        return []
+    now = datetime.now(timezone.utc)
+    domains = intern_domains(connection, (row["domain"] for row in rows))
+    answers = _latest_addresses(
+        connection,
+        [resolution_id for _, resolution_id in domains.values() if resolution_id],
+    )
+
+    # The latest address set of each domain, with the ID of its resolution,
+    # or the resolution itself when the batch starts it
+    latest: Dict[int, Tuple[FrozenSet[Address], Union[int, dict]]] = {
+        domain_id: (answers[resolution_id], resolution_id)
+        for domain_id, resolution_id in domains.values()
+        if resolution_id
+    }
+    # Resolutions started by the batch, with their addresses
+    started: List[Tuple[dict, FrozenSet[Address]]] = []
+    # Time of the last lookup and number of lookups of the resolutions
+    # extended by the batch
+    extended: Dict[int, Tuple[datetime, int]] = {}
+    query_logs: List[tuple] = [()] * len(rows)
+    for i in sorted(range(len(rows)), key=lambda i: rows[i].get("created_time") or now):
+        created_time = rows[i].get("created_time") or now
+        domain_id = domains[domain_key(rows[i]["domain"])][0]
+        addresses = address_set(rows[i].get("client_ip"))
+        answer, resolution = latest.get(domain_id, (None, None))
+        if resolution is None or answer != addresses:
+            resolution = {
+                "domainID": domain_id,
+                "first_seen": created_time,
+                "last_seen": created_time,
+                "lookups": 1,
+            }
+            started.append((resolution, addresses))
+            latest[domain_id] = (addresses, resolution)
+        elif isinstance(resolution, dict):
+            resolution["last_seen"] = max(resolution["last_seen"], created_time)
+            resolution["lookups"] += 1
+        else:
+            seen, count = extended.get(resolution, (created_time, 0))
+            extended[resolution] = (max(seen, created_time), count + 1)
+        query_logs[i] = (domain_id, created_time, resolution)
+
+    if started:
+        ids = connection.execute(
+            insert(Resolution).returning(
+                Resolution.resolutionID, sort_by_parameter_order=True
+            ),
+            [resolution for resolution, _ in started],
+        ).scalars()
+        for (resolution, _), resolution_id in zip(started, ids):
+            resolution["resolutionID"] = resolution_id
+        RESOLUTIONS_STARTED.inc(len(started))
+        addresses = [
+            {"resolutionID": resolution["resolutionID"], "address": str(address)}
+            for resolution, answer in started
+            for address in answer
+        ]
+        if addresses:
+            connection.execute(insert(ResolutionAddress), addresses)
+        connection.execute(
+            update(Domain.__table__)
+            .where(Domain.domainID == bindparam("domain_id"))
+            .values(resolutionID=bindparam("resolution_id")),
+            [
+                {"domain_id": domain_id, "resolution_id": resolution["resolutionID"]}
+                for domain_id, (_, resolution) in sorted(latest.items())
+                if isinstance(resolution, dict)
+            ],
+        )
+    if extended:
+        connection.execute(
+            update(Resolution.__table__)
+            .where(Resolution.resolutionID == bindparam("resolution_id"))
+            .values(
+                # Batches replayed from the spill file can be older
+                last_seen=func.greatest(Resolution.last_seen, bindparam("seen")),
+                lookups=Resolution.lookups + bindparam("lookups"),
+            ),
+            [
+                {"resolution_id": resolution_id, "seen": seen, "lookups": lookups}
+                for resolution_id, (seen, lookups) in sorted(extended.items())
+            ],
+        )
+
+    return [
+        {
+            "domainID": domain_id,
+            "resolutionID": (
+                resolution["resolutionID"]
+                if isinstance(resolution, dict)
+                else resolution
+            ),
+            "created_time": created_time,
+        }
+        for domain_id, created_time, resolution in query_logs
+    ]
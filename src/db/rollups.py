@@ -0,0 +1,100 @@
+"""Incrementally maintained query statistics.
+
+Every batch of query logs written by the query log writer is also counted per
+UTC minute and per domain and UTC day, and the counts are added to the
+`query_stats_minute` and `domain_stats_daily` rollup tables in the same
+transaction, with one multi-row INSERT ... ON CONFLICT DO UPDATE per table.
+The rollups therefore always agree with the logged rows, and statistics cost
+one row per bucket whatever the number of queries.
+
+Keys are upserted in sorted order, so concurrent writers lock the rollup rows
+in the same order and cannot deadlock.
+
+Functions:
+    minute_bucket: Returns the UTC minute of a time.
+    rollup_counts: Counts a batch of query logs per rollup bucket.
+    upsert_rollups: Adds the counts of a batch to the rollup tables.
+"""
+
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from models.stats import DomainStatsDaily, QueryStatsMinute
+
+
+def minute_bucket(moment: datetime) -> datetime:
+    """Returns the UTC minute containing an aware datetime."""
+    return moment.astimezone(timezone.utc).replace(second=0, microsecond=0)
+
+
+def rollup_counts(
+    rows: List[dict],
+) -> Tuple[Dict[datetime, int], Dict[Tuple[date, str], Tuple[int, datetime]]]:
+    """
+    Counts a batch of query logs per rollup bucket.
+
+    Args:
+        rows (List[dict]): Query log rows, keyed by column name. Rows without a
+            creation time are counted now, as the database will date them.
+
+    Returns:
+        Tuple[Dict[datetime, int], Dict[Tuple[date, str], Tuple[int, datetime]]]:
+        The number of queries per minute, and the number of queries and the
+        last query time per (day, domain).
+    """
+    now = datetime.now(timezone.utc)
+    minutes: Dict[datetime, int] = Counter()
+    domains: Dict[Tuple[date, str], Tuple[int, datetime]] = {}
+    for row in rows:
+        created_time = row.get("created_time") or now
+        minute = minute_bucket(created_time)
+        minutes[minute] += 1
+        key = (minute.date(), row["domain"])
+        queries, last_seen = domains.get(key, (0, created_time))
+        domains[key] = (queries + 1, max(last_seen, created_time))
+    return minutes, domains
+
+
+def upsert_rollups(connection, rows: List[dict]):
+    """
+    Adds the counts of a batch of query logs to the rollup tables.
+
+    Args:
+        connection (Connection): The connection inserting the rows, in a
+            transaction.
+        rows (List[dict]): The query log rows, keyed by column name.
+    """
+    if not rows:
+        return
+    minutes, domains = rollup_counts(rows)
+
+    statement = insert(QueryStatsMinute)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[QueryStatsMinute.bucket],
+            set_={"queries": QueryStatsMinute.queries + statement.excluded.queries},
+        ),
+        [{"bucket": bucket, "queries": minutes[bucket]} for bucket in sorted(minutes)],
+    )
+
+    statement = insert(DomainStatsDaily)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DomainStatsDaily.day, DomainStatsDaily.domain],
+            set_={
+                "queries": DomainStatsDaily.queries + statement.excluded.queries,
+                # Batches replayed from the spill file can be older
+                "last_seen": func.greatest(
+                    DomainStatsDaily.last_seen, statement.excluded.last_seen
+                ),
+            },
+        ),
+        [
+            {"day": day, "domain": domain, "queries": queries, "last_seen": last_seen}
+            for (day, domain), (queries, last_seen) in sorted(domains.items())
+        ],
+    )
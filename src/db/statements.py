@@ -0,0 +1,312 @@
+"""Per-statement latency instrumentation and slow-query log.
+
+`trace_statements` hooks the cursor executions of an engine, so the time the
+database takes for each statement is measured apart from the rest of the
+request. With the checkout wait of the pools, see `db.pool`, it tells whether a
+slow endpoint waits on the database, on a connection, or on the app itself.
+
+Statements are labelled by their normalized text: literals and bound parameters
+are replaced by `?`, lists of them, such as expanded IN lists, by `?, ...`, and
+multi-row VALUES by one row, so the executions of a statement share a label
+whatever their parameters. The number of labels is capped, later statements
+are counted under "other".
+
+Statements taking longer than the threshold go to the slow-query log, with
+their normalized text and the types of their bound parameters, never their
+values. The log is rate-limited, the statements left out are counted in the
+next logged one. A sample of the slow SELECTs also gets its plan logged: an
+`EXPLAIN` of the statement, without ANALYZE so it is not run again, is run on
+its connection in a savepoint, which leaves the transaction of the statement
+unaffected if it fails.
+
+Environment Variables:
+    DB_SLOW_QUERY_THRESHOLD (float): Seconds from which a statement is slow,
+        0 disables the slow-query log. Defaults to 0.5.
+    DB_SLOW_QUERY_LOG_LIMIT (int): Slow statements logged per minute.
+        Defaults to 10.
+    DB_SLOW_QUERY_EXPLAIN_RATE (float): Fraction of the logged slow SELECTs
+        whose plan is logged, between 0 and 1. Defaults to 0.
+    DB_STATEMENT_MAX_LABELS (int): Number of statement labels.
+        Defaults to 500.
+
+Classes:
+    SlowQueryLog: Rate-limited log of the slow statements.
+
+Functions:
+    normalize(statement): Returns the normalized text of a statement.
+    statement_label(statement): Returns the metrics label of a statement.
+    redact(parameters, executemany): Returns the types of bound parameters.
+    trace_statements(engine, slow_log): Instruments the statements of an engine.
+
+Metrics:
+    DB_STATEMENT_DURATION: A histogram of the execution time of statements,
+        by statement.
+    DB_STATEMENT_ROWS: A histogram of the rows returned or changed by
+        statements, by statement.
+    DB_SLOW_QUERIES: A counter of the slow statements, logged or not.
+"""
+
+import functools
+import os
+import random
+import re
+import threading
+from time import monotonic, perf_counter
+from typing import Any, List, Optional, Union
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from helpers.log.logger import init_log
+
+# Initialize loggers
+logger = init_log()
+
+DB_SLOW_QUERY_THRESHOLD = float(os.getenv("DB_SLOW_QUERY_THRESHOLD", "0.5"))
+DB_SLOW_QUERY_LOG_LIMIT = int(os.getenv("DB_SLOW_QUERY_LOG_LIMIT", "10"))
+DB_SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("DB_SLOW_QUERY_EXPLAIN_RATE", "0"))
+DB_STATEMENT_MAX_LABELS = int(os.getenv("DB_STATEMENT_MAX_LABELS", "500"))
+
+# Define Prometheus metrics
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Execution time of database statements, by normalized statement",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+DB_STATEMENT_ROWS = Histogram(
+    "db_statement_rows",
+    "Rows returned or changed by database statements, by normalized statement",
+    ["statement"],
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000),
+)
+DB_SLOW_QUERIES = Counter(
+    "db_slow_queries_total", "Total number of statements over the slow threshold"
+)
+
+# String literals, then asyncpg, psycopg2 and numeric placeholders and numbers
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+|%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_ROWS = re.compile(r"\(\?(?:, \.\.\.)?\)(?:\s*,\s*\(\?(?:, \.\.\.)?\))+")
+_SPACES = re.compile(r"\s+")
+
+# Labels given so far, see `statement_label`
+_labels = set()
+
+# Key of the start time of a statement on its execution context
+_START = "_traced_start"
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize(statement: str) -> str:
+    """
+    Returns the normalized text of a statement.
+
+    Args:
+        statement (str): The SQL sent to the driver.
+
+    Returns:
+        str: The statement on one line, its literals and parameters replaced.
+    """
+    normalized = _LITERALS.sub("?", _SPACES.sub(" ", statement).strip())
+    normalized = _LISTS.sub("?, ...", normalized)
+    return _ROWS.sub("(?, ...), ...", normalized)
+
+
+def statement_label(statement: str) -> str:
+    """
+    Returns the metrics label of a statement.
+
+    Args:
+        statement (str): The SQL sent to the driver.
+
+    Returns:
+        str: The normalized statement, or "other" once the labels are used up.
+    """
+    label = normalize(statement)
+    if label not in _labels:
+        if len(_labels) >= DB_STATEMENT_MAX_LABELS:
+            return "other"
+        _labels.add(label)
+    return label
+
+
+def redact(parameters: Any, executemany: bool = False) -> Any:
+    """
+    Returns the types of bound parameters, in place of their values.
+
+    Args:
+        parameters (Any): The parameters sent to the driver, a dict or a
+            sequence, or a list of them for an executemany.
+        executemany (bool): Whether the statement was run for each of a list of
+            parameters.
+
+    Returns:
+        Any: The parameters with each value replaced by its type name, the first
+        set only with the number of sets for an executemany.
+    """
+    if executemany:
+        sets = list(parameters or ())
+        first = redact(sets[0]) if sets else None
+        return f"{len(sets)} parameter sets, first {first}"
+    if isinstance(parameters, dict):
+        return {name: f"<{type(value).__name__}>" for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [f"<{type(value).__name__}>" for value in parameters]
+    return parameters
+
+
+class SlowQueryLog:
+    """
+    Rate-limited log of the statements slower than a threshold.
+
+    Attributes:
+        threshold (float): Seconds from which a statement is slow, 0 disables
+            the log.
+        limit (int): Slow statements logged per minute.
+        explain_rate (float): Fraction of the logged slow SELECTs whose plan is
+            logged.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DB_SLOW_QUERY_THRESHOLD,
+        limit: int = DB_SLOW_QUERY_LOG_LIMIT,
+        explain_rate: float = DB_SLOW_QUERY_EXPLAIN_RATE,
+    ):
+        self.threshold = threshold
+        self.limit = limit
+        self.explain_rate = explain_rate
+        # Statements run in the threadpool and on the event loop
+        self._lock = threading.Lock()
+        self._window_start = monotonic()
+        self._logged = 0
+        self._suppressed = 0
+
+    def _admit(self) -> Optional[int]:
+        """Returns the count of statements left out, None when over budget."""
+        with self._lock:
+            now = monotonic()
+            if now - self._window_start >= 60:
+                self._window_start, self._logged = now, 0
+            if self._logged >= self.limit:
+                self._suppressed += 1
+                return None
+            self._logged += 1
+            suppressed, self._suppressed = self._suppressed, 0
+            return suppressed
+
+    @staticmethod
+    def _explain(connection, statement: str, parameters: Any) -> List[str]:
+        """Returns the plan of a statement, explained in a savepoint."""
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN {statement}", parameters)
+                plan = [row[0] for row in cursor.fetchall()]
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        finally:
+            cursor.close()
+
+    def record(
+        self,
+        connection,
+        statement: str,
+        parameters: Any,
+        context,
+        executemany: bool,
+        duration: float,
+        rows: int,
+    ):
+        """
+        Counts a slow statement and logs it, within the rate limit.
+
+        Args:
+            connection (Connection): The connection the statement ran on.
+            statement (str): The SQL sent to the driver.
+            parameters (Any): The parameters sent to the driver.
+            context (ExecutionContext): The execution context of the statement.
+            executemany (bool): Whether the statement was an executemany.
+            duration (float): The execution time in seconds.
+            rows (int): The rows returned or changed, -1 when unknown.
+        """
+        DB_SLOW_QUERIES.inc()
+        suppressed = self._admit()
+        if suppressed is None:
+            return
+        normalized = normalize(statement)
+        message = (
+            f"Slow query ({duration * 1000:.0f} ms, {rows} rows): {normalized} "
+            f"parameters={redact(parameters, executemany)}"
+        )
+        if suppressed:
+            message += f" ({suppressed} slow queries not logged)"
+        select = normalized.upper().startswith("SELECT") and not executemany
+        # A server-side cursor may still be reading the result
+        streaming = context.execution_options.get("stream_results", False)
+        sampled = self.explain_rate > 0 and random.random() < self.explain_rate
+        if select and not streaming and sampled:
+            try:
+                plan = self._explain(connection, statement, parameters)
+                message += "\n    " + "\n    ".join(plan)
+            except Exception as e:
+                message += f"\n    EXPLAIN failed: {str(e)}"
+        logger.warning(message)
+
+
+# Slow-query log of the engines of the app
+slow_query_log = SlowQueryLog()
+
+
+def trace_statements(
+    engine: Union[Engine, AsyncEngine], slow_log: Optional[SlowQueryLog] = None
+) -> Union[Engine, AsyncEngine]:
+    """
+    Instruments the statements run by an engine.
+
+    Args:
+        engine (Union[Engine, AsyncEngine]): The engine.
+        slow_log (Optional[SlowQueryLog]): The slow-query log, `slow_query_log`
+            by default.
+
+    Returns:
+        Union[Engine, AsyncEngine]: The engine.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    slow_log = slow_log or slow_query_log
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def started(connection, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            setattr(context, _START, perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def executed(connection, cursor, statement, parameters, context, executemany):
+        start = getattr(context, _START, None)
+        if start is None:
+            return
+        duration = perf_counter() - start
+        label = statement_label(statement)
+        DB_STATEMENT_DURATION.labels(statement=label).observe(duration)
+        rows = cursor.rowcount
+        if rows >= 0:
+            DB_STATEMENT_ROWS.labels(statement=label).observe(rows)
+        if slow_log.threshold and duration >= slow_log.threshold:
+            slow_log.record(
+                connection,
+                statement,
+                parameters,
+                context,
+                executemany,
+                duration,
+                rows,
+            )
+
+    return engine
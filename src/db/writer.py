@@ -0,0 +1,383 @@
+"""Write-behind logging of domain queries.
+
+This module batches `query_log` inserts off the request path. Lookups put their
+rows on a bounded in-memory queue and return immediately, and a background task
+writes the rows with multi-row INSERT statements, either when a batch is full or
+when its oldest row reaches the flush interval. The domains and resolved
+addresses of each batch are stored once in the resolution tables, see
+`db.resolutions`. Each batch also updates the statistics rollups, see
+`db.rollups`, and notifies the listeners registered with
+`on_query_logs_written` once committed. The creation time of each row is
+taken when it is queued, so batching does not shift the logged timestamps.
+
+The mode decides what is written for each lookup:
+    - full: a query log row per lookup, on top of the resolutions.
+    - changes: only the resolutions, which get a new row when the answer of a
+      domain changes, the other lookups of a batch being added to the lookup
+      count of their resolution. The history then stays empty, while the
+      resolutions still tell when the addresses of each domain changed.
+
+When the queue is full the overflow policy decides what happens to new rows:
+    - block: the lookup waits for room in the queue (backpressure).
+    - drop: the row is discarded and counted.
+    - spill: the row is appended to a local NDJSON file that is replayed into
+      the database once the queue has drained.
+
+A spill file is renamed with a ".replay" suffix while it is replayed, and only
+removed once every one of its batches is committed. When a batch fails the
+file is rewritten with the rows not written yet, and a replay file left by a
+failure or a restart is replayed first, when the writer starts and before any
+newer spill file, so spilled rows are written at least once.
+
+Environment Variables:
+    QUERY_LOG_QUEUE_SIZE (int): Maximum number of queued rows. Defaults to 10000.
+    QUERY_LOG_BATCH_SIZE (int): Maximum number of rows per INSERT.
+        Defaults to 500.
+    QUERY_LOG_FLUSH_INTERVAL (float): Maximum seconds a row waits before being
+        written. Defaults to 1.
+    QUERY_LOG_OVERFLOW (str): Overflow policy, "block", "drop" or "spill".
+        Defaults to "block".
+    QUERY_LOG_SPILL_PATH (str): File used by the spill policy.
+        Defaults to "/tmp/query_log_spill.ndjson".
+    QUERY_LOG_MODE (str): What is written per lookup, "full" or "changes".
+        Defaults to "full".
+
+Classes:
+    QueryLogWriter: Queue and background task writing query logs in batches.
+
+Metrics:
+    QUERY_LOG_QUEUE_DEPTH: A gauge of the number of queued rows.
+    QUERY_LOG_ROWS_WRITTEN: A counter of rows inserted in the database.
+    QUERY_LOG_ROWS_DROPPED: A counter of rows lost, by reason.
+    QUERY_LOG_ROWS_SPILLED: A counter of rows written to the spill file.
+    QUERY_LOG_FLUSH_DURATION: A histogram of the duration of each batch insert.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import insert
+
+from db.database import engine
+from db.resolutions import record_resolutions
+from db.rollups import upsert_rollups
+from helpers.log.logger import init_log
+from models.log import QueryLog
+
+# Initialize loggers
+logger = init_log()
+
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "500"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "1"))
+QUERY_LOG_OVERFLOW = os.getenv("QUERY_LOG_OVERFLOW", "block")
+QUERY_LOG_SPILL_PATH = os.getenv("QUERY_LOG_SPILL_PATH", "/tmp/query_log_spill.ndjson")
+QUERY_LOG_MODE = os.getenv("QUERY_LOG_MODE", "full")
+
+OVERFLOW_POLICIES = ("block", "drop", "spill")
+MODES = ("full", "changes")
+
+# Define Prometheus metrics
+QUERY_LOG_QUEUE_DEPTH = Gauge(
+    "query_log_queue_depth", "Number of query log rows waiting to be written"
+)
+QUERY_LOG_ROWS_WRITTEN = Counter(
+    "query_log_rows_written_total", "Total number of query log rows written"
+)
+QUERY_LOG_ROWS_DROPPED = Counter(
+    "query_log_rows_dropped_total",
+    "Total number of query log rows dropped",
+    ["reason"],
+)
+QUERY_LOG_ROWS_SPILLED = Counter(
+    "query_log_rows_spilled_total", "Total number of query log rows spilled to disk"
+)
+QUERY_LOG_FLUSH_DURATION = Histogram(
+    "query_log_flush_duration_seconds", "Duration of query log batch inserts"
+)
+
+# Marker put on the queue to stop the background task, flush requests put a
+# future instead
+_STOP = object()
+
+
+# Callbacks run after each committed batch, see `on_query_logs_written`
+_write_listeners: List[Callable[[], None]] = []
+
+
+def on_query_logs_written(callback: Callable[[], None]):
+    """
+    Registers a callback run after every committed batch of query logs.
+
+    Callbacks run in the thread of the insert, so they must be thread-safe.
+
+    Args:
+        callback (Callable[[], None]): The function to call, typically the
+            invalidation of a cache of query logs.
+    """
+    _write_listeners.append(callback)
+
+
+def insert_query_logs(rows: List[dict], mode: str = "full"):
+    """
+    Inserts query log rows with a multi-row INSERT in one transaction.
+
+    The resolutions of the lookups and the statistics rollups are updated in
+    the same transaction, and the write listeners are called once it is
+    committed.
+
+    Args:
+        rows (List[dict]): The lookups to log, with their "domain",
+            "client_ip" (the list of resolved addresses) and "created_time".
+        mode (str): "full" to insert the query log rows, "changes" to only
+            record the resolutions.
+    """
+    with engine.begin() as connection:
+        query_logs = record_resolutions(connection, rows)
+        if mode == "full":
+            connection.execute(insert(QueryLog.__table__), query_logs)
+        upsert_rollups(connection, rows)
+    for callback in _write_listeners:
+        # The rows are committed, a failing listener must not get them retried
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Query log write listener failed: {str(e)}")
+
+
+class QueryLogWriter:
+    """
+    Bounded queue of query log rows written to the database in batches.
+
+    Attributes:
+        queue_size (int): Maximum number of queued rows.
+        batch_size (int): Maximum number of rows per INSERT.
+        flush_interval (float): Maximum seconds a row waits before being written.
+        overflow (str): Overflow policy, "block", "drop" or "spill".
+        spill_path (str): File used by the spill policy.
+        mode (str): What is written per lookup, "full" or "changes".
+        insert (Callable[[List[dict]], None]): Function writing a batch, run in
+            the threadpool. Defaults to `insert_query_logs` in `mode`.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = QUERY_LOG_QUEUE_SIZE,
+        batch_size: int = QUERY_LOG_BATCH_SIZE,
+        flush_interval: float = QUERY_LOG_FLUSH_INTERVAL,
+        overflow: str = QUERY_LOG_OVERFLOW,
+        spill_path: str = QUERY_LOG_SPILL_PATH,
+        mode: str = QUERY_LOG_MODE,
+        insert: Optional[Callable[[List[dict]], None]] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown query log overflow policy: {overflow}")
+        if mode not in MODES:
+            raise ValueError(f"Unknown query log mode: {mode}")
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.mode = mode
+        self.insert = insert or functools.partial(insert_query_logs, mode=mode)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[dict] = []
+        # Rows are spilled from the event loop while the spill file is renamed
+        # for a replay in the threadpool
+        self._spill_lock = threading.Lock()
+
+    def start(self):
+        """Creates the queue and starts the background task on the running loop."""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._batch = []
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(
+            f"Query log writer started ({self.mode} mode, {self.overflow} on overflow)"
+        )
+
+    async def stop(self):
+        """Writes every queued row, then stops the background task."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info("Query log writer drained and stopped")
+
+    async def put(self, domain: str, ipv4s: list):
+        """
+        Queues a successful lookup to be logged.
+
+        Args:
+            domain (str): The domain name queried.
+            ipv4s (list): A list of IPv4 addresses resolved from the domain.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.get_loop() is not loop:
+            self.start()
+        row = {
+            "domain": domain,
+            "client_ip": ipv4s,
+            "created_time": datetime.now(timezone.utc),
+        }
+        if self.overflow == "block":
+            await self._queue.put(row)
+        else:
+            try:
+                self._queue.put_nowait(row)
+            except asyncio.QueueFull:
+                self._overflow([row], "queue_full")
+        QUERY_LOG_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def flush(self):
+        """Waits until every row queued so far has been written."""
+        if self._task is None or self._task.done():
+            return
+        written = asyncio.get_running_loop().create_future()
+        await self._queue.put(written)
+        await written
+
+    async def _run(self):
+        """Collects rows into batches and writes them by size or age."""
+        loop = asyncio.get_running_loop()
+        # Rows spilled before a restart are written before new ones
+        await run_in_threadpool(self._replay_spill)
+        while True:
+            row = await self._queue.get()
+            deadline = loop.time() + self.flush_interval
+            # Rows are dicts, anything else is a flush or stop marker
+            while isinstance(row, dict):
+                self._batch.append(row)
+                remaining = deadline - loop.time()
+                if len(self._batch) >= self.batch_size or remaining <= 0:
+                    row = None
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    row = None
+            flushed = await self._flush()
+            if isinstance(row, asyncio.Future) and not row.done():
+                row.set_result(flushed)
+            drained = self._queue.qsize() < self.queue_size // 2
+            if flushed and (row is _STOP or drained):
+                await run_in_threadpool(self._replay_spill)
+            if row is _STOP:
+                return
+
+    async def _flush(self) -> bool:
+        """Writes the current batch, returning False if the insert failed."""
+        batch, self._batch = self._batch, []
+        QUERY_LOG_QUEUE_DEPTH.set(self._queue.qsize())
+        if not batch:
+            return True
+        try:
+            with QUERY_LOG_FLUSH_DURATION.time():
+                await run_in_threadpool(self.insert, batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} query logs: {str(e)}")
+            self._overflow(batch, "write_failed")
+            return False
+        QUERY_LOG_ROWS_WRITTEN.inc(len(batch))
+        return True
+
+    def _overflow(self, rows: List[dict], reason: str):
+        """Spills or drops rows that cannot be queued or written."""
+        if self.overflow == "spill":
+            try:
+                with self._spill_lock:
+                    with open(self.spill_path, "a", encoding="utf-8") as f:
+                        for row in rows:
+                            f.write(json.dumps(row, default=datetime.isoformat) + "\n")
+                QUERY_LOG_ROWS_SPILLED.inc(len(rows))
+                return
+            except OSError as e:
+                logger.error(f"Failed to spill query logs: {str(e)}")
+        QUERY_LOG_ROWS_DROPPED.labels(reason=reason).inc(len(rows))
+
+    def _replay_spill(self):
+        """Writes the rows of the replay file, then of the spill file."""
+        if self.overflow != "spill":
+            return
+        replaying = f"{self.spill_path}.replay"
+        # A replay file left by a failed replay or a restart goes first
+        if os.path.exists(replaying) and not self._replay(replaying):
+            return
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            try:
+                os.replace(self.spill_path, replaying)
+            except OSError as e:
+                logger.error(f"Failed to read spilled query logs: {str(e)}")
+                return
+        self._replay(replaying)
+
+    def _replay(self, path: str) -> bool:
+        """
+        Writes the rows of a replay file to the database in batches.
+
+        The file is removed once every batch is committed, or rewritten with
+        the rows not written when a batch fails.
+
+        Args:
+            path (str): The replay file.
+
+        Returns:
+            bool: Whether every row was written.
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = [line for line in f if line.strip()]
+        except OSError as e:
+            logger.error(f"Failed to read spilled query logs: {str(e)}")
+            return False
+        rows = []
+        for line in lines:
+            try:
+                row = json.loads(line)
+                row["created_time"] = datetime.fromisoformat(row["created_time"])
+            except (ValueError, TypeError, KeyError) as e:
+                # A line cut short by a crash would otherwise block the replay
+                logger.error(f"Skipping malformed spilled query log: {str(e)}")
+                QUERY_LOG_ROWS_DROPPED.labels(reason="malformed").inc()
+                continue
+            rows.append(row)
+        written = 0
+        try:
+            for offset in range(0, len(rows), self.batch_size):
+                end = offset + self.batch_size
+                self.insert(rows[offset:end])
+                written = min(end, len(rows))
+        except Exception as e:
+            logger.error(f"Failed to replay spilled query logs: {str(e)}")
+        QUERY_LOG_ROWS_WRITTEN.inc(written)
+        try:
+            if written < len(rows):
+                self._rewrite(path, rows[written:])
+            else:
+                os.remove(path)
+        except OSError as e:
+            # Kept whole, the written rows are replayed again next time
+            logger.error(f"Failed to update spilled query logs: {str(e)}")
+        if written:
+            logger.info(f"Replayed {written} spilled query logs")
+        return written == len(rows)
+
+    @staticmethod
+    def _rewrite(path: str, rows: List[dict]):
+        """Atomically replaces the content of a replay file with rows."""
+        pending = f"{path}.tmp"
+        with open(pending, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=datetime.isoformat) + "\n")
+        os.replace(pending, path)
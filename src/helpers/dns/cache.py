@@ -0,0 +1,432 @@
+"""
+In-process cache of DNS answers.
+
+This module provides a bounded cache placed in front of the resolver. Positive
+answers are kept for the TTL of their records, lookups that failed because the
+domain does not exist are kept for a short negative TTL, and the least recently
+used entry is evicted when the cache is full. A cache hit is served from memory
+without touching the network or the threadpool.
+
+The cache can be snapshotted to a file and restored from it, so a restarted
+worker starts warm instead of sending every lookup upstream. The snapshot
+stores the expiry of each entry as a wall clock timestamp, since monotonic
+times do not survive a restart, and entries that expired in between are
+skipped on load. It is a single compact JSON document, read in one go.
+
+Positive hits are counted per entry over its lifetime so the refresher of
+`helpers.dns.refresh` can find the hot domains about to expire.
+
+Environment Variables:
+    DNS_CACHE_SIZE (int): Maximum number of cached domains. Defaults to 10000.
+    DNS_CACHE_MIN_TTL (int): Lower bound applied to record TTLs, in seconds.
+        Defaults to 0.
+    DNS_CACHE_MAX_TTL (int): Upper bound applied to record TTLs, in seconds.
+        Defaults to 3600.
+    DNS_CACHE_NEGATIVE_TTL (int): Seconds a "domain not found" error is kept.
+        Defaults to 30.
+    DNS_CACHE_SNAPSHOT_PATH (str): File the cache is snapshotted to and
+        restored from. Defaults to no snapshot.
+    DNS_CACHE_SNAPSHOT_INTERVAL (float): Seconds between snapshots.
+        Defaults to 60.
+
+Classes:
+    CacheEntry: A cached answer or error with its expiry time.
+    DNSCache: LRU cache of answers honoring the record TTLs.
+
+Functions:
+    write_snapshot(path, rows): Atomically writes snapshot rows to a file.
+    read_snapshot(path): Reads the snapshot rows of a file.
+
+Metrics:
+    DNS_CACHE_HITS: A counter of lookups served from the cache.
+    DNS_CACHE_MISSES: A counter of lookups that had to be resolved.
+    DNS_CACHE_EVICTIONS: A counter of entries evicted to make room.
+    DNS_CACHE_ENTRIES: A gauge of the number of cached domains.
+    DNS_REFRESH_HITS: A counter of hits served by an entry the refresher renewed.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Union
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+
+from helpers.dns.resolver import Answer, not_found
+from helpers.log.logger import init_log
+
+logger = init_log()
+
+DNS_CACHE_SIZE = int(os.getenv("DNS_CACHE_SIZE", "10000"))
+DNS_CACHE_MIN_TTL = int(os.getenv("DNS_CACHE_MIN_TTL", "0"))
+DNS_CACHE_MAX_TTL = int(os.getenv("DNS_CACHE_MAX_TTL", "3600"))
+DNS_CACHE_NEGATIVE_TTL = int(os.getenv("DNS_CACHE_NEGATIVE_TTL", "30"))
+DNS_CACHE_SNAPSHOT_PATH = os.getenv("DNS_CACHE_SNAPSHOT_PATH", "")
+DNS_CACHE_SNAPSHOT_INTERVAL = float(os.getenv("DNS_CACHE_SNAPSHOT_INTERVAL", "60"))
+
+SNAPSHOT_VERSION = 1
+
+# Define Prometheus metrics
+DNS_CACHE_HITS = Counter(
+    "dns_cache_hits_total",
+    "Total number of lookups served from the DNS cache",
+    ["kind"],
+)
+DNS_CACHE_MISSES = Counter(
+    "dns_cache_misses_total", "Total number of lookups missing the DNS cache"
+)
+DNS_CACHE_EVICTIONS = Counter(
+    "dns_cache_evictions_total", "Total number of DNS cache entries evicted"
+)
+DNS_CACHE_ENTRIES = Gauge("dns_cache_entries", "Number of domains in the DNS cache")
+DNS_REFRESH_HITS = Counter(
+    "dns_refresh_hits_total",
+    "Total number of lookups served by a DNS cache entry renewed ahead of expiry",
+)
+
+
+class CacheEntry(NamedTuple):
+    """
+    A cached lookup result.
+
+    Attributes:
+        expires (float): Monotonic time after which the entry is stale.
+        value (Union[Answer, socket.gaierror]): The answer, or the error raised
+            when the domain was not found.
+        refreshed (bool): True if the answer was renewed ahead of expiry.
+    """
+
+    expires: float
+    value: Union[Answer, socket.gaierror]
+    refreshed: bool = False
+
+
+def write_snapshot(path: str, rows: List[list]):
+    """
+    Atomically writes snapshot rows to a file.
+
+    The rows are written to a temporary file renamed over `path`, so a crash
+    while writing never leaves a truncated snapshot behind.
+
+    Args:
+        path (str): The snapshot file.
+        rows (List[list]): The rows returned by `DNSCache.dump`.
+    """
+    document = {"version": SNAPSHOT_VERSION, "entries": rows}
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(document, f, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def read_snapshot(path: str) -> List[list]:
+    """
+    Reads the snapshot rows of a file.
+
+    Args:
+        path (str): The snapshot file.
+
+    Returns:
+        List[list]: The rows to pass to `DNSCache.load`, empty if the file does
+        not exist or was written by another snapshot version.
+
+    Raises:
+        ValueError: If the file is not a valid snapshot.
+    """
+    try:
+        with open(path, "rb") as f:
+            document = json.loads(f.read())
+    except FileNotFoundError:
+        return []
+    if not isinstance(document, dict):
+        raise ValueError("The snapshot is not a JSON object")
+    if document.get("version") != SNAPSHOT_VERSION:
+        return []
+    entries = document.get("entries")
+    if not isinstance(entries, list):
+        raise ValueError("The snapshot entries are not a list")
+    return entries
+
+
+class DNSCache:
+    """
+    LRU cache of DNS answers honoring the record TTLs.
+
+    Attributes:
+        max_entries (int): Maximum number of cached domains.
+        min_ttl (int): Lower bound applied to record TTLs, in seconds.
+        max_ttl (int): Upper bound applied to record TTLs, in seconds.
+        negative_ttl (int): Seconds a "domain not found" error is kept.
+        clock (Callable[[], float]): Monotonic clock used for expiry.
+        wall_clock (Callable[[], float]): Wall clock used for the expiries
+            stored in snapshots.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DNS_CACHE_SIZE,
+        min_ttl: int = DNS_CACHE_MIN_TTL,
+        max_ttl: int = DNS_CACHE_MAX_TTL,
+        negative_ttl: int = DNS_CACHE_NEGATIVE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        self.max_entries = max_entries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._hits: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(domain: str) -> str:
+        """Normalizes a domain name into a cache key."""
+        return domain.rstrip(".").lower()
+
+    def get(self, domain: str) -> Optional[Answer]:
+        """
+        Returns the cached answer of a domain.
+
+        Args:
+            domain (str): The domain name to look up.
+
+        Returns:
+            Optional[Answer]: The cached answer with its remaining TTL, or None
+            if the domain is not cached or its entry expired.
+
+        Raises:
+            socket.gaierror: If the domain is negatively cached.
+        """
+        key = self.key(domain)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        remaining = entry.expires - self.clock()
+        if remaining <= 0:
+            del self._entries[key]
+            self._hits.pop(key, None)
+            DNS_CACHE_ENTRIES.set(len(self._entries))
+            return None
+        self._entries.move_to_end(key)
+        if isinstance(entry.value, socket.gaierror):
+            DNS_CACHE_HITS.labels(kind="negative").inc()
+            raise socket.gaierror(*entry.value.args)
+        DNS_CACHE_HITS.labels(kind="positive").inc()
+        self._hits[key] = self._hits.get(key, 0) + 1
+        if entry.refreshed:
+            DNS_REFRESH_HITS.inc()
+        return entry.value._replace(ttl=int(remaining))
+
+    def put(self, domain: str, answer: Answer, refreshed: bool = False):
+        """
+        Caches an answer for the TTL of its records.
+
+        Answers with a TTL of zero, such as IP literals or hosts file entries,
+        are not cached.
+
+        Args:
+            domain (str): The domain name that was resolved.
+            answer (Answer): The answer to cache.
+            refreshed (bool): True if the answer renews an entry ahead of its
+                expiry.
+        """
+        if answer.ttl <= 0 and self.min_ttl <= 0:
+            return
+        ttl = min(max(answer.ttl, self.min_ttl), self.max_ttl)
+        self._store(domain, CacheEntry(self.clock() + ttl, answer, refreshed))
+
+    def put_negative(self, domain: str, error: socket.gaierror):
+        """
+        Caches a resolution error if it means the domain does not exist.
+
+        Temporary failures such as timeouts are not cached.
+
+        Args:
+            domain (str): The domain name that failed to resolve.
+            error (socket.gaierror): The error raised by the resolver.
+        """
+        if error.errno != socket.EAI_NONAME or self.negative_ttl <= 0:
+            return
+        self._store(domain, CacheEntry(self.clock() + self.negative_ttl, error))
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        self._entries.clear()
+        self._hits.clear()
+        DNS_CACHE_ENTRIES.set(0)
+
+    def _store(self, domain: str, entry: CacheEntry):
+        """Inserts an entry and evicts the least recently used ones if full."""
+        key = self.key(domain)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        # Hits are counted per entry, a new entry starts from zero
+        self._hits.pop(key, None)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._hits.pop(evicted, None)
+            DNS_CACHE_EVICTIONS.inc()
+        DNS_CACHE_ENTRIES.set(len(self._entries))
+
+    def hot_expiring(self, window: float, min_hits: int = 1) -> List[str]:
+        """
+        Returns the popular domains whose answer is about to expire.
+
+        An answer is about to expire when less than `window` seconds, or half
+        its TTL if that is shorter, are left.
+
+        Args:
+            window (float): Seconds before expiry from which an answer is due.
+            min_hits (int): Minimum number of hits of the entry so far.
+
+        Returns:
+            List[str]: The keys of the due domains, most hit first.
+        """
+        now = self.clock()
+        due = []
+        for key, hits in self._hits.items():
+            if hits < min_hits:
+                continue
+            entry = self._entries[key]
+            remaining = entry.expires - now
+            ttl = min(max(entry.value.ttl, self.min_ttl), self.max_ttl)
+            if 0 < remaining <= min(window, ttl / 2):
+                due.append((hits, key))
+        due.sort(reverse=True)
+        return [key for _, key in due]
+
+    def dump(self) -> List[list]:
+        """
+        Returns the live entries as snapshot rows.
+
+        Each row is [key, expires_at, name, addresses] with expires_at a wall
+        clock timestamp, and name and addresses null for a "domain not found"
+        entry. Rows are ordered from least to most recently used.
+
+        Returns:
+            List[list]: The snapshot rows.
+        """
+        now = self.clock()
+        offset = self.wall_clock() - now
+        rows = []
+        for key, entry in self._entries.items():
+            if entry.expires <= now:
+                continue
+            expires_at = round(entry.expires + offset, 3)
+            if isinstance(entry.value, socket.gaierror):
+                rows.append([key, expires_at, None, None])
+            else:
+                rows.append([key, expires_at, entry.value.name, entry.value.addresses])
+        return rows
+
+    def load(self, rows: List[list]) -> int:
+        """
+        Restores the entries of snapshot rows that have not expired yet.
+
+        Domains already cached are kept, as their entry is more recent than the
+        snapshot.
+
+        Args:
+            rows (List[list]): The rows returned by `dump`.
+
+        Returns:
+            int: The number of entries restored.
+        """
+        now = self.clock()
+        offset = now - self.wall_clock()
+        restored = 0
+        # The last rows are the most recently used ones
+        newest = -self.max_entries
+        for key, expires_at, name, addresses in rows[newest:]:
+            expires = expires_at + offset
+            if expires <= now or key in self._entries:
+                continue
+            if addresses is None:
+                value = not_found(key)
+            else:
+                value = Answer(name, addresses, int(expires - now))
+            self._store(key, CacheEntry(expires, value))
+            restored += 1
+        return restored
+
+    async def restore(self, path: str = DNS_CACHE_SNAPSHOT_PATH) -> int:
+        """
+        Loads a snapshot file into the cache, reading it in the threadpool.
+
+        A missing or unreadable snapshot leaves the cache as it is.
+
+        Args:
+            path (str): The snapshot file.
+
+        Returns:
+            int: The number of entries restored.
+        """
+        try:
+            rows = await run_in_threadpool(read_snapshot, path)
+            restored = self.load(rows)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Failed to restore the DNS cache from {path}: {str(e)}")
+            return 0
+        logger.info(f"Restored {restored} DNS cache entries from {path}")
+        return restored
+
+    async def save(self, path: str = DNS_CACHE_SNAPSHOT_PATH):
+        """
+        Writes a snapshot of the cache, serializing it in the threadpool.
+
+        Args:
+            path (str): The snapshot file.
+        """
+        rows = self.dump()
+        try:
+            await run_in_threadpool(write_snapshot, path, rows)
+        except OSError as e:
+            logger.error(f"Failed to snapshot the DNS cache to {path}: {str(e)}")
+
+    async def persist(
+        self,
+        path: str = DNS_CACHE_SNAPSHOT_PATH,
+        interval: float = DNS_CACHE_SNAPSHOT_INTERVAL,
+    ):
+        """Snapshots the cache to `path` every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.save(path)
+
+    async def resolve(
+        self, domain: str, resolve: Callable[[str], Awaitable[Answer]]
+    ) -> Answer:
+        """
+        Returns the cached answer of a domain, resolving it on a miss.
+
+        Args:
+            domain (str): The domain name to resolve.
+            resolve (Callable[[str], Awaitable[Answer]]): The resolver called
+                on a cache miss.
+
+        Returns:
+            Answer: The answer of the domain.
+
+        Raises:
+            socket.gaierror: If the domain could not be resolved.
+        """
+        answer = self.get(domain)
+        if answer is not None:
+            return answer
+        DNS_CACHE_MISSES.inc()
+        try:
+            answer = await resolve(domain)
+        except socket.gaierror as e:
+            self.put_negative(domain, e)
+            raise
+        self.put(domain, answer)
+        return answer
@@ -0,0 +1,143 @@
+"""
+Refresh-ahead of popular cached domains.
+
+Without help, the request following the expiry of a popular domain pays for a
+full resolution, which shows up as periodic latency spikes. This module runs a
+background task that re-resolves the most used cached domains shortly before
+their answer expires, so they keep being served from the cache.
+
+A domain is eligible when its current cache entry was hit at least
+DNS_REFRESH_MIN_HITS times and it is within DNS_REFRESH_WINDOW seconds (or half
+its TTL) of expiring. At most DNS_REFRESH_TOP_N domains are refreshed per pass,
+most hit first, and the upstream traffic this adds is capped by a budget of
+queries per second. A failed refresh leaves the current entry to expire
+normally.
+
+Environment Variables:
+    DNS_REFRESH_TOP_N (int): Maximum number of domains refreshed per pass,
+        0 disables the refresher. Defaults to 100.
+    DNS_REFRESH_WINDOW (float): Seconds before expiry from which a domain is
+        refreshed. Defaults to 10.
+    DNS_REFRESH_MIN_HITS (int): Minimum number of hits of an entry for it to be
+        refreshed. Defaults to 2.
+    DNS_REFRESH_BUDGET (float): Maximum refresh queries per second.
+        Defaults to 50.
+    DNS_REFRESH_INTERVAL (float): Seconds between passes. Defaults to 1.
+
+Classes:
+    RefreshAhead: Background refresher of hot cache entries.
+
+Metrics:
+    DNS_REFRESH_QUERIES: A counter of refresh resolutions, by result.
+    DNS_REFRESH_SKIPPED: A counter of due domains left out by the budget.
+"""
+
+import asyncio
+import os
+import socket
+from typing import Awaitable, Callable
+
+from prometheus_client import Counter
+
+from helpers.dns.cache import DNSCache
+from helpers.dns.resolver import Answer
+from helpers.log.logger import init_log
+
+logger = init_log()
+
+DNS_REFRESH_TOP_N = int(os.getenv("DNS_REFRESH_TOP_N", "100"))
+DNS_REFRESH_WINDOW = float(os.getenv("DNS_REFRESH_WINDOW", "10"))
+DNS_REFRESH_MIN_HITS = int(os.getenv("DNS_REFRESH_MIN_HITS", "2"))
+DNS_REFRESH_BUDGET = float(os.getenv("DNS_REFRESH_BUDGET", "50"))
+DNS_REFRESH_INTERVAL = float(os.getenv("DNS_REFRESH_INTERVAL", "1"))
+
+# Define Prometheus metrics
+DNS_REFRESH_QUERIES = Counter(
+    "dns_refresh_queries_total",
+    "Total number of DNS cache entries re-resolved ahead of expiry",
+    ["result"],
+)
+DNS_REFRESH_SKIPPED = Counter(
+    "dns_refresh_skipped_total",
+    "Total number of due DNS cache refreshes skipped by the budget",
+)
+
+
+class RefreshAhead:
+    """
+    Background refresher of the hot entries of a DNS cache.
+
+    Attributes:
+        cache (DNSCache): The cache whose entries are renewed.
+        resolve (Callable[[str], Awaitable[Answer]]): The resolver queried for
+            fresh answers.
+        top_n (int): Maximum number of domains refreshed per pass.
+        window (float): Seconds before expiry from which a domain is refreshed.
+        min_hits (int): Minimum number of hits of an entry to refresh it.
+        budget (float): Maximum refresh queries per second.
+        interval (float): Seconds between passes.
+    """
+
+    def __init__(
+        self,
+        cache: DNSCache,
+        resolve: Callable[[str], Awaitable[Answer]],
+        top_n: int = DNS_REFRESH_TOP_N,
+        window: float = DNS_REFRESH_WINDOW,
+        min_hits: int = DNS_REFRESH_MIN_HITS,
+        budget: float = DNS_REFRESH_BUDGET,
+        interval: float = DNS_REFRESH_INTERVAL,
+    ):
+        self.cache = cache
+        self.resolve = resolve
+        self.top_n = top_n
+        self.window = window
+        self.min_hits = min_hits
+        self.budget = budget
+        self.interval = interval
+        # Unused budget carries over to the next pass, up to one second of it
+        # (or one query if the budget is below one per second)
+        self._tokens = 0.0
+
+    async def refresh_once(self) -> int:
+        """
+        Refreshes the due domains allowed by the budget.
+
+        Returns:
+            int: The number of domains successfully refreshed.
+        """
+        self._tokens = min(
+            self._tokens + self.budget * self.interval, max(self.budget, 1.0)
+        )
+        due = self.cache.hot_expiring(self.window, self.min_hits)
+        if not due:
+            return 0
+        allowed = min(self.top_n, int(self._tokens), len(due))
+        if allowed < len(due):
+            DNS_REFRESH_SKIPPED.inc(len(due) - allowed)
+        self._tokens -= allowed
+        results = await asyncio.gather(*(self._refresh(key) for key in due[:allowed]))
+        return sum(results)
+
+    async def _refresh(self, key: str) -> bool:
+        """Re-resolves a domain and renews its cache entry."""
+        try:
+            answer = await self.resolve(key)
+        except socket.gaierror as e:
+            DNS_REFRESH_QUERIES.labels(result="failed").inc()
+            logger.warning(f"Refresh of {key} failed: {str(e)}")
+            return False
+        self.cache.put(key, answer, refreshed=True)
+        DNS_REFRESH_QUERIES.labels(result="ok").inc()
+        return True
+
+    async def run(self):
+        """Refreshes the due domains every `interval` seconds."""
+        if self.top_n <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                logger.error(f"DNS refresh pass failed: {str(e)}")
@@ -0,0 +1,602 @@
+"""
+Asynchronous DNS resolver for domain lookups.
+
+This module implements a small stub resolver that runs entirely on the asyncio
+event loop. Each query is sent from its own UDP socket, so from a source port
+picked at random by the system, with a random transaction ID and, unless
+disabled, the letters of its name in random case (the "0x20" encoding). A reply
+is only accepted with the transaction ID and the exact question that was sent,
+so an off-path attacker has to guess the port, the ID and the case together to
+spoof an answer, which the DNS cache would keep and serve. When a reply is
+truncated the query is retried over TCP. A semaphore caps the number of lookups
+in flight, each with at most two queries and so two sockets open at a time, so
+a burst of lookups cannot exhaust sockets or flood the upstream nameservers.
+
+Every configured nameserver is tracked by `helpers.dns.upstream`. A lookup first
+asks the upstream with the best smoothed latency and error rate. If it has not
+answered within its adaptive hedge delay, the same query goes to the next
+upstream and the first definite reply wins. A failed query is replaced by a
+query to the next upstream straight away. So one slow or dead nameserver in
+resolv.conf costs a hedge delay rather than a full timeout.
+
+Resolution errors are reported as `socket.gaierror` so callers can handle them
+exactly like errors from `socket.gethostbyname_ex`.
+
+Environment Variables:
+    DNS_NAMESERVERS (str): Comma separated list of "host[:port]" nameservers.
+        Defaults to the nameservers listed in /etc/resolv.conf.
+    DNS_TIMEOUT (float): Seconds to wait for a reply per attempt. Defaults to 2.
+    DNS_ATTEMPTS (int): Number of passes over the nameserver list, fastest
+        first. Defaults to 2.
+    DNS_MAX_INFLIGHT (int): Maximum number of concurrent lookups, which keep
+        up to twice as many sockets open when hedging. Defaults to 1000.
+    DNS_CASE_RANDOMIZATION (bool): Whether names are queried in random case,
+        to disable for nameservers not preserving the case of the question.
+        Defaults to true.
+
+Classes:
+    Answer: The result of a successful resolution.
+    AsyncResolver: Event-loop based stub resolver for IPv4 addresses.
+
+Functions:
+    build_query(txid, qname, qtype): Encodes a DNS query message.
+    randomize_case(message): Flips the case of the letters of a query at random.
+    parse_response(message): Decodes the parts of a reply used by the resolver.
+    read_nameservers(path): Reads the nameservers from a resolv.conf file.
+    read_hosts(path): Reads IPv4 entries from a hosts file.
+"""
+
+import asyncio
+import ipaddress
+import os
+import secrets
+import socket
+import struct
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from helpers.dns.upstream import DNS_HEDGE_WINS, DNS_HEDGED_QUERIES, UpstreamStats
+from helpers.log.logger import init_log
+
+logger = init_log()
+
+DNS_NAMESERVERS = os.getenv("DNS_NAMESERVERS", "")
+DNS_TIMEOUT = float(os.getenv("DNS_TIMEOUT", "2"))
+DNS_ATTEMPTS = int(os.getenv("DNS_ATTEMPTS", "2"))
+DNS_MAX_INFLIGHT = int(os.getenv("DNS_MAX_INFLIGHT", "1000"))
+DNS_CASE_RANDOMIZATION = os.getenv("DNS_CASE_RANDOMIZATION", "true").lower() == "true"
+
+DNS_PORT = 53
+QTYPE_A = 1
+QTYPE_CNAME = 5
+QCLASS_IN = 1
+
+FLAG_QR = 0x8000
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+HEADER = struct.Struct("!HHHHHH")
+RR_FIXED = struct.Struct("!HHIH")
+
+
+class Answer(NamedTuple):
+    """
+    The result of a successful resolution.
+
+    Attributes:
+        name (str): The canonical name the addresses belong to.
+        addresses (List[str]): The IPv4 addresses of the name.
+        ttl (int): The smallest TTL of the records in the answer, in seconds.
+    """
+
+    name: str
+    addresses: List[str]
+    ttl: int
+
+
+class Response(NamedTuple):
+    """
+    The parts of a DNS reply used by the resolver.
+
+    Attributes:
+        txid (int): The transaction ID of the reply.
+        flags (int): The header flags, including the response code.
+        cname (Optional[str]): The last CNAME target in the answer section.
+        addresses (List[str]): The IPv4 addresses found in the answer section.
+        ttl (int): The smallest TTL of the A and CNAME records.
+    """
+
+    txid: int
+    flags: int
+    cname: Optional[str]
+    addresses: List[str]
+    ttl: int
+
+    @property
+    def rcode(self):
+        """int: The response code of the reply."""
+        return self.flags & 0x000F
+
+    @property
+    def truncated(self):
+        """bool: True if the reply was truncated and must be retried over TCP."""
+        return bool(self.flags & FLAG_TC)
+
+
+def not_found(domain: str) -> socket.gaierror:
+    """Builds the error raised when a domain has no IPv4 address."""
+    return socket.gaierror(socket.EAI_NONAME, f"Name or service not known: {domain}")
+
+
+def temporary_failure(domain: str) -> socket.gaierror:
+    """Builds the error raised when no nameserver gave a usable answer."""
+    return socket.gaierror(
+        socket.EAI_AGAIN, f"Temporary failure in name resolution: {domain}"
+    )
+
+
+def encode_name(name: str) -> bytes:
+    """
+    Encodes a domain name in DNS wire format.
+
+    Args:
+        name (str): The domain name, with or without the trailing dot.
+
+    Returns:
+        bytes: The length-prefixed labels terminated by the root label.
+
+    Raises:
+        socket.gaierror: If the name is not a valid domain name.
+    """
+    try:
+        labels = name.rstrip(".").encode("idna").split(b".")
+    except UnicodeError as e:
+        raise not_found(name) from e
+    wire = bytearray()
+    for label in labels:
+        if not label or len(label) > 63:
+            raise not_found(name)
+        wire.append(len(label))
+        wire += label
+    wire.append(0)
+    if len(wire) > 255:
+        raise not_found(name)
+    return bytes(wire)
+
+
+def build_query(txid: int, qname: str, qtype: int = QTYPE_A) -> bytes:
+    """
+    Encodes a recursive DNS query.
+
+    Args:
+        txid (int): The transaction ID used to match the reply.
+        qname (str): The domain name to query.
+        qtype (int): The record type to query (default is A).
+
+    Returns:
+        bytes: The query message.
+    """
+    header = HEADER.pack(txid, FLAG_RD, 1, 0, 0, 0)
+    return header + encode_name(qname) + struct.pack("!HH", qtype, QCLASS_IN)
+
+
+def randomize_case(message: bytes) -> bytes:
+    """
+    Flips the case of each letter of the name of a query with probability 1/2.
+
+    Nameservers copy the question into their reply, so a reply whose question
+    does not have the same case was not sent in answer to the query.
+
+    Args:
+        message (bytes): A query built by `build_query`.
+
+    Returns:
+        bytes: The query with its name in random case.
+    """
+    start, end = HEADER.size, len(message) - 4
+    name = message[start:end]
+    bits = secrets.randbits(len(name))
+    flipped = bytes(
+        byte ^ 0x20 if 0x61 <= byte | 0x20 <= 0x7A and bits >> i & 1 else byte
+        for i, byte in enumerate(name)
+    )
+    return message[:start] + flipped + message[end:]
+
+
+def decode_name(message: bytes, offset: int) -> Tuple[str, int]:
+    """
+    Decodes a possibly compressed domain name.
+
+    Args:
+        message (bytes): The whole DNS message.
+        offset (int): The offset of the name in the message.
+
+    Returns:
+        Tuple[str, int]: The decoded name and the offset right after it.
+
+    Raises:
+        ValueError: If the name is malformed or the pointers loop.
+    """
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 16:
+                raise ValueError("Too many compression pointers")
+            offset = struct.unpack_from("!H", message, offset)[0] & 0x3FFF
+            continue
+        offset += 1
+        if length == 0:
+            break
+        label_end = offset + length
+        labels.append(message[offset:label_end].decode("ascii", "replace"))
+        offset = label_end
+    return ".".join(labels).lower(), end if end is not None else offset
+
+
+def parse_response(message: bytes) -> Response:
+    """
+    Decodes the header and answer section of a DNS reply.
+
+    Args:
+        message (bytes): The reply received from the nameserver.
+
+    Returns:
+        Response: The decoded reply.
+
+    Raises:
+        ValueError: If the message is not a well-formed DNS reply.
+    """
+    try:
+        txid, flags, qdcount, ancount, _, _ = HEADER.unpack_from(message)
+        offset = HEADER.size
+        for _ in range(qdcount):
+            _, offset = decode_name(message, offset)
+            offset += 4
+        cname = None
+        addresses = []
+        ttls = []
+        for _ in range(ancount):
+            _, offset = decode_name(message, offset)
+            rtype, rclass, ttl, rdlength = RR_FIXED.unpack_from(message, offset)
+            offset += RR_FIXED.size
+            rdata_end = offset + rdlength
+            rdata = message[offset:rdata_end]
+            if rclass == QCLASS_IN and rtype == QTYPE_A and rdlength == 4:
+                addresses.append(socket.inet_ntoa(rdata))
+                ttls.append(ttl)
+            elif rclass == QCLASS_IN and rtype == QTYPE_CNAME:
+                cname = decode_name(message, offset)[0]
+                ttls.append(ttl)
+            offset += rdlength
+    except (IndexError, struct.error) as e:
+        raise ValueError("Malformed DNS message") from e
+    if not flags & FLAG_QR:
+        raise ValueError("DNS message is not a response")
+    return Response(txid, flags, cname, addresses, min(ttls, default=0))
+
+
+def read_nameservers(path: str = "/etc/resolv.conf") -> List[Tuple[str, int]]:
+    """
+    Reads the nameservers to query.
+
+    The DNS_NAMESERVERS environment variable takes precedence over the
+    resolv.conf file. Falls back to the local host if nothing is configured.
+
+    Args:
+        path (str): The resolv.conf file to read.
+
+    Returns:
+        List[Tuple[str, int]]: The (host, port) pairs of the nameservers.
+    """
+    if DNS_NAMESERVERS:
+        nameservers = []
+        for entry in DNS_NAMESERVERS.split(","):
+            host, _, port = entry.strip().rpartition(":")
+            if not host:
+                host, port = port, str(DNS_PORT)
+            nameservers.append((host.strip("[]"), int(port)))
+        return nameservers
+
+    nameservers = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    nameservers.append((fields[1], DNS_PORT))
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {str(e)}")
+    return nameservers or [("127.0.0.1", DNS_PORT)]
+
+
+def read_hosts(path: str = "/etc/hosts") -> Dict[str, List[str]]:
+    """
+    Reads the IPv4 entries of a hosts file.
+
+    Args:
+        path (str): The hosts file to read.
+
+    Returns:
+        Dict[str, List[str]]: The IPv4 addresses of each host name.
+    """
+    hosts: Dict[str, List[str]] = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split("#", 1)[0].split()
+                if len(fields) < 2 or ":" in fields[0]:
+                    continue
+                for name in fields[1:]:
+                    addresses = hosts.setdefault(name.lower(), [])
+                    if fields[0] not in addresses:
+                        addresses.append(fields[0])
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {str(e)}")
+    return hosts
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol of one query, on its own socket.
+
+    A reply only completes the query when its transaction ID and its question
+    section, case included, are those of the query.
+    """
+
+    def __init__(self, message: bytes):
+        self.message = message
+        self.reply = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        start, end = HEADER.size, len(self.message)
+        question = self.message[start:]
+        answered = data[start:end]
+        same_txid = data[:2] == self.message[:2]
+        if same_txid and answered == question and not self.reply.done():
+            self.reply.set_result(data)
+
+    def error_received(self, exc):
+        self._fail(exc)
+
+    def connection_lost(self, exc):
+        self._fail(exc or ConnectionResetError("DNS socket closed"))
+
+    def _fail(self, exc):
+        if not self.reply.done():
+            self.reply.set_exception(exc)
+
+
+class AsyncResolver:
+    """
+    Stub resolver that looks up IPv4 addresses on the asyncio event loop.
+
+    Each query opens its own connected UDP socket, closed once answered, so
+    the queries of a lookup leave from ports the system picks at random. The
+    in-flight semaphore is bound to the running event loop and is recreated if
+    the resolver is used from another loop. At most two queries of a lookup
+    are in flight: the one sent to the best ranked upstream and a hedged one.
+
+    Attributes:
+        nameservers (List[Tuple[str, int]]): The (host, port) pairs to query.
+        timeout (float): Seconds to wait for a reply per attempt.
+        attempts (int): Number of passes over the nameserver list.
+        max_inflight (int): Maximum number of concurrent lookups.
+        hosts (Dict[str, List[str]]): Static entries answered without a query.
+        randomize_case (bool): Whether names are queried in random case.
+        upstreams (Dict[Tuple[str, int], UpstreamStats]): The latency and error
+            tracking of each nameserver.
+    """
+
+    def __init__(
+        self,
+        nameservers: Optional[List[Tuple[str, int]]] = None,
+        timeout: float = DNS_TIMEOUT,
+        attempts: int = DNS_ATTEMPTS,
+        max_inflight: int = DNS_MAX_INFLIGHT,
+        hosts: Optional[Dict[str, List[str]]] = None,
+        randomize_case: bool = DNS_CASE_RANDOMIZATION,
+    ):
+        self.nameservers = nameservers or read_nameservers()
+        self.timeout = timeout
+        self.attempts = attempts
+        self.max_inflight = max_inflight
+        self.hosts = read_hosts() if hosts is None else hosts
+        self.randomize_case = randomize_case
+        self.upstreams = {ns: UpstreamStats(ns) for ns in self.nameservers}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Sockets of the queries in flight
+        self._transports: Set[asyncio.DatagramTransport] = set()
+
+    async def resolve(self, domain: str) -> Answer:
+        """
+        Resolves a domain name to its IPv4 addresses.
+
+        Args:
+            domain (str): The domain name to resolve.
+
+        Returns:
+            Answer: The canonical name, addresses and TTL of the domain.
+
+        Raises:
+            socket.gaierror: If the domain does not exist, has no IPv4 address,
+                or no nameserver could be reached.
+        """
+        qname = domain.rstrip(".").lower()
+        try:
+            if ipaddress.ip_address(qname).version == 4:
+                return Answer(qname, [qname], 0)
+        except ValueError:
+            pass
+        if qname in self.hosts:
+            return Answer(qname, list(self.hosts[qname]), 0)
+
+        self._bind_loop()
+        async with self._semaphore:
+            return await self._query(qname)
+
+    async def close(self):
+        """Closes the sockets of the queries in flight."""
+        for transport in list(self._transports):
+            transport.close()
+        self._transports.clear()
+
+    def _bind_loop(self):
+        """Resets the loop-bound state when called from a new event loop."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+
+    def ranked(self) -> List[Tuple[str, int]]:
+        """Returns the nameservers from the best to the worst expected cost."""
+        return sorted(
+            self.nameservers, key=lambda ns: self.upstreams[ns].score(self.timeout)
+        )
+
+    async def _query(self, qname: str) -> Answer:
+        """
+        Races the ranked nameservers until one gives a definite answer.
+
+        The best upstream is queried first. The next one is queried when the
+        first has not answered within its hedge delay, or as soon as a query
+        fails, with at most two queries in flight.
+        """
+        loop = asyncio.get_running_loop()
+        candidates = deque(self.ranked() * self.attempts)
+        # Task of each query in flight -> (nameserver, start time, hedged)
+        running: Dict[asyncio.Task, Tuple[Tuple[str, int], float, bool]] = {}
+        error = temporary_failure(qname)
+        hedge_at = 0.0
+
+        def send(hedged: bool = False):
+            nonlocal hedge_at
+            nameserver = candidates.popleft()
+            task = loop.create_task(self.query(nameserver, qname))
+            running[task] = (nameserver, loop.time(), hedged)
+            if len(running) == 1:
+                # Only query in flight, hedge if it is slower than usual
+                stats = self.upstreams[nameserver]
+                hedge_at = loop.time() + stats.hedge_delay(self.timeout)
+
+        try:
+            send()
+            while running:
+                wait = None
+                in_flight = {ns for ns, _, _ in running.values()}
+                if len(running) == 1 and candidates and candidates[0] not in in_flight:
+                    wait = max(hedge_at - loop.time(), 0)
+                done, _ = await asyncio.wait(
+                    set(running), timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    DNS_HEDGED_QUERIES.inc()
+                    send(hedged=True)
+                    continue
+                for task in done:
+                    nameserver, started, hedged = running.pop(task)
+                    stats = self.upstreams[nameserver]
+                    try:
+                        answer = task.result()
+                    except socket.gaierror as e:
+                        if e.errno == socket.EAI_NONAME:
+                            stats.record_reply(loop.time() - started)
+                            raise
+                        stats.record_failure()
+                        error = e
+                    except (asyncio.TimeoutError, OSError, ValueError) as e:
+                        stats.record_failure()
+                        logger.warning(
+                            f"DNS query for {qname} to {nameserver} failed: {e!r}"
+                        )
+                    else:
+                        stats.record_reply(loop.time() - started)
+                        if hedged:
+                            DNS_HEDGE_WINS.inc()
+                        return answer
+                # Fail over to the next upstream right away, if a query is still
+                # in flight the hedge delay has passed and it is sent next loop
+                if not running and candidates:
+                    send()
+            raise error
+        finally:
+            for task, (nameserver, started, _) in running.items():
+                if task.done():
+                    # Finished along with the winner, only retrieve its outcome
+                    if not task.cancelled():
+                        task.exception()
+                else:
+                    task.cancel()
+                    self.upstreams[nameserver].record_abandoned(loop.time() - started)
+
+    async def query(self, nameserver: Tuple[str, int], qname: str) -> Answer:
+        """
+        Sends one query to one nameserver, falling back to TCP if truncated.
+
+        Args:
+            nameserver (Tuple[str, int]): The (host, port) of the nameserver.
+            qname (str): The domain name to query.
+
+        Returns:
+            Answer: The canonical name, addresses and TTL of the domain.
+
+        Raises:
+            socket.gaierror: If the nameserver answered with an error.
+            asyncio.TimeoutError: If the nameserver did not answer in time.
+            OSError: If the nameserver could not be reached.
+            ValueError: If the reply was malformed.
+        """
+        message = build_query(secrets.randbelow(0x10000), qname)
+        if self.randomize_case:
+            message = randomize_case(message)
+        # A new socket per query, bound to a random port by the system
+        transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _UDPProtocol(message), remote_addr=nameserver
+        )
+        self._transports.add(transport)
+        try:
+            transport.sendto(message)
+            reply = await asyncio.wait_for(protocol.reply, self.timeout)
+        finally:
+            self._transports.discard(transport)
+            transport.close()
+        response = parse_response(reply)
+
+        if response.truncated:
+            response = parse_response(await self._tcp_exchange(nameserver, message))
+        return self._answer(qname, response)
+
+    async def _tcp_exchange(self, nameserver: Tuple[str, int], message: bytes) -> bytes:
+        """Sends a query over TCP and returns the reply."""
+
+        async def exchange():
+            reader, writer = await asyncio.open_connection(*nameserver)
+            try:
+                writer.write(struct.pack("!H", len(message)) + message)
+                await writer.drain()
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+                return await reader.readexactly(length)
+            finally:
+                writer.close()
+
+        return await asyncio.wait_for(exchange(), self.timeout)
+
+    @staticmethod
+    def _answer(qname: str, response: Response) -> Answer:
+        """Converts a reply into an answer or the matching resolution error."""
+        if response.rcode == RCODE_NXDOMAIN:
+            raise not_found(qname)
+        if response.rcode != RCODE_NOERROR:
+            raise temporary_failure(qname)
+        if not response.addresses:
+            raise not_found(qname)
+        return Answer(response.cname or qname, response.addresses, response.ttl)
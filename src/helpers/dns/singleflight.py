@@ -0,0 +1,92 @@
+"""
+Coalescing of concurrent identical lookups.
+
+This module provides a single-flight group: while a resolution for a key is in
+flight, every other caller asking for the same key waits for that resolution
+instead of starting its own. The result, or the exception, is handed to every
+caller. During a spike on a popular domain the upstream nameservers see a
+single query for it.
+
+The shared resolution runs in its own task, so a caller that is cancelled
+(for instance because its client disconnected) does not cancel the resolution
+for the other callers.
+
+Classes:
+    SingleFlight: Group of in-flight calls keyed by domain.
+
+Metrics:
+    DNS_SINGLEFLIGHT_CALLS: A counter of resolutions actually started.
+    DNS_SINGLEFLIGHT_DEDUP: A counter of callers that joined an existing call.
+    DNS_SINGLEFLIGHT_WAITERS: A gauge of callers waiting on a shared call.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from prometheus_client import Counter, Gauge
+
+# Define Prometheus metrics
+DNS_SINGLEFLIGHT_CALLS = Counter(
+    "dns_singleflight_calls_total", "Total number of lookups sent to the resolver"
+)
+DNS_SINGLEFLIGHT_DEDUP = Counter(
+    "dns_singleflight_dedup_total",
+    "Total number of lookups that joined an identical lookup in flight",
+)
+DNS_SINGLEFLIGHT_WAITERS = Gauge(
+    "dns_singleflight_waiters", "Number of lookups waiting on a shared lookup"
+)
+
+
+class SingleFlight:
+    """
+    Group of in-flight calls, at most one per key.
+
+    Attributes:
+        inflight (Dict[str, asyncio.Task]): The running call of each key.
+    """
+
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Task] = {}
+
+    def __len__(self):
+        return len(self.inflight)
+
+    async def do(self, key: str, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Runs `func(*args)`, or joins the call already running for `key`.
+
+        Args:
+            key (str): The key identifying identical calls.
+            func (Callable[..., Awaitable[Any]]): The coroutine function to run.
+            *args: The arguments passed to `func`.
+
+        Returns:
+            Any: The result of the shared call.
+
+        Raises:
+            Exception: Whatever the shared call raised.
+        """
+        loop = asyncio.get_running_loop()
+        task = self.inflight.get(key)
+        if task is not None and task.get_loop() is loop and not task.done():
+            DNS_SINGLEFLIGHT_DEDUP.inc()
+            DNS_SINGLEFLIGHT_WAITERS.inc()
+            try:
+                return await asyncio.shield(task)
+            finally:
+                DNS_SINGLEFLIGHT_WAITERS.dec()
+
+        DNS_SINGLEFLIGHT_CALLS.inc()
+        task = loop.create_task(func(*args))
+        self.inflight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        """Removes a finished call so the next caller starts a new one."""
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
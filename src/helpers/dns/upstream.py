@@ -0,0 +1,141 @@
+"""
+Latency and error tracking of upstream nameservers.
+
+The resolver keeps one `UpstreamStats` per configured nameserver. Every reply
+updates a smoothed round-trip time and its mean deviation, in the way TCP
+estimates its retransmission timeout, and every failure (timeout, unreachable
+server, SERVFAIL) updates a smoothed error rate. Upstreams are ranked by their
+expected cost, the smoothed latency plus the error rate times the query
+timeout, so the resolver asks the fastest healthy one first.
+
+The same estimates give the hedging delay: when the first upstream has not
+answered after its usual latency plus four deviations, a second query is sent
+to the next upstream and the first reply wins.
+
+Environment Variables:
+    DNS_HEDGE_MIN_DELAY (float): Shortest delay before a hedged query, in
+        seconds. Defaults to 0.01.
+
+Classes:
+    UpstreamStats: Smoothed latency and error rate of one nameserver.
+
+Metrics:
+    DNS_UPSTREAM_QUERIES: A counter of queries per upstream, by result.
+    DNS_UPSTREAM_LATENCY: A gauge of the smoothed latency of each upstream.
+    DNS_UPSTREAM_ERROR_RATE: A gauge of the smoothed error rate of each upstream.
+    DNS_HEDGED_QUERIES: A counter of hedged queries sent.
+    DNS_HEDGE_WINS: A counter of lookups answered by the hedged query.
+"""
+
+import os
+from typing import Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+DNS_HEDGE_MIN_DELAY = float(os.getenv("DNS_HEDGE_MIN_DELAY", "0.01"))
+
+# Weights of a new sample in the smoothed latency, deviation and error rate
+LATENCY_ALPHA = 0.125
+DEVIATION_BETA = 0.25
+ERROR_ALPHA = 0.1
+
+# Define Prometheus metrics
+DNS_UPSTREAM_QUERIES = Counter(
+    "dns_upstream_queries_total",
+    "Total number of DNS queries sent to each upstream nameserver",
+    ["upstream", "result"],
+)
+DNS_UPSTREAM_LATENCY = Gauge(
+    "dns_upstream_latency_seconds",
+    "Smoothed reply latency of each upstream nameserver",
+    ["upstream"],
+)
+DNS_UPSTREAM_ERROR_RATE = Gauge(
+    "dns_upstream_error_rate",
+    "Smoothed failure rate of each upstream nameserver",
+    ["upstream"],
+)
+DNS_HEDGED_QUERIES = Counter(
+    "dns_hedged_queries_total", "Total number of hedged DNS queries sent"
+)
+DNS_HEDGE_WINS = Counter(
+    "dns_hedge_wins_total", "Total number of lookups answered by a hedged query"
+)
+
+
+class UpstreamStats:
+    """
+    Smoothed latency and error rate of one upstream nameserver.
+
+    Attributes:
+        nameserver (Tuple[str, int]): The (host, port) of the nameserver.
+        label (str): The "host:port" label of the nameserver in the metrics.
+        latency (Optional[float]): Smoothed reply latency in seconds, None until
+            the first reply.
+        deviation (float): Smoothed mean deviation of the latency.
+        error_rate (float): Smoothed fraction of failed queries.
+    """
+
+    def __init__(self, nameserver: Tuple[str, int]):
+        self.nameserver = nameserver
+        self.label = f"{nameserver[0]}:{nameserver[1]}"
+        self.latency: Optional[float] = None
+        self.deviation = 0.0
+        self.error_rate = 0.0
+
+    def _observe(self, elapsed: float):
+        if self.latency is None:
+            self.latency = elapsed
+            self.deviation = elapsed / 2
+        else:
+            self.deviation += DEVIATION_BETA * (
+                abs(elapsed - self.latency) - self.deviation
+            )
+            self.latency += LATENCY_ALPHA * (elapsed - self.latency)
+        DNS_UPSTREAM_LATENCY.labels(upstream=self.label).set(self.latency)
+
+    def _set_error(self, failed: bool):
+        self.error_rate += ERROR_ALPHA * (float(failed) - self.error_rate)
+        DNS_UPSTREAM_ERROR_RATE.labels(upstream=self.label).set(self.error_rate)
+
+    def record_reply(self, elapsed: float):
+        """Records a definite reply, an answer or NXDOMAIN, after `elapsed`."""
+        self._observe(elapsed)
+        self._set_error(False)
+        DNS_UPSTREAM_QUERIES.labels(upstream=self.label, result="reply").inc()
+
+    def record_failure(self):
+        """Records a query that timed out, could not be sent or got SERVFAIL."""
+        self._set_error(True)
+        DNS_UPSTREAM_QUERIES.labels(upstream=self.label, result="failure").inc()
+
+    def record_abandoned(self, elapsed: float):
+        """
+        Records a query cancelled because another upstream answered first.
+
+        The upstream took at least `elapsed`, which only counts as a sample if
+        it is slower than its current estimate.
+        """
+        if self.latency is None or elapsed > self.latency:
+            self._observe(elapsed)
+        DNS_UPSTREAM_QUERIES.labels(upstream=self.label, result="abandoned").inc()
+
+    def score(self, timeout: float) -> float:
+        """Returns the expected cost of a query, lower is better."""
+        return (self.latency or 0.0) + self.error_rate * timeout
+
+    def hedge_delay(self, timeout: float) -> float:
+        """
+        Returns how long to wait for this upstream before hedging.
+
+        Args:
+            timeout (float): The query timeout, also the longest delay. A
+                quarter of it is used until the first reply.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        if self.latency is None:
+            return max(timeout / 4, DNS_HEDGE_MIN_DELAY)
+        delay = self.latency + 4 * self.deviation
+        return min(max(delay, DNS_HEDGE_MIN_DELAY), timeout)
@@ -0,0 +1,180 @@
+"""
+Background health checks of the services the app depends on.
+
+Health endpoints are polled every second or so by Docker and Kubernetes, and
+checking the services on each poll puts that load on them, makes the endpoints
+as slow as the slowest service, and lets a hung service hang the probes. The
+`HealthProber` instead checks each registered service in the background, on
+its own interval and within its own timeout, using the shared connection
+pools, and keeps the latest result of each. The endpoints only read that
+snapshot.
+
+A service is unknown until its first check, then healthy or unhealthy. A check
+failing or exceeding its timeout makes the service unhealthy until a later
+check succeeds. The app is ready once every critical service has been checked
+and is healthy.
+
+Environment Variables:
+    HEALTH_CHECK_INTERVAL (float): Default seconds between the checks of a
+        service. Defaults to 5.
+    HEALTH_CHECK_TIMEOUT (float): Default seconds a check may take before the
+        service is unhealthy. Defaults to 2.
+
+Classes:
+    ServiceHealth: The result of the latest check of a service.
+    HealthProber: Registry and background checker of services.
+
+Metrics:
+    HEALTH_CHECK_STATUS: A gauge of the state of each service, 1 when healthy.
+    HEALTH_CHECK_DURATION: A histogram of the duration of the checks, by
+        service.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from prometheus_client import Gauge, Histogram
+
+from helpers.log.logger import init_log
+
+logger = init_log()
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+
+# Define Prometheus metrics
+HEALTH_CHECK_STATUS = Gauge(
+    "health_check_status", "Whether each service is healthy, 1 or 0", ["service"]
+)
+HEALTH_CHECK_DURATION = Histogram(
+    "health_check_duration_seconds", "Duration of the health checks", ["service"]
+)
+
+
+class ServiceHealth(NamedTuple):
+    """
+    The result of the latest check of a service.
+
+    Attributes:
+        status (str): "healthy", "unhealthy", or "unknown" before the first
+            check.
+        latency (Optional[float]): Seconds taken by the last successful check.
+        checked_at (Optional[datetime]): When the last check ended.
+    """
+
+    status: str
+    latency: Optional[float] = None
+    checked_at: Optional[datetime] = None
+
+
+class _Service(NamedTuple):
+    """A registered service, see `HealthProber.register`."""
+
+    check: Callable[[], Awaitable[None]]
+    interval: float
+    timeout: float
+    critical: bool
+
+
+class HealthProber:
+    """
+    Checks registered services in the background and keeps their latest state.
+
+    Attributes:
+        services (Dict[str, _Service]): The registered services, by name.
+    """
+
+    def __init__(self):
+        self.services: Dict[str, _Service] = {}
+        self._health: Dict[str, ServiceHealth] = {}
+
+    def register(
+        self,
+        name: str,
+        check: Callable[[], Awaitable[None]],
+        interval: float = HEALTH_CHECK_INTERVAL,
+        timeout: float = HEALTH_CHECK_TIMEOUT,
+        critical: bool = True,
+    ):
+        """
+        Registers a service to check.
+
+        Args:
+            name (str): The name of the service.
+            check (Callable[[], Awaitable[None]]): The check, raising when the
+                service is unusable.
+            interval (float): Seconds between two checks.
+            timeout (float): Seconds the check may take.
+            critical (bool): Whether the app is not ready while the service is
+                unhealthy.
+        """
+        self.services[name] = _Service(check, interval, timeout, critical)
+        self._health[name] = ServiceHealth("unknown")
+
+    def snapshot(self) -> Dict[str, ServiceHealth]:
+        """Returns the latest state of each service."""
+        return dict(self._health)
+
+    def ready(self) -> bool:
+        """Returns whether every critical service is healthy."""
+        return all(
+            self._health[name].status == "healthy"
+            for name, service in self.services.items()
+            if service.critical
+        )
+
+    async def probe(self, name: str) -> ServiceHealth:
+        """
+        Checks a service and records its state.
+
+        Args:
+            name (str): The name of the service.
+
+        Returns:
+            ServiceHealth: The new state of the service.
+        """
+        service = self.services[name]
+        start = perf_counter()
+        try:
+            await asyncio.wait_for(service.check(), service.timeout)
+            latency = perf_counter() - start
+            health = ServiceHealth("healthy", latency, datetime.now(timezone.utc))
+        except Exception as e:
+            latency = perf_counter() - start
+            health = ServiceHealth("unhealthy", None, datetime.now(timezone.utc))
+            if self._health[name].status != "unhealthy":
+                reason = (
+                    f"no answer within {service.timeout}s"
+                    if isinstance(e, asyncio.TimeoutError)
+                    else repr(e)
+                )
+                logger.error(f"Health check of {name} failed: {reason}")
+        HEALTH_CHECK_DURATION.labels(service=name).observe(latency)
+        HEALTH_CHECK_STATUS.labels(service=name).set(int(health.status == "healthy"))
+        if health.status == "healthy" and self._health[name].status == "unhealthy":
+            logger.info(f"Health check of {name} recovered")
+        self._health[name] = health
+        return health
+
+    async def check(self) -> Dict[str, ServiceHealth]:
+        """
+        Checks every service once, concurrently.
+
+        Returns:
+            Dict[str, ServiceHealth]: The new state of each service.
+        """
+        await asyncio.gather(*(self.probe(name) for name in self.services))
+        return self.snapshot()
+
+    async def _watch(self, name: str):
+        """Checks a service every `interval` seconds."""
+        while True:
+            await asyncio.sleep(self.services[name].interval)
+            await self.probe(name)
+
+    async def run(self):
+        """Checks each service on its own interval, until cancelled."""
+        await asyncio.gather(*(self._watch(name) for name in self.services))
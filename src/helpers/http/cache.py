@@ -0,0 +1,156 @@
+"""
+In-process cache of serialized responses, invalidated by writes.
+
+A `ResponseCache` keeps the body of frequently requested responses together
+with a strong ETag computed from the body. The write path calls `invalidate`
+after it changes the data behind them, which bumps a generation counter and
+empties the cache. A response computed from data read before an invalidation
+is not stored, since it might already be out of date: the caller takes the
+generation before reading and hands it back to `put`.
+
+Writes made by other processes do not reach the cache, so entries also expire
+after a short TTL, which bounds how stale a response can be.
+
+Since ETags are derived from the bodies, every instance serving the same data
+gives the same ETag, and clients can revalidate against any of them.
+
+Classes:
+    CachedResponse: A cached body with its ETag and headers.
+    ResponseCache: Generation-checked cache of serialized responses.
+
+Functions:
+    make_etag(body): Returns the strong ETag of a body.
+    etag_matches(if_none_match, etag): Checks an If-None-Match header.
+"""
+
+import hashlib
+import itertools
+import threading
+from time import monotonic
+from typing import Callable, Dict, Hashable, NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    """
+    A cached response body.
+
+    Attributes:
+        body (bytes): The serialized body.
+        etag (str): The strong ETag of the body, quoted.
+        headers (Dict[str, str]): Other headers sent with the body.
+        expires_at (float): Clock time after which the entry is not served.
+    """
+
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    expires_at: float
+
+
+def make_etag(body: bytes) -> str:
+    """Returns the strong ETag of a body, a quoted 128-bit digest."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks an If-None-Match header against the ETag of the current response.
+
+    Comparison is weak, as RFC 9110 requires for If-None-Match: a W/ prefix
+    added by a proxy does not prevent a match.
+
+    Args:
+        if_none_match (Optional[str]): The header value, None if absent.
+        etag (str): The quoted ETag of the current response.
+
+    Returns:
+        bool: True if the client already has the current response.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    Cache of serialized responses emptied on every write.
+
+    Attributes:
+        ttl (float): Seconds an entry is served, 0 disables the cache.
+        max_entries (int): Maximum number of cached responses.
+        clock (Callable[[], float]): The monotonic clock of the expiries.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 16,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: Dict[Hashable, CachedResponse] = {}
+        # Invalidations come from the threadpool of the writer
+        self._lock = threading.Lock()
+        self._generations = itertools.count(1)
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """The number of invalidations so far, to be read before the data."""
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        """Returns the cached response of `key` if it has not expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= self.clock():
+            return None
+        return entry
+
+    def put(
+        self,
+        key: Hashable,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+        generation: Optional[int] = None,
+    ) -> CachedResponse:
+        """
+        Stores a response, unless the data changed since it was read.
+
+        Args:
+            key (Hashable): The key of the response.
+            body (bytes): The serialized body.
+            headers (Optional[Dict[str, str]]): Other headers of the response.
+            generation (Optional[int]): The `generation` read before the data
+                of the response, None to store it unconditionally.
+
+        Returns:
+            CachedResponse: The response with its ETag, stored or not.
+        """
+        entry = CachedResponse(
+            body, make_etag(body), headers or {}, self.clock() + self.ttl
+        )
+        if self.ttl <= 0:
+            return entry
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return entry
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self):
+        """Drops every cached response, the data behind them has changed."""
+        with self._lock:
+            self._generation = next(self._generations)
+            self._entries = {}
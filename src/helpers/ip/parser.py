@@ -0,0 +1,119 @@
+"""
+Incremental parsing of large request bodies.
+
+This module turns the chunks of a request body into batches of strings as the
+chunks arrive, so a body with millions of entries never has to be loaded into
+memory or into a single Pydantic model. Each batch holds the entries completed
+by one chunk.
+
+Two formats are supported:
+    - A JSON array of strings, such as `["1.2.3.4", "5.6.7.8"]`.
+    - Newline-delimited text with one entry per line.
+
+Functions:
+    iter_json_strings(chunks, max_token): Parses a JSON array of strings.
+    iter_lines(chunks, max_token): Parses newline-delimited text.
+"""
+
+import codecs
+import json
+import re
+from typing import AsyncIterator, List
+
+# Longest entry accepted, an IPv6 address with a zone is well below this
+MAX_TOKEN = 256
+
+_JSON_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_WHITESPACE = " \t\r\n"
+
+
+async def iter_json_strings(
+    chunks: AsyncIterator[bytes], max_token: int = MAX_TOKEN
+) -> AsyncIterator[List[str]]:
+    """
+    Parses a JSON array of strings incrementally.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The chunks of the body.
+        max_token (int): Longest entry accepted, in characters.
+
+    Yields:
+        List[str]: The strings completed by each chunk.
+
+    Raises:
+        ValueError: If the body is not a JSON array of strings.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    finished = False
+    expect_value = True
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        batch = []
+        pos = 0
+        while pos < len(buffer) and not finished:
+            char = buffer[pos]
+            if char in _WHITESPACE:
+                pos += 1
+            elif not started:
+                if char != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+            elif char == "]":
+                finished = True
+                pos += 1
+            elif char == "," and not expect_value:
+                expect_value = True
+                pos += 1
+            elif char == '"' and expect_value:
+                match = _JSON_STRING.match(buffer, pos)
+                if match is None:
+                    if len(buffer) - pos > max_token + 2:
+                        raise ValueError("Entry too long")
+                    break  # The string ends in a later chunk
+                value = match.group(1)
+                batch.append(json.loads(match.group(0)) if "\\" in value else value)
+                expect_value = False
+                pos = match.end()
+            else:
+                raise ValueError(f"Unexpected character {char!r} in JSON array")
+        buffer = buffer[pos:]
+        if finished and buffer.strip(_WHITESPACE):
+            raise ValueError("Unexpected data after the JSON array")
+        if batch:
+            yield batch
+    if not finished:
+        raise ValueError("Unterminated JSON array")
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_token: int = MAX_TOKEN
+) -> AsyncIterator[List[str]]:
+    """
+    Parses newline-delimited text incrementally, skipping blank lines.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The chunks of the body.
+        max_token (int): Longest line accepted, in characters.
+
+    Yields:
+        List[str]: The lines completed by each chunk, without whitespace.
+
+    Raises:
+        ValueError: If a line is longer than `max_token`.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        if len(tail) > max_token:
+            raise ValueError("Entry too long")
+        batch = [line.strip() for line in lines if line.strip()]
+        if batch:
+            yield batch
+    tail = (tail + decoder.decode(b"", final=True)).strip()
+    if tail:
+        yield [tail]
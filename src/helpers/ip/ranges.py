@@ -0,0 +1,315 @@
+"""
+Classification of IP addresses against large CIDR lists.
+
+This module compiles CIDR lists into an immutable range index. The networks of
+all the lists are swept into sorted, non-overlapping segments, and each segment
+carries the labels of every network covering it, so overlapping lists are
+handled once at build time. Classifying an address is then a binary search over
+the segment starts, O(log n) whatever the number of networks.
+
+Built-in labels cover the special-purpose ranges (private, loopback, link-local,
+multicast and reserved). Customer lists are read from files holding one CIDR
+per line, blank lines and "#" comments ignored.
+
+Indexes are never modified once built. The `PolicyStore` swaps in a new index
+when its files change, so readers always see a complete index.
+
+Environment Variables:
+    IP_POLICY_FILES (str): Comma separated "label=path" pairs of CIDR lists,
+        for instance "allow=/etc/ip/allow.txt,deny=/etc/ip/deny.txt".
+        Defaults to no customer lists.
+    IP_POLICY_RELOAD_INTERVAL (float): Seconds between checks of the list
+        files for changes. Defaults to 60.
+
+Classes:
+    RangeIndex: Immutable index of labeled IP ranges.
+    PolicyStore: Holder of the current index, reloaded when its files change.
+
+Functions:
+    builtin_networks(): The special-purpose networks and their labels.
+    read_networks(path, label): Reads a CIDR list file.
+    parse_policy_files(spec): Parses the IP_POLICY_FILES setting.
+"""
+
+import asyncio
+import ipaddress
+import os
+import socket
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from helpers.log.logger import init_log
+
+logger = init_log()
+
+IP_POLICY_FILES = os.getenv("IP_POLICY_FILES", "")
+IP_POLICY_RELOAD_INTERVAL = float(os.getenv("IP_POLICY_RELOAD_INTERVAL", "60"))
+
+BUILTIN_NETWORKS = {
+    "private": [
+        "10.0.0.0/8",
+        "172.16.0.0/12",
+        "192.168.0.0/16",
+        "100.64.0.0/10",
+        "fc00::/7",
+    ],
+    "loopback": ["127.0.0.0/8", "::1/128"],
+    "link_local": ["169.254.0.0/16", "fe80::/10"],
+    "multicast": ["224.0.0.0/4", "ff00::/8"],
+    "reserved": [
+        "0.0.0.0/8",
+        "192.0.0.0/24",
+        "192.0.2.0/24",
+        "198.18.0.0/15",
+        "198.51.100.0/24",
+        "203.0.113.0/24",
+        "240.0.0.0/4",
+        "::/128",
+        "2001:db8::/32",
+    ],
+}
+
+Network = Tuple[ipaddress._BaseNetwork, str]
+
+
+def builtin_networks() -> List[Network]:
+    """
+    Returns the special-purpose networks and their labels.
+
+    Returns:
+        List[Network]: (network, label) pairs.
+    """
+    return [
+        (ipaddress.ip_network(cidr), label)
+        for label, cidrs in BUILTIN_NETWORKS.items()
+        for cidr in cidrs
+    ]
+
+
+def read_networks(path: str, label: str) -> List[Network]:
+    """
+    Reads a CIDR list file.
+
+    Args:
+        path (str): The file to read, one CIDR or address per line.
+        label (str): The label given to every network of the file.
+
+    Returns:
+        List[Network]: (network, label) pairs.
+
+    Raises:
+        ValueError: If a line is not a valid network.
+    """
+    networks = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            cidr = line.split("#", 1)[0].strip()
+            if not cidr:
+                continue
+            try:
+                networks.append((ipaddress.ip_network(cidr, strict=False), label))
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {str(e)}") from e
+    return networks
+
+
+def parse_policy_files(spec: str) -> Dict[str, str]:
+    """
+    Parses the IP_POLICY_FILES setting.
+
+    Args:
+        spec (str): Comma separated "label=path" pairs.
+
+    Returns:
+        Dict[str, str]: The path of each label.
+    """
+    files = {}
+    for entry in spec.split(","):
+        if entry.strip():
+            label, _, path = entry.partition("=")
+            files[label.strip()] = path.strip()
+    return files
+
+
+class _Segments:
+    """Sorted segment starts of one address family with their labels."""
+
+    def __init__(self, starts: List[int], labels: List[Tuple[str, ...]]):
+        self.starts = starts
+        self.labels = labels
+
+    def lookup(self, value: int) -> Tuple[str, ...]:
+        index = bisect_right(self.starts, value) - 1
+        return self.labels[index] if index >= 0 else ()
+
+
+def _sweep(ranges: Iterable[Tuple[int, int, str]]) -> _Segments:
+    """
+    Splits possibly overlapping labeled ranges into disjoint segments.
+
+    Every range adds its label at its first address and removes it right after
+    its last one. Walking these events in address order gives the set of labels
+    active on each segment, and adjacent segments with the same set are merged.
+    """
+    events = []
+    for first, last, label in ranges:
+        events.append((first, 1, label))
+        events.append((last + 1, -1, label))
+    events.sort()
+
+    active: Dict[str, int] = {}
+    interned: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+    starts: List[int] = []
+    labels: List[Tuple[str, ...]] = []
+    i = 0
+    while i < len(events):
+        point = events[i][0]
+        while i < len(events) and events[i][0] == point:
+            _, delta, label = events[i]
+            active[label] = active.get(label, 0) + delta
+            if not active[label]:
+                del active[label]
+            i += 1
+        current = tuple(sorted(active))
+        current = interned.setdefault(current, current)
+        if not labels or labels[-1] != current:
+            starts.append(point)
+            labels.append(current)
+    return _Segments(starts, labels)
+
+
+class RangeIndex:
+    """
+    Immutable index of labeled IP ranges.
+
+    Attributes:
+        size (int): The number of networks the index was built from.
+    """
+
+    def __init__(self, networks: Iterable[Network]):
+        """
+        Builds the index.
+
+        Args:
+            networks (Iterable[Network]): (network, label) pairs, which may
+                overlap.
+        """
+        ranges: Dict[int, List[Tuple[int, int, str]]] = {4: [], 6: []}
+        for network, label in networks:
+            # Cheaper than network.broadcast_address, which builds a hostmask
+            first = int(network.network_address)
+            last = first | ((1 << (network.max_prefixlen - network.prefixlen)) - 1)
+            ranges[network.version].append((first, last, label))
+        self.size = len(ranges[4]) + len(ranges[6])
+        self._v4 = _sweep(ranges[4])
+        self._v6 = _sweep(ranges[6])
+
+    def segments(self) -> int:
+        """Returns the number of disjoint segments in the index."""
+        return len(self._v4.starts) + len(self._v6.starts)
+
+    def lookup_ipv4(self, value: int) -> Tuple[str, ...]:
+        """Returns the labels of an IPv4 address given as an integer."""
+        return self._v4.lookup(value)
+
+    def lookup_ipv6(self, value: int) -> Tuple[str, ...]:
+        """Returns the labels of an IPv6 address given as an integer."""
+        return self._v6.lookup(value)
+
+    def classify(self, address: str) -> Tuple[str, ...]:
+        """
+        Returns the labels of an address.
+
+        Args:
+            address (str): A valid IPv4 or IPv6 address.
+
+        Returns:
+            Tuple[str, ...]: The sorted labels of every network containing the
+            address, empty if none does.
+
+        Raises:
+            ValueError: If the address is not a valid IP address.
+        """
+        try:
+            return self._v4.lookup(int.from_bytes(socket.inet_aton(address), "big"))
+        except OSError:
+            pass
+        ip = ipaddress.ip_address(address)
+        if ip.version == 4:
+            return self._v4.lookup(int(ip))
+        return self._v6.lookup(int(ip))
+
+
+class PolicyStore:
+    """
+    Holder of the current range index, rebuilt when its list files change.
+
+    Attributes:
+        files (Dict[str, str]): The CIDR list file of each customer label.
+        index (RangeIndex): The current index, replaced as a whole on reload.
+    """
+
+    def __init__(self, files: Optional[Dict[str, str]] = None):
+        self.files = parse_policy_files(IP_POLICY_FILES) if files is None else files
+        self.index = RangeIndex(builtin_networks())
+        self._mtimes: Dict[str, float] = {}
+
+    def _stat(self) -> Dict[str, float]:
+        mtimes = {}
+        for path in self.files.values():
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = -1.0
+        return mtimes
+
+    def load(self) -> RangeIndex:
+        """
+        Builds a new index from the built-in networks and the list files, then
+        swaps it in.
+
+        Returns:
+            RangeIndex: The new index.
+
+        Raises:
+            OSError: If a list file cannot be read.
+            ValueError: If a list file holds an invalid network.
+        """
+        mtimes = self._stat()
+        networks = builtin_networks()
+        for label, path in self.files.items():
+            networks.extend(read_networks(path, label))
+        index = RangeIndex(networks)
+        self.index = index
+        self._mtimes = mtimes
+        logger.info(
+            f"IP policy index loaded: {index.size} networks, "
+            f"{index.segments()} segments"
+        )
+        return index
+
+    async def reload_if_changed(self) -> bool:
+        """
+        Rebuilds the index in the threadpool if a list file changed.
+
+        The current index stays in place if the new one cannot be built.
+
+        Returns:
+            bool: True if a new index was swapped in.
+        """
+        if not self.files or self._stat() == self._mtimes:
+            return False
+        try:
+            await run_in_threadpool(self.load)
+            return True
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to reload the IP policy index: {str(e)}")
+            return False
+
+    async def watch(self, interval: float = IP_POLICY_RELOAD_INTERVAL):
+        """Checks the list files for changes every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.reload_if_changed()
@@ -0,0 +1,54 @@
+"""
+Bulk IP address validation.
+
+This module validates many addresses in a tight loop. IPv4 addresses, by far
+the most common input, are checked with a precompiled pattern that follows the
+rules of `ipaddress.IPv4Address` (four decimal octets up to 255, no leading
+zeros), so bad addresses cost a failed match instead of a raised and caught
+exception. Only strings that can be IPv6 addresses fall back to the
+`ipaddress` module.
+
+Functions:
+    validate_ips(addresses): Validates a list of addresses.
+"""
+
+import ipaddress
+import re
+from typing import List, Optional
+
+_OCTET = r"(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])"
+IPV4_PATTERN = re.compile(rf"{_OCTET}(?:\.{_OCTET}){{3}}")
+
+
+def _is_ipv6(address: str) -> bool:
+    """Checks an address that contains a colon with the ipaddress module."""
+    try:
+        ipaddress.IPv6Address(address)
+        return True
+    except ValueError:
+        return False
+
+
+def validate_ips(addresses: List[str]) -> List[Optional[bool]]:
+    """
+    Validates a list of IP addresses.
+
+    Args:
+        addresses (List[str]): The addresses to validate.
+
+    Returns:
+        List[Optional[bool]]: For each address, True if it is a valid IPv4
+        address, False if it is a valid IPv6 address and None if it is not an
+        IP address, the same outcomes as the /validate endpoint.
+    """
+    match = IPV4_PATTERN.fullmatch
+    results: List[Optional[bool]] = []
+    append = results.append
+    for address in addresses:
+        if match(address):
+            append(True)
+        elif ":" in address and _is_ipv6(address):
+            append(False)
+        else:
+            append(None)
+    return results
@@ -6,7 +6,8 @@ middleware, routers, and a graceful shutdown mechanism. It includes:
     - HTTPS redirection middleware for production environments.
     - Global rate-limiting middleware.
     - Security middleware for security headers and access restrictions.
-    - Custom routes for health, metrics, tools, history, and root endpoints.
+    - Custom routes for health, metrics, tools, history, stats, resolutions
+      and root endpoints.
     - Graceful shutdown logic to manage database connections.
 
 Environment Variables:
@@ -19,25 +20,30 @@ Middleware:
     HTTPSRedirectMiddleware: Redirects HTTP traffic to HTTPS in production.
 
 Routers:
-    health: Health check endpoint.
+    health: Health, liveness and readiness endpoints.
     metric: Metric endpoints.
     tools: Tool-related endpoints.
     history: History-related endpoints.
+    stats: Domain query statistics endpoints.
+    resolutions: Domain resolution endpoints.
     root: Root-level endpoints.
 """
 
-# import asyncio
+import asyncio
 import os
 import sys
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 
 # Https redirect Middleware
 # from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 
 # from db.database import check_db_connection, get_db
-from db.database import get_db
+from db.database import dispose_engines, replicas, warm_up_pools
+from db.partitions import PartitionMaintainer
+from helpers.dns.cache import DNS_CACHE_SNAPSHOT_PATH
 from helpers.log.logger import init_log
 
 # Rate limit Middleware
@@ -45,7 +51,7 @@ from middleware.rate_limit import GlobalRateLimitMiddleware  # Import custom mid
 
 # Security Middleware
 # from middleware.security import SecurityMiddleware  # Import security middleware
-from routers import health, history, metric, root, tools
+from routers import health, history, metric, resolutions, root, stats, tools
 
 APP_VERSION = os.getenv("APP_VERSION", "0.0.1")
 RETRY_LIMIT = int(os.getenv("RETRY_LIMIT", "10"))
@@ -55,9 +61,6 @@ sys.path.append("routers")
 sys.path.append("helpers")
 sys.path.append("middleware")
 
-# Initialize the database
-db = get_db()
-
 # Initialize loggers
 logger = init_log()
 logger.info("Hello start APP !!")
@@ -69,8 +72,13 @@ async def app_lifespan(status):
     """
     Context manager for managing app lifespan.
 
-    Handles application startup and graceful shutdown, including retry
-    logic for database connection and closing the DB connection during shutdown.
+    Handles application startup and graceful shutdown. On startup it starts
+    the query log writer, checks the read replicas, opens the pooled DB
+    connections, probes the health of the services, maintains the query log
+    partitions, loads the IP policy index and watches its files, restores and
+    snapshots the DNS cache and refreshes its popular domains. On shutdown it
+    stops the background tasks, saves the DNS cache, drains the query log queue
+    and closes the DB connections.
     """
     logger.info("Application lifespan started")
     # Retry logic for DB connection if necessary
@@ -86,9 +94,45 @@ async def app_lifespan(status):
 
     #        logger.critical("Failed to connect to database after retries")
     #        sys.exit(1)
+    # Start the write-behind query logger
+    tools.query_log_writer.start()
+    # Find the usable read replicas before serving, then keep checking them
+    await replicas.check()
+    replica_watcher = asyncio.create_task(replicas.watch())
+    # Open the pooled connections now rather than on the first requests
+    await warm_up_pools()
+    # Check the services before serving, then keep checking them in the
+    # background for the health endpoints
+    await health.prober.check()
+    health_prober = asyncio.create_task(health.prober.run())
+    # Keep the query log partitions ahead of the clock and drop expired ones
+    partition_maintainer = asyncio.create_task(PartitionMaintainer().run())
+    # Build the IP policy index off the loop, then swap it when its files change
+    await run_in_threadpool(tools.ip_policy.load)
+    policy_watcher = asyncio.create_task(tools.ip_policy.watch())
+    # Start with the DNS answers of the previous run, then snapshot periodically
+    cache_snapshots = None
+    if DNS_CACHE_SNAPSHOT_PATH:
+        await tools.dns_cache.restore(DNS_CACHE_SNAPSHOT_PATH)
+        cache_snapshots = asyncio.create_task(
+            tools.dns_cache.persist(DNS_CACHE_SNAPSHOT_PATH)
+        )
+    # Renew the popular cached domains before they expire
+    dns_refresher = asyncio.create_task(tools.dns_refresher.run())
     yield  # The app runs here
     logger.info("Shutting down gracefully...")
-    db.close()
+    health_prober.cancel()
+    policy_watcher.cancel()
+    partition_maintainer.cancel()
+    replica_watcher.cancel()
+    dns_refresher.cancel()
+    if cache_snapshots is not None:
+        cache_snapshots.cancel()
+        await tools.dns_cache.save(DNS_CACHE_SNAPSHOT_PATH)
+    # Write the queued query logs before the database connection is closed
+    await tools.query_log_writer.stop()
+    await tools.resolver.close()
+    await dispose_engines()
 
 
 app = FastAPI(lifespan=app_lifespan)
@@ -105,4 +149,6 @@ app.include_router(health.router, prefix="")
 app.include_router(metric.router, prefix="")
 app.include_router(tools.router, prefix="/v1")
 app.include_router(history.router, prefix="/v1")
+app.include_router(stats.router, prefix="/v1")
+app.include_router(resolutions.router, prefix="/v1")
 app.include_router(root.router, prefix="")
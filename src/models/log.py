@@ -2,11 +2,14 @@
 models/log.py
 
 This module defines the `QueryLog` model for storing domain query logs in the
-database. Each log contains the queried domain, the client's IP address, and
-the timestamp when the query was made.
+database. Each log references the queried domain and the resolution it was
+answered with, see `models.resolution`, and holds the timestamp when the query
+was made.
+
+The table is partitioned by range of `created_time`, see `db.partitions`.
 """
 
-from sqlalchemy import Column, DateTime, Integer, String, func
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, func
 
 from .base import Base
 
@@ -16,18 +19,46 @@ class QueryLog(Base):
     SQLAlchemy model for the 'query_log' table.
 
     This model stores logs of domain queries, including the queried domain,
-    client IP address (if available), and the time the query was made.
+    the resolution answering the query (if available), and the time the query
+    was made.
 
     Attributes:
-        queryID (int): The primary key ID of the query log.
-        domain (str): The domain that was queried.
-        client_ip (str): The IP address of the client making the query.
-        created_time (datetime): The timestamp when the query was made.
+        queryID (int): The ID of the query log, part of the primary key.
+        domainID (int): The domain that was queried.
+        resolutionID (int): The resolution holding the resolved addresses.
+        created_time (datetime): The timestamp when the query was made, the
+            partition key and the rest of the primary key.
     """
 
     __tablename__ = "query_log"
 
-    queryID = Column(Integer, primary_key=True, index=True)
-    domain = Column(String, nullable=False)
-    client_ip = Column(String, nullable=True)
-    created_time = Column(DateTime(timezone=True), server_default=func.now())
+    queryID = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    domainID = Column(Integer, ForeignKey("domain.domainID"), nullable=False)
+    resolutionID = Column(Integer, ForeignKey("resolution.resolutionID"), nullable=True)
+    # The partition key has to be part of the primary key
+    created_time = Column(
+        DateTime(timezone=True),
+        primary_key=True,
+        nullable=False,
+        server_default=func.now(),
+    )
+
+    __table_args__ = (
+        # Keyset pagination of the history, newest first
+        Index("ix_query_log_created_time_queryID", "created_time", "queryID"),
+        # History of a domain, paginated the same way
+        Index(
+            "ix_query_log_domainID_created_time",
+            "domainID",
+            "created_time",
+            "queryID",
+        ),
+        # Time range scans, tiny since rows are inserted in time order
+        Index(
+            "ix_query_log_created_time_brin",
+            "created_time",
+            postgresql_using="brin",
+            postgresql_with={"autosummarize": "on"},
+        ),
+        {"postgresql_partition_by": "RANGE (created_time)"},
+    )
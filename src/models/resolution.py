@@ -0,0 +1,94 @@
+"""
+models/resolution.py
+
+This module defines the normalized models of the domain resolutions logged by
+the lookups. Domain names are interned in the `domain` table, and each
+resolution, a run of lookups of a domain answered with the same address set,
+is stored once in `resolution` with its addresses as `inet` values in
+`resolution_address`. Query logs only reference the domain and the resolution
+they were answered with. Each resolution counts its lookups, so the resolutions
+of a domain tell when its addresses changed and how often each answer was
+given, even when lookups are not logged one by one.
+
+The addresses are indexed with GiST, so the domains that resolved to an
+address or a network are found without scanning the logs.
+"""
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy.dialects.postgresql import INET
+
+from .base import Base
+
+
+class Domain(Base):
+    """
+    SQLAlchemy model for the 'domain' table.
+
+    Attributes:
+        domainID (int): The ID of the domain.
+        name (str): The domain name, unique.
+        resolutionID (int): The latest resolution of the domain, None until the
+            domain is first logged.
+    """
+
+    __tablename__ = "domain"
+
+    domainID = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+    # Not a foreign key, resolutions already reference their domain
+    resolutionID = Column(Integer, nullable=True)
+
+
+class Resolution(Base):
+    """
+    SQLAlchemy model for the 'resolution' table.
+
+    Attributes:
+        resolutionID (int): The ID of the resolution.
+        domainID (int): The domain resolved.
+        first_seen (datetime): The time of the first lookup of the run.
+        last_seen (datetime): The time of the last lookup of the run.
+        lookups (int): The number of lookups of the run.
+    """
+
+    __tablename__ = "resolution"
+
+    resolutionID = Column(Integer, primary_key=True, autoincrement=True)
+    domainID = Column(Integer, ForeignKey("domain.domainID"), nullable=False)
+    first_seen = Column(DateTime(timezone=True), nullable=False)
+    last_seen = Column(DateTime(timezone=True), nullable=False)
+    lookups = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        # Resolutions of a domain in time order
+        Index("ix_resolution_domainID_first_seen", "domainID", "first_seen"),
+    )
+
+
+class ResolutionAddress(Base):
+    """
+    SQLAlchemy model for the 'resolution_address' table.
+
+    Attributes:
+        resolutionID (int): The resolution answered with the address.
+        address (str): An address of the answer, as an `inet`.
+    """
+
+    __tablename__ = "resolution_address"
+
+    resolutionID = Column(
+        Integer,
+        ForeignKey("resolution.resolutionID", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    address = Column(INET, primary_key=True)
+
+    __table_args__ = (
+        # Reverse lookups, by address or by containing network
+        Index(
+            "ix_resolution_address_address",
+            "address",
+            postgresql_using="gist",
+            postgresql_ops={"address": "inet_ops"},
+        ),
+    )
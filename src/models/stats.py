@@ -0,0 +1,46 @@
+"""
+models/stats.py
+
+This module defines the rollup models holding the domain query statistics.
+They are kept up to date by the query log writer, which adds the counts of
+each batch of logged lookups to them, so statistics are read from a few rows
+per time bucket instead of from the raw query logs.
+"""
+
+from sqlalchemy import BigInteger, Column, Date, DateTime, String
+
+from .base import Base
+
+
+class QueryStatsMinute(Base):
+    """
+    SQLAlchemy model for the 'query_stats_minute' table.
+
+    Attributes:
+        bucket (datetime): The UTC minute counted.
+        queries (int): The number of queries logged during the minute.
+    """
+
+    __tablename__ = "query_stats_minute"
+
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    queries = Column(BigInteger, nullable=False)
+
+
+class DomainStatsDaily(Base):
+    """
+    SQLAlchemy model for the 'domain_stats_daily' table.
+
+    Attributes:
+        day (date): The UTC day counted.
+        domain (str): The domain queried.
+        queries (int): The number of queries of the domain during the day.
+        last_seen (datetime): The time of the last query of the domain that day.
+    """
+
+    __tablename__ = "domain_stats_daily"
+
+    day = Column(Date, primary_key=True)
+    domain = Column(String, primary_key=True)
+    queries = Column(BigInteger, nullable=False)
+    last_seen = Column(DateTime(timezone=True), nullable=False)
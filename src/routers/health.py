@@ -2,33 +2,40 @@
 Health Check Module for FastAPI applications.
 
 This module provides endpoints for monitoring the health of the application and its
-core services. It features dynamic service checks, including database and cache
-systems, and reports their health status along with service-specific latencies.
-It utilizes FastAPI's asynchronous capabilities to perform non-blocking checks.
+core services. The services are checked in the background by a `HealthProber`,
+started with the app, each on its own interval and through the shared
+connection pools, so the endpoints only return the latest results and answer
+immediately whatever the number and frequency of the probes.
 
 Classes:
     ServiceStatus: Represents the health status of a service.
     HealthCheckResponse: Aggregates overall health information of the application.
+    ProbeResponse: Represents the answer of the liveness and readiness probes.
 
 Functions:
-    check_database_connection: Checks and reports the health of the database.
-    check_redis_connection: Checks and reports the health of the Redis cache.
-    check_service: Orchestrates service checks and aggregates results.
+    check_database_connection: Checks the database through the shared pool.
     health_check: Endpoint function that reports the application's overall health.
+    liveness: Endpoint function that reports the process is serving.
+    readiness: Endpoint function that reports whether the app can take traffic.
+
+Attributes:
+    prober (HealthProber): The background checker of the services.
 
 Usage:
-    Add this module to a FastAPI application to enable health monitoring endpoints.
+    Add this module to a FastAPI application to enable health monitoring
+    endpoints, and run `prober.run()` for the lifetime of the app.
 """
 
-import time
-import asyncio
 import os
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional
-from sqlalchemy import create_engine
-from fastapi import APIRouter
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from fastapi import APIRouter, Response
 from pydantic import BaseModel
 
+from db.database import async_engine
+from helpers.health.prober import HealthProber
+
 
 router = APIRouter()
 
@@ -44,13 +51,16 @@ class ServiceStatus(BaseModel):
 
     Attributes:
         name (str): The name of the service being checked.
-        status (str): The health status ('healthy' or 'unhealthy').
+        status (str): The health status ('healthy', 'unhealthy' or 'unknown'
+            before the first check).
         latency (Optional[float]): Time taken to check the service in seconds.
+        checked_at (Optional[datetime]): When the service was last checked.
     """
 
     name: str
     status: str
     latency: Optional[float] = None
+    checked_at: Optional[datetime] = None
 
 
 class HealthCheckResponse(BaseModel):
@@ -71,71 +81,49 @@ class HealthCheckResponse(BaseModel):
     services: List[ServiceStatus]
 
 
-async def check_database_connection():
+class ProbeResponse(BaseModel):
     """
-    Simulate a check for the database connection. This function should connect to
-    the database and perform a simple query to verify connectivity and measure latency.
+    Model for the answer of the liveness and readiness probes.
 
-    Returns:
-        float: Time taken to establish the connection and query the database.
+    Attributes:
+        status (str): "alive", "ready" or "not ready".
+        services (Dict[str, str]): The status of each service, for readiness.
     """
-    # Database URL: replace with your PostgreSQL credentials
-
-    POSTGRES_USER = os.getenv("POSTGRES_USER", "default_user")
-    POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "default_pass")
-    POSTGRES_DB = os.getenv("POSTGRES_DB", "default_db")
-    POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
-    POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
-
-    url = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"  # noqa: E501  # pylint: disable=C0301
-
-    start = time.time()
-    engine = create_engine(url)
-
-    try:
-        await engine.connect()
-        return True
-    finally:
-        return time.time() - start
 
+    status: str
+    services: Dict[str, str] = {}
 
-services_to_check = {
-    "database": check_database_connection,
-    # Additional services can be added here
-}
 
+async def check_database_connection():
+    """
+    Check the database connection. This function runs a simple query on a
+    connection of the shared pool of the async engine.
 
-async def check_service(name, function):
+    Raises:
+        Exception: If the database cannot be reached.
     """
-    Perform a health check for a specific service using the provided function, capturing
-    the latency of the check.
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
 
-    Args:
-        name (str): Name of the service.
-        function (callable): Async function to execute for the service check.
 
-    Returns:
-        ServiceStatus: The status and latency of the service after the check.
-    """
-    try:
-        latency = await function()
-        return ServiceStatus(name=name, status="healthy", latency=latency)
-    except Exception:
-        return ServiceStatus(name=name, status="unhealthy", latency=None)
+prober = HealthProber()
+prober.register("database", check_database_connection)
+# Additional services can be registered here
 
 
 @router.get("/health", response_model=HealthCheckResponse)
 async def health_check():
     """
-    Endpoint to perform a health check on the application. It checks all registered
-    services and aggregates their status and latency into a comprehensive health report.
+    Endpoint to report the health of the application. It aggregates the latest
+    status and latency of every registered service into a health report.
 
     Returns:
         HealthCheckResponse: The aggregated health status of the application.
     """
-    services_status = await asyncio.gather(
-        *[check_service(name, func) for name, func in services_to_check.items()]
-    )
+    services_status = [
+        ServiceStatus(name=name, **health._asdict())
+        for name, health in prober.snapshot().items()
+    ]
     overall_status = (
         "healthy"
         if all(service.status == "healthy" for service in services_status)
@@ -150,3 +138,38 @@ async def health_check():
         version=APP_VERSION,
         services=services_status,
     )
+
+
+@router.get("/livez", response_model=ProbeResponse)
+async def liveness():
+    """
+    Endpoint for liveness probes. It answers as long as the app serves
+    requests, whatever the state of its services, so an outage of the database
+    does not get the app restarted.
+
+    Returns:
+        ProbeResponse: The "alive" status.
+    """
+    return ProbeResponse(status="alive")
+
+
+@router.get("/readyz", response_model=ProbeResponse)
+async def readiness(response: Response):
+    """
+    Endpoint for readiness probes. It answers 503 while a critical service is
+    unhealthy or not checked yet, so no traffic is sent to the app until it
+    can serve it.
+
+    Args:
+        response (Response): The response, whose status code is set.
+
+    Returns:
+        ProbeResponse: "ready" or "not ready", with the status of each service.
+    """
+    ready = prober.ready()
+    if not ready:
+        response.status_code = 503
+    return ProbeResponse(
+        status="ready" if ready else "not ready",
+        services={name: health.status for name, health in prober.snapshot().items()},
+    )
@@ -6,26 +6,107 @@ history from the database.It also integrates with Prometheus
 for tracking request metrics and logs activity
 using a custom logger.
 
+Pages select only the columns they return, with a Core query, and their rows
+are serialized straight to JSON bytes instead of going through ORM objects and
+a Pydantic model per row. The domain name of an entry is joined from the
+interned domains, and its resolved addresses are aggregated from its
+resolution, see `models.resolution`.
+
+History is paginated with keyset cursors: entries are ordered by
+(created_time, queryID) descending and the cursor of a page is the key of its
+last entry. The next page starts right after that key, so it is read from the
+matching composite index whatever the depth of the page, instead of counting
+and skipping the previous rows like an OFFSET would. Pages can be filtered by
+domain, served by the (domainID, created_time, queryID) index, and by time range.
+
+The latest entries are polled heavily, so the serialized first page of the
+unfiltered history is cached in process. The query log writer invalidates the
+cache after each batch it commits, and entries also expire after a short TTL
+for the writes of other instances. Pages carry strong ETags, so unchanged polls
+get an empty 304 response.
+
+The full history is exported by a second endpoint streaming NDJSON or CSV from
+a server-side cursor. Rows are fetched in batches of a bounded size, so memory
+stays constant whatever the number of rows. Queries go through the async engine
+and run on the event loop. The query is run before the response starts, so an
+export that cannot start fails with 500.
+
+Both endpoints read from a read replica when one is usable, see `db.replicas`.
+
 Classes:
     QueryLogResponse: Pydantic model representing a query log entry.
 
+Functions:
+    encode_cursor(created_time, query_id): Builds the cursor following an entry.
+    decode_cursor(cursor): Reads the key of a cursor.
+    select_history(): Builds the query selecting the columns of the entries.
+    history_statement(limit, after, domain, since, until): Builds the query of
+    a history page.
+    serialize_history(rows): Serializes history rows to JSON bytes.
+    history_response(cached, if_none_match): Sends a serialized page or 304.
+    stream_export(connection, result, export_format, start_time): Streams the
+    rows of a query in the export format.
+
+Environment Variables:
+    HISTORY_PAGE_SIZE (int): Number of entries of a page when the client does
+        not ask for a size. Defaults to 20.
+    HISTORY_MAX_PAGE_SIZE (int): Largest page size served, larger requested
+        sizes are capped. Defaults to 500.
+    HISTORY_CACHE_TTL (float): Longest time in seconds the cached first page
+        is served, 0 disables the cache. Defaults to 2.
+    HISTORY_EXPORT_FETCH_SIZE (int): Number of rows fetched from the cursor at
+        a time by default. Defaults to 1000.
+    HISTORY_EXPORT_MAX_FETCH_SIZE (int): Largest fetch size a client may ask
+        for. Defaults to 10000.
+
+Metrics:
+    HISTORY_CACHE_LOOKUPS: A counter of history cache lookups, by result.
+    HISTORY_NOT_MODIFIED: A counter of history requests answered with 304.
+    REQUEST_COUNTER_HISTORY_EXPORT: A counter for the total number of requests
+    to the /history/export endpoint.
+    HISTORY_EXPORT_ROWS: A counter for the total number of rows exported.
+    HISTORY_EXPORT_DURATION: A histogram tracking the duration of exports,
+    until the last row is sent.
+
 Routes:
-    /history: A GET endpoint that returns the last 20 query log entries.
+    /history: A GET endpoint that returns a page of query log entries, the most
+    recent first.
+    /history/export: A GET endpoint streaming the query log entries of a time
+    range as NDJSON or CSV, the oldest first.
 """
 
+import base64
+import csv
+import io
+import json
+import os
 import sys
 from datetime import datetime
 from time import time
-from typing import List
+from typing import List, Literal, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+import anyio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from prometheus_client import Counter, Histogram
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from pydantic_core import to_json
+from sqlalchemy import Select, Text, cast, func, select, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncResult, AsyncSession
 
-from db.database import get_db
+from db.database import get_read_db, replicas
+from db.resolutions import domain_key
+from db.writer import on_query_logs_written
+from helpers.http.cache import (
+    CachedResponse,
+    ResponseCache,
+    etag_matches,
+    make_etag,
+)
 from helpers.log.logger import init_log
 from models.log import QueryLog
+from models.resolution import Domain, ResolutionAddress
 
 sys.path = ["", ".."] + sys.path[1:]
 sys.path.append("src")
@@ -33,6 +114,17 @@ sys.path.append("src")
 router = APIRouter()
 logger = init_log()
 
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "2"))
+HISTORY_EXPORT_FETCH_SIZE = int(os.getenv("HISTORY_EXPORT_FETCH_SIZE", "1000"))
+HISTORY_EXPORT_MAX_FETCH_SIZE = int(os.getenv("HISTORY_EXPORT_MAX_FETCH_SIZE", "10000"))
+
+# Columns of the history pages and exports, in the order of QueryLogResponse
+HISTORY_COLUMNS = ("queryID", "domain", "client_ip", "created_time")
+EXPORT_COLUMNS = HISTORY_COLUMNS
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
 # Define Prometheus metrics
 REQUEST_COUNTER_HISTORY = Counter(
     "history_app_requests_total", "Total number of requests on history endpoint"
@@ -47,6 +139,17 @@ REQUEST_LATENCY_HISTORY = Histogram(
 )
 
 
+HISTORY_CACHE_LOOKUPS = Counter(
+    "history_cache_lookups_total",
+    "Total number of history cache lookups, by result",
+    ["result"],
+)
+HISTORY_NOT_MODIFIED = Counter(
+    "history_not_modified_total",
+    "Total number of history requests answered with 304 Not Modified",
+)
+
+
 # Pydantic model for each query log entry
 class QueryLogResponse(BaseModel):
     """
@@ -78,48 +181,403 @@ class QueryLogResponse(BaseModel):
         from_attributes = True  # Enable compatibility with SQLAlchemy models
 
 
+# Serialized first pages, emptied whenever query logs are written
+history_cache = ResponseCache(HISTORY_CACHE_TTL)
+on_query_logs_written(history_cache.invalidate)
+
+
+def encode_cursor(created_time: datetime, query_id: int) -> str:
+    """
+    Builds the cursor of the page following an entry.
+
+    Args:
+        created_time (datetime): The creation time of the last entry of a page.
+        query_id (int): The ID of the last entry of a page.
+
+    Returns:
+        str: An opaque, URL-safe cursor.
+    """
+    key = f"{created_time.isoformat()},{query_id}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Reads the key of a cursor built by `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor sent by the client.
+
+    Returns:
+        Tuple[datetime, int]: The creation time and ID after which the page
+        starts.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_time, query_id = (
+            base64.urlsafe_b64decode(padded.encode()).decode().split(",")
+        )
+        return datetime.fromisoformat(created_time), int(query_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def select_history() -> Select:
+    """
+    Builds the query selecting the HISTORY_COLUMNS of the query logs.
+
+    The domain name is joined from `domain`, and the resolved addresses are
+    aggregated from `resolution_address` into the Postgres array text, such as
+    "{93.184.216.34}", that the entries returned when the addresses were stored
+    with them.
+
+    Returns:
+        Select: The query, without filter nor order.
+    """
+    client_ip = (
+        select(
+            func.coalesce(
+                cast(
+                    func.array_agg(
+                        aggregate_order_by(
+                            func.host(ResolutionAddress.address),
+                            ResolutionAddress.address,
+                        )
+                    ),
+                    Text,
+                ),
+                "{}",
+            )
+        )
+        .where(ResolutionAddress.resolutionID == QueryLog.resolutionID)
+        .scalar_subquery()
+    )
+    return select(
+        QueryLog.queryID,
+        Domain.name.label("domain"),
+        client_ip.label("client_ip"),
+        QueryLog.created_time,
+    ).join_from(QueryLog, Domain, Domain.domainID == QueryLog.domainID)
+
+
+def history_statement(
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    domain: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Select:
+    """
+    Builds the query of a history page, the most recent entries first.
+
+    Args:
+        limit (int): The maximum number of entries selected.
+        after (Optional[Tuple[datetime, int]]): The key of the last entry of the
+            previous page, None for the first page.
+        domain (Optional[str]): Only select the entries of this domain, in
+            any case.
+        since (Optional[datetime]): Only select entries created at or after
+            this time.
+        until (Optional[datetime]): Only select entries created before this
+            time.
+
+    Returns:
+        Select: The query selecting the HISTORY_COLUMNS of the entries.
+    """
+    statement = select_history()
+    if domain is not None:
+        domain_id = select(Domain.domainID).where(Domain.name == domain_key(domain))
+        statement = statement.where(QueryLog.domainID == domain_id.scalar_subquery())
+    if since is not None:
+        statement = statement.where(QueryLog.created_time >= since)
+    if until is not None:
+        statement = statement.where(QueryLog.created_time < until)
+    if after is not None:
+        statement = statement.where(
+            tuple_(QueryLog.created_time, QueryLog.queryID) < tuple_(*after)
+        )
+    return statement.order_by(
+        QueryLog.created_time.desc(), QueryLog.queryID.desc()
+    ).limit(limit)
+
+
+def serialize_history(rows: list) -> bytes:
+    """
+    Serializes history rows to the JSON list of QueryLogResponse.
+
+    Rows go straight to JSON bytes, with the serializer pydantic uses for the
+    models, so the output is the same without building a model per row.
+
+    Args:
+        rows (list): (queryID, domain, client_ip, created_time) rows.
+
+    Returns:
+        bytes: The JSON body of the page.
+    """
+    return to_json(
+        [
+            {
+                "queryID": query_id,
+                "domain": domain,
+                "client_ip": client_ip,
+                "created_time": created_time,
+            }
+            for query_id, domain, client_ip, created_time in rows
+        ]
+    )
+
+
+def history_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    """Sends a serialized history page, or 304 if the client has it already."""
+    headers = {**cached.headers, "ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        HISTORY_NOT_MODIFIED.inc()
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+
 @router.get("/history", response_model=List[QueryLogResponse])
-def get_history(db: Session = Depends(get_db)):
+async def get_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None,
+    domain: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+):
     """
-    Retrieves the latest 20 query logs from the database.
+    Retrieves a page of query logs from the database, the most recent first.
+
+    This endpoint queries the database for the page of query logs following
+    `cursor` and returns them. When more entries follow, the cursor of the next
+    page is sent in the X-Next-Cursor header, to be used with the same filters.
+    It also tracks request latency and errors using Prometheus.
 
-    This endpoint queries the database for the most recent 20 query logs
-    and returns them. It also tracks request latency and errors using Prometheus.
+    The serialized first page of the unfiltered history is cached until the
+    next query logs are written, or for at most HISTORY_CACHE_TTL seconds.
+    Every page carries a strong ETag, and a request whose If-None-Match holds
+    it gets a 304 response without a body.
 
     Args:
-        db (Session): The SQLAlchemy session used to interact with the database.
+        limit (int): The number of entries of the page, capped at
+            HISTORY_MAX_PAGE_SIZE.
+        cursor (Optional[str]): The X-Next-Cursor of the previous page, None for
+            the first page.
+        domain (Optional[str]): Only return the entries of this domain.
+        since (Optional[datetime]): Only return entries created at or after
+            this time.
+        until (Optional[datetime]): Only return entries created before this
+            time.
+        if_none_match (Optional[str]): The ETags of the pages the client has.
+        db (AsyncSession): The SQLAlchemy session used to interact with the
+            database.
 
     Returns:
-        List[QueryLogResponse]: A list of the latest 20 query logs.
+        Response: A page of query logs as a JSON list of QueryLogResponse, or
+        an empty 304 response.
 
     Raises:
-        HTTPException: If no records are found (404) or in case of a server error (500).
+        HTTPException: If the cursor is invalid (400), if the history is empty
+        (404) or in case of a server error (500). A filter matching no entry
+        gives an empty page.
     """
     start_time = time()  # Track the start time for latency measurement
     # Increment the Prometheus counter
     REQUEST_COUNTER_HISTORY.inc()
 
     # Log the request
-    logger.info("/history requested")
+    logger.info(f"/history requested (domain={domain}, {since} - {until})")
+
+    limit = min(limit, HISTORY_MAX_PAGE_SIZE)
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            logger.error(str(e))
+            raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+    filtered = domain is not None or since is not None or until is not None
+    cacheable = after is None and not filtered
+    generation = history_cache.generation
+    if cacheable:
+        cached = history_cache.get(limit)
+        HISTORY_CACHE_LOOKUPS.labels(result="miss" if cached is None else "hit").inc()
+        if cached is not None:
+            # Neither the database nor the serialization is needed
+            REQUEST_LATENCY_HISTORY.observe(time() - start_time)
+            return history_response(cached, if_none_match)
 
     try:
-        # Fetch the history and handle potential errors
-        history = (
-            db.query(QueryLog).order_by(QueryLog.created_time.desc()).limit(20).all()
-        )
+        # Fetch one more entry than asked to know if another page follows
+        statement = history_statement(limit + 1, after, domain, since, until)
+        history = (await db.execute(statement)).all()
 
-        if not history:
+        if not history and after is None and not filtered:
             logger.warning("No history found")
             raise HTTPException(status_code=404, detail="No history records found")
+        headers = {}
+        if len(history) > limit:
+            history = history[:limit]
+            last = history[-1]
+            headers["X-Next-Cursor"] = encode_cursor(last.created_time, last.queryID)
+        body = serialize_history(history)
+        if cacheable:
+            page = history_cache.put(limit, body, headers, generation)
+        else:
+            page = CachedResponse(body, make_etag(body), headers, start_time)
         # Log success with latency
         request_latency = time() - start_time
         REQUEST_LATENCY_HISTORY.observe(request_latency)
         logger.info(f"History served in {request_latency:.4f} seconds")
-        return history
+        return history_response(page, if_none_match)
 
+    except HTTPException:
+        raise
     except Exception as e:
         # Log the error and increment error counter
         ERROR_COUNTER_HISTORY.inc()
         # Log the error and return an appropriate response
         logger.error(f"Failed to fetch history: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error") from e
+
+
+REQUEST_COUNTER_HISTORY_EXPORT = Counter(
+    "history_export_app_requests_total",
+    "Total number of requests on history export endpoint",
+)
+HISTORY_EXPORT_ROWS = Counter(
+    "history_export_rows_total", "Total number of query log rows exported"
+)
+HISTORY_EXPORT_DURATION = Histogram(
+    "history_export_duration_seconds", "Duration of /history/export responses"
+)
+
+
+def format_rows(rows: list, export_format: str) -> str:
+    """Formats a batch of exported rows as NDJSON or CSV lines."""
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for query_id, domain, client_ip, created_time in rows:
+            writer.writerow((query_id, domain, client_ip, created_time.isoformat()))
+        return buffer.getvalue()
+    lines = (
+        json.dumps(
+            {
+                "queryID": query_id,
+                "domain": domain,
+                "client_ip": client_ip,
+                "created_time": created_time.isoformat(),
+            }
+        )
+        for query_id, domain, client_ip, created_time in rows
+    )
+    return "".join(f"{line}\n" for line in lines)
+
+
+async def stream_export(
+    connection: AsyncConnection,
+    result: AsyncResult,
+    export_format: str,
+    start_time: float,
+):
+    """
+    Streams the rows of a query from a server-side cursor, then closes its
+    connection.
+
+    The connection is held for the whole transfer, and batches are fetched on
+    the event loop while the client reads the previous ones.
+
+    Args:
+        connection (AsyncConnection): The connection the query runs on.
+        result (AsyncResult): The streamed result of the query selecting the
+            exported columns.
+        export_format (str): "ndjson" or "csv".
+        start_time (float): The time the request was received.
+
+    Yields:
+        str: The lines of each batch of rows.
+    """
+    exported = 0
+    try:
+        if export_format == "csv":
+            yield ",".join(EXPORT_COLUMNS) + "\n"
+        async for rows in result.partitions():
+            exported += len(rows)
+            HISTORY_EXPORT_ROWS.inc(len(rows))
+            yield format_rows(rows, export_format)
+        logger.info(f"Exported {exported} query logs")
+    except Exception as e:
+        # Headers are already sent, the client sees a truncated export
+        ERROR_COUNTER_HISTORY.inc()
+        logger.error(f"History export failed after {exported} rows: {str(e)}")
+    finally:
+        # Release the cursor even when the client went away mid-transfer
+        with anyio.CancelScope(shield=True):
+            await connection.close()
+        HISTORY_EXPORT_DURATION.observe(time() - start_time)
+
+
+@router.get("/history/export")
+async def export_history(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fetch_size: int = Query(
+        HISTORY_EXPORT_FETCH_SIZE, ge=1, le=HISTORY_EXPORT_MAX_FETCH_SIZE
+    ),
+):
+    """
+    Exports the query logs of a time range, the oldest first.
+
+    Args:
+        export_format (str): "ndjson" for one JSON object per line, or "csv"
+            with a header line.
+        since (Optional[datetime]): Only export entries created at or after
+            this time.
+        until (Optional[datetime]): Only export entries created before this
+            time.
+        fetch_size (int): The number of rows fetched from the database at a
+            time, capped at HISTORY_EXPORT_MAX_FETCH_SIZE.
+
+    Returns:
+        StreamingResponse: The exported entries.
+    """
+    start_time = time()  # Track the start time for measuring export duration
+    REQUEST_COUNTER_HISTORY_EXPORT.inc()
+    logger.info(f"/history/export requested ({export_format}, {since} - {until})")
+
+    statement = select_history()
+    if since is not None:
+        statement = statement.where(QueryLog.created_time >= since)
+    if until is not None:
+        statement = statement.where(QueryLog.created_time < until)
+    statement = statement.order_by(QueryLog.created_time, QueryLog.queryID)
+
+    # Run the query before sending the headers, so a failure is still a 500
+    connection = None
+    try:
+        connection = await replicas.read_engine().connect()
+        result = await connection.stream(
+            statement, execution_options={"yield_per": fetch_size}
+        )
+    except Exception as e:
+        if connection is not None:
+            await connection.close()
+        ERROR_COUNTER_HISTORY.inc()
+        HISTORY_EXPORT_DURATION.observe(time() - start_time)
+        logger.error(f"Failed to start the history export: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+
+    return StreamingResponse(
+        stream_export(connection, result, export_format, start_time),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="query_log.{export_format}"'
+        },
+    )
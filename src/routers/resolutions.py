@@ -0,0 +1,242 @@
+"""
+Resolution endpoints for FastAPI.
+
+This module defines endpoints reading the domain resolutions recorded by the
+query log writer, see `db.resolutions`. The reverse lookup finds the domains
+that resolved to an address, or to any address of a network, from the GiST
+index of the resolved addresses, so it answers from the few matching
+resolutions whatever the number of logged queries. The change history lists
+the successive answers of a domain, with when each was first and last given and
+how many lookups got it, which the query log writer records in both of its
+modes. Like the history, they read from a read replica when one is usable.
+
+Classes:
+    ReverseLookupResponse: Pydantic model of a domain resolved to an address.
+    ResolutionChangeResponse: Pydantic model of an answer of a domain.
+
+Metrics:
+    REQUEST_COUNTER_RESOLUTIONS: A counter for the total number of requests to
+    the resolution endpoints.
+    ERROR_COUNTER_RESOLUTIONS: A counter for the total number of errors on the
+    resolution endpoints.
+    REQUEST_LATENCY_RESOLUTIONS: A histogram tracking the latency of the
+    resolution endpoints.
+
+Routes:
+    /resolutions/reverse: A GET endpoint returning the domains resolved to an
+    address or a network.
+    /resolutions/changes: A GET endpoint returning the successive answers of a
+    domain.
+"""
+
+import ipaddress
+from datetime import datetime
+from time import time
+from typing import Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from prometheus_client import Counter, Histogram
+from pydantic import BaseModel, Field
+from sqlalchemy import cast, func, select
+from sqlalchemy.dialects.postgresql import CIDR
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import get_read_db
+from db.resolutions import domain_key
+from helpers.log.logger import init_log
+from models.resolution import Domain, Resolution, ResolutionAddress
+
+router = APIRouter()
+logger = init_log()
+
+# Define Prometheus metrics
+REQUEST_COUNTER_RESOLUTIONS = Counter(
+    "resolutions_app_requests_total",
+    "Total number of requests on resolution endpoints",
+    ["endpoint"],
+)
+ERROR_COUNTER_RESOLUTIONS = Counter(
+    "resolutions_app_request_errors_total",
+    "Total number of request errors on resolution endpoints",
+    ["endpoint"],
+)
+REQUEST_LATENCY_RESOLUTIONS = Histogram(
+    "resolutions_app_request_latency_seconds",
+    "Request latency in seconds on resolution endpoints",
+    ["endpoint"],
+)
+
+
+class ReverseLookupResponse(BaseModel):
+    """
+    Pydantic model for a domain resolved to an address.
+
+    Attributes:
+        domain (str): The domain resolved.
+        address (str): The address the domain resolved to.
+        first_seen (datetime): The time of the first lookup answered with it.
+        last_seen (datetime): The time of the last lookup answered with it.
+    """
+
+    domain: str = Field(..., description="The domain resolved")
+    address: str = Field(..., description="The address the domain resolved to")
+    first_seen: datetime = Field(..., description="The time of the first lookup")
+    last_seen: datetime = Field(..., description="The time of the last lookup")
+
+
+class ResolutionChangeResponse(BaseModel):
+    """
+    Pydantic model for an answer of a domain, until it changed.
+
+    Attributes:
+        addresses (List[str]): The addresses of the answer, empty when the
+            domain did not resolve.
+        first_seen (datetime): The time of the first lookup answered with them.
+        last_seen (datetime): The time of the last lookup answered with them.
+        lookups (int): The number of lookups answered with them.
+    """
+
+    addresses: List[str] = Field(..., description="The addresses of the answer")
+    first_seen: datetime = Field(..., description="The time of the first lookup")
+    last_seen: datetime = Field(..., description="The time of the last lookup")
+    lookups: int = Field(..., description="The number of lookups of the answer")
+
+
+@router.get("/resolutions/reverse", response_model=List[ReverseLookupResponse])
+async def reverse_lookup(
+    ip: str = Query(..., description="An IP address or a CIDR network"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Retrieves the domains that resolved to an address or into a network.
+
+    Args:
+        ip (str): An IPv4 or IPv6 address, or a network in CIDR notation. Host
+            bits of a network are ignored.
+        limit (int): The number of (domain, address) pairs returned.
+        db (AsyncSession): The SQLAlchemy session used to interact with the
+            database.
+
+    Returns:
+        List[ReverseLookupResponse]: The domains with each matching address,
+        the most recently seen first.
+
+    Raises:
+        HTTPException: If `ip` is not an address or a network (400), or in
+        case of a server error (500).
+    """
+    start_time = time()  # Track the start time for latency measurement
+    REQUEST_COUNTER_RESOLUTIONS.labels(endpoint="reverse").inc()
+    logger.info(f"/resolutions/reverse requested for {ip}")
+
+    try:
+        network = ipaddress.ip_network(ip, strict=False)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid IP address or network: {ip}"
+        ) from e
+
+    try:
+        last_seen = func.max(Resolution.last_seen).label("last_seen")
+        statement = (
+            select(
+                Domain.name.label("domain"),
+                func.host(ResolutionAddress.address).label("address"),
+                func.min(Resolution.first_seen).label("first_seen"),
+                last_seen,
+            )
+            .join_from(
+                ResolutionAddress,
+                Resolution,
+                Resolution.resolutionID == ResolutionAddress.resolutionID,
+            )
+            .join(Domain, Domain.domainID == Resolution.domainID)
+            # Contained in or equal to the network, served by the GiST index
+            .where(ResolutionAddress.address.op("<<=")(cast(str(network), CIDR)))
+            .group_by(Domain.name, ResolutionAddress.address)
+            .order_by(last_seen.desc(), Domain.name, ResolutionAddress.address)
+            .limit(limit)
+        )
+        return [row._asdict() for row in await db.execute(statement)]
+    except Exception as e:
+        ERROR_COUNTER_RESOLUTIONS.labels(endpoint="reverse").inc()
+        logger.error(f"Failed to look up the domains of {ip}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    finally:
+        REQUEST_LATENCY_RESOLUTIONS.labels(endpoint="reverse").observe(
+            time() - start_time
+        )
+
+
+@router.get("/resolutions/changes", response_model=List[ResolutionChangeResponse])
+async def get_resolution_changes(
+    domain: str,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Retrieves the successive answers of a domain, the latest first.
+
+    Args:
+        domain (str): The domain name, in any case.
+        limit (int): The number of answers returned.
+        db (AsyncSession): The SQLAlchemy session used to interact with the
+            database.
+
+    Returns:
+        List[ResolutionChangeResponse]: The answers, empty for a domain never
+        looked up.
+
+    Raises:
+        HTTPException: In case of a server error (500).
+    """
+    start_time = time()  # Track the start time for latency measurement
+    REQUEST_COUNTER_RESOLUTIONS.labels(endpoint="changes").inc()
+    logger.info(f"/resolutions/changes requested for {domain}")
+
+    try:
+        domain_id = select(Domain.domainID).where(Domain.name == domain_key(domain))
+        statement = (
+            select(
+                Resolution.resolutionID,
+                Resolution.first_seen,
+                Resolution.last_seen,
+                Resolution.lookups,
+            )
+            .where(Resolution.domainID == domain_id.scalar_subquery())
+            .order_by(Resolution.first_seen.desc(), Resolution.resolutionID.desc())
+            .limit(limit)
+        )
+        changes = (await db.execute(statement)).all()
+        addresses: Dict[int, List[str]] = {
+            change.resolutionID: [] for change in changes
+        }
+        if addresses:
+            statement = (
+                select(
+                    ResolutionAddress.resolutionID,
+                    func.host(ResolutionAddress.address),
+                )
+                .where(ResolutionAddress.resolutionID.in_(list(addresses)))
+                .order_by(ResolutionAddress.address)
+            )
+            for resolution_id, address in await db.execute(statement):
+                addresses[resolution_id].append(address)
+        return [
+            {
+                "addresses": addresses[change.resolutionID],
+                "first_seen": change.first_seen,
+                "last_seen": change.last_seen,
+                "lookups": change.lookups,
+            }
+            for change in changes
+        ]
+    except Exception as e:
+        ERROR_COUNTER_RESOLUTIONS.labels(endpoint="changes").inc()
+        logger.error(f"Failed to fetch the resolutions of {domain}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    finally:
+        REQUEST_LATENCY_RESOLUTIONS.labels(endpoint="changes").observe(
+            time() - start_time
+        )
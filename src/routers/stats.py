@@ -0,0 +1,224 @@
+"""
+Statistics endpoints for FastAPI.
+
+This module defines endpoints serving domain query statistics for dashboards:
+the number of queries per minute and the most queried domains. They only read
+the rollup tables maintained by the query log writer (see `db.rollups`), so
+their cost depends on the number of minutes or days asked for, not on the
+number of logged queries. Like the history, they read from a read replica when
+one is usable.
+
+Classes:
+    MinuteStatsResponse: Pydantic model of the queries of one minute.
+    DomainStatsResponse: Pydantic model of the queries of one domain.
+
+Functions:
+    as_utc(value): Reads a time without a UTC offset as UTC.
+
+Environment Variables:
+    STATS_MAX_MINUTES (int): Longest time range of the per-minute statistics,
+        in minutes. Defaults to 10080 (a week).
+    STATS_MAX_DAYS (int): Longest time range of the domain statistics, in
+        days. Defaults to 90.
+
+Metrics:
+    REQUEST_COUNTER_STATS: A counter for the total number of requests to the
+    statistics endpoints.
+    ERROR_COUNTER_STATS: A counter for the total number of errors on the
+    statistics endpoints.
+    REQUEST_LATENCY_STATS: A histogram tracking the latency of the statistics
+    endpoints.
+
+Routes:
+    /stats/queries: A GET endpoint returning the number of queries per minute.
+    /stats/domains: A GET endpoint returning the most queried domains.
+"""
+
+import os
+from datetime import date, datetime, timedelta, timezone
+from time import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from prometheus_client import Counter, Histogram
+from pydantic import BaseModel, Field
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import get_read_db
+from helpers.log.logger import init_log
+from models.stats import DomainStatsDaily, QueryStatsMinute
+
+router = APIRouter()
+logger = init_log()
+
+STATS_MAX_MINUTES = int(os.getenv("STATS_MAX_MINUTES", "10080"))
+STATS_MAX_DAYS = int(os.getenv("STATS_MAX_DAYS", "90"))
+
+# Define Prometheus metrics
+REQUEST_COUNTER_STATS = Counter(
+    "stats_app_requests_total",
+    "Total number of requests on statistics endpoints",
+    ["endpoint"],
+)
+ERROR_COUNTER_STATS = Counter(
+    "stats_app_request_errors_total",
+    "Total number of request errors on statistics endpoints",
+    ["endpoint"],
+)
+REQUEST_LATENCY_STATS = Histogram(
+    "stats_app_request_latency_seconds",
+    "Request latency in seconds on statistics endpoints",
+    ["endpoint"],
+)
+
+
+class MinuteStatsResponse(BaseModel):
+    """
+    Pydantic model for the queries of one minute.
+
+    Attributes:
+        bucket (datetime): The UTC minute.
+        queries (int): The number of queries logged during the minute.
+    """
+
+    bucket: datetime = Field(..., description="The UTC minute")
+    queries: int = Field(..., description="The number of queries of the minute")
+
+    class Config:
+        """Allows the model to be populated from SQLAlchemy ORM model attributes."""
+
+        from_attributes = True
+
+
+class DomainStatsResponse(BaseModel):
+    """
+    Pydantic model for the queries of one domain.
+
+    Attributes:
+        domain (str): The domain queried.
+        queries (int): The number of queries of the domain.
+        last_seen (datetime): The time of the last query of the domain.
+    """
+
+    domain: str = Field(..., description="The domain queried")
+    queries: int = Field(..., description="The number of queries of the domain")
+    last_seen: datetime = Field(..., description="The time of the last query")
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Reads a time given without a UTC offset as UTC, like the rollup buckets.
+
+    Args:
+        value (Optional[datetime]): The time, naive or aware.
+
+    Returns:
+        Optional[datetime]: The time with a UTC offset if it had none.
+    """
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+@router.get("/stats/queries", response_model=List[MinuteStatsResponse])
+async def get_query_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Retrieves the number of queries per minute over a time range.
+
+    Minutes without queries are left out.
+
+    Args:
+        since (Optional[datetime]): Start of the range, included, in UTC when
+            given without an offset. Defaults to an hour before `until`.
+        until (Optional[datetime]): End of the range, excluded, in UTC when
+            given without an offset. Defaults to now.
+        db (AsyncSession): The SQLAlchemy session used to interact with the
+            database.
+
+    Returns:
+        List[MinuteStatsResponse]: The minutes of the range, the oldest first.
+
+    Raises:
+        HTTPException: If the range is empty or longer than STATS_MAX_MINUTES
+        (400), or in case of a server error (500).
+    """
+    start_time = time()  # Track the start time for latency measurement
+    REQUEST_COUNTER_STATS.labels(endpoint="queries").inc()
+    logger.info(f"/stats/queries requested ({since} - {until})")
+
+    until = as_utc(until) or datetime.now(timezone.utc)
+    since = as_utc(since) or until - timedelta(hours=1)
+    if not timedelta(0) < until - since <= timedelta(minutes=STATS_MAX_MINUTES):
+        raise HTTPException(
+            status_code=400,
+            detail=f"The range must be positive and at most {STATS_MAX_MINUTES} "
+            "minutes",
+        )
+
+    try:
+        statement = (
+            select(QueryStatsMinute)
+            .where(QueryStatsMinute.bucket >= since, QueryStatsMinute.bucket < until)
+            .order_by(QueryStatsMinute.bucket)
+        )
+        minutes = (await db.scalars(statement)).all()
+        return minutes
+    except Exception as e:
+        ERROR_COUNTER_STATS.labels(endpoint="queries").inc()
+        logger.error(f"Failed to fetch query stats: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    finally:
+        REQUEST_LATENCY_STATS.labels(endpoint="queries").observe(time() - start_time)
+
+
+@router.get("/stats/domains", response_model=List[DomainStatsResponse])
+async def get_domain_stats(
+    days: int = Query(1, ge=1, le=STATS_MAX_DAYS),
+    limit: int = Query(10, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Retrieves the most queried domains of the last days.
+
+    Args:
+        days (int): The number of UTC days counted, today included.
+        limit (int): The number of domains returned.
+        db (AsyncSession): The SQLAlchemy session used to interact with the
+            database.
+
+    Returns:
+        List[DomainStatsResponse]: The domains, the most queried first.
+
+    Raises:
+        HTTPException: In case of a server error (500).
+    """
+    start_time = time()  # Track the start time for latency measurement
+    REQUEST_COUNTER_STATS.labels(endpoint="domains").inc()
+    logger.info(f"/stats/domains requested ({days} days, top {limit})")
+
+    try:
+        first_day: date = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+        queries = func.sum(DomainStatsDaily.queries).label("queries")
+        statement = (
+            select(
+                DomainStatsDaily.domain,
+                queries,
+                func.max(DomainStatsDaily.last_seen).label("last_seen"),
+            )
+            .where(DomainStatsDaily.day >= first_day)
+            .group_by(DomainStatsDaily.domain)
+            .order_by(queries.desc(), DomainStatsDaily.domain)
+            .limit(limit)
+        )
+        return [row._asdict() for row in await db.execute(statement)]
+    except Exception as e:
+        ERROR_COUNTER_STATS.labels(endpoint="domains").inc()
+        logger.error(f"Failed to fetch domain stats: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    finally:
+        REQUEST_LATENCY_STATS.labels(endpoint="domains").observe(time() - start_time)
@@ -4,52 +4,129 @@ Tools endpoints for IP validation and domain lookup.
 This module defines two tools endpoints: one for validating IP addresses
 and anotherfor looking up domain names and resolving them to IPv4 addresses.
  It integrates with Prometheus to track request metrics and logs activity
- for debugging purposes.
+ for debugging purposes. Domain names are resolved by an asynchronous resolver
+ running on the event loop, so lookups do not hold a threadpool thread, and
+ answers are kept in an in-process cache for the TTL of their records.
 
 Classes:
     IPSchema: Pydantic model representing an IP address for validation.
+    BodyStreamingResponse: Streaming response that lets the endpoint keep reading
+    the request body.
 
 Functions:
-    log_query(domain, ipv4s, db): Helper function to log successful domain queries.
-    validate_ip(request, ip_data): Validates if the given IP address is a valid
-IPv4 address.
-    lookup(domain, request, db): Looks up a domain name and resolves it to its
+    log_query(domain, ipv4s): Helper function to log successful domain queries.
+    log_queries(rows): Helper function to log a batch of domain queries.
+    resolve_domain(domain): Resolves a domain to its IPv4 addresses.
+    resolve_uncached(domain): Resolves a domain, sharing the query with
+    concurrent lookups of the same domain.
+    resolve_many(domains, concurrency): Resolves domains concurrently.
+    validate_ip(request, ip_data, classify): Validates if the given IP address is
+    a valid IPv4 address.
+    validate_batch(request, classify): Validates a stream of IP addresses.
+    lookup(domain, request): Looks up a domain name and resolves it to its
     IPv4 addresses.
+    lookup_batch(request, batch): Looks up a batch of domain names.
+    lookup_stream(request, batch): Looks up a batch of domain names and streams
+    the results as NDJSON.
+
+Attributes:
+    resolver (AsyncResolver): The resolver shared by the lookup endpoints.
+    dns_cache (DNSCache): The cache of answers placed in front of the resolver.
+    dns_refresher (RefreshAhead): Renews the popular cached answers before they
+    expire, run by the app lifespan.
+    lookups_in_flight (SingleFlight): Coalesces concurrent lookups of a domain
+    that missed the cache into a single query.
+    query_log_writer (QueryLogWriter): Writes the logs of successful lookups to
+    the database in batches, off the request path.
+    ip_policy (PolicyStore): The CIDR range index classifying validated
+    addresses, loaded and reloaded by the app lifespan.
 
 Metrics:
     REQUEST_COUNTER_VALIDATE: A counter for the total number of requests to the
     /validate endpoint.
     VALIDATE_DURATION: A histogram tracking the duration of /validate requests.
+    REQUEST_COUNTER_VALIDATE_BATCH: A counter for the total number of requests to
+    the /validate/batch endpoint.
+    VALIDATE_BATCH_ADDRESSES: A counter for the total number of addresses
+    checked by the /validate/batch endpoint.
+    VALIDATE_BATCH_DURATION: A histogram tracking the duration of /validate/batch
+    responses.
     REQUEST_COUNTER_LOOKUP: A counter for the total number of requests to the
     /lookup endpoint.
     LOOKUP_DURATION: A histogram tracking the duration of /lookup requests.
+    REQUEST_COUNTER_LOOKUP_BATCH: A counter for the total number of requests to
+    the /lookup/batch endpoint.
+    LOOKUP_BATCH_DURATION: A histogram tracking the duration of /lookup/batch
+    requests.
+    REQUEST_COUNTER_LOOKUP_STREAM: A counter for the total number of requests to
+    the /lookup/stream endpoint.
+    LOOKUP_STREAM_DURATION: A histogram tracking the duration of /lookup/stream
+    responses, until the last line is sent.
+
+Environment Variables:
+    LOOKUP_BATCH_MAX_DOMAINS (int): Maximum number of domains in one batch.
+        Defaults to 10000.
+    LOOKUP_BATCH_CONCURRENCY (int): Maximum number of domains of a batch
+        resolved at the same time. Defaults to 200.
+    LOOKUP_STREAM_MAX_DOMAINS (int): Maximum number of domains in one streamed
+        batch. Defaults to 100000.
 
 Routes:
     /tools/validate: A POST endpoint for IP address validation.
+    /tools/validate/batch: A POST endpoint validating a stream of IP addresses.
     /tools/lookup: A GET endpoint for domain lookup.
+    /tools/lookup/batch: A POST endpoint for looking up many domains at once.
+    /tools/lookup/stream: A POST endpoint streaming batch lookup results as NDJSON.
 """
 
+import asyncio
 import ipaddress
+import json
+import os
 import socket
 import sys
 from time import time
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from prometheus_client import Counter, Histogram
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-
-from db.database import get_db
+from pydantic import BaseModel, Field
+
+from db.writer import QueryLogWriter
+from helpers.ip.parser import iter_json_strings, iter_lines
+from helpers.ip.ranges import PolicyStore, RangeIndex
+from helpers.ip.validator import validate_ips
+from helpers.dns.cache import DNSCache
+from helpers.dns.refresh import RefreshAhead
+from helpers.dns.resolver import AsyncResolver
+from helpers.dns.singleflight import SingleFlight
 from helpers.log.logger import init_log
-from src.models.log import QueryLog
 
 sys.path = ["", ".."] + sys.path[1:]
 sys.path.append("src")
 
+LOOKUP_BATCH_MAX_DOMAINS = int(os.getenv("LOOKUP_BATCH_MAX_DOMAINS", "10000"))
+LOOKUP_BATCH_CONCURRENCY = int(os.getenv("LOOKUP_BATCH_CONCURRENCY", "200"))
+LOOKUP_STREAM_MAX_DOMAINS = int(os.getenv("LOOKUP_STREAM_MAX_DOMAINS", "100000"))
+
 # API router with prefix '/tools'
 router = APIRouter(prefix="/tools")
 # Initialize logger for logging application events and errors
 logger = init_log()
+# Resolver shared by all lookups, its sockets are opened on first use
+resolver = AsyncResolver()
+# Cache of answers and "not found" errors, checked before the resolver
+dns_cache = DNSCache()
+# Lookups missing the cache, shared by concurrent callers of the same domain
+lookups_in_flight = SingleFlight()
+# Write-behind queue for the query logs, started and drained by the app lifespan
+query_log_writer = QueryLogWriter()
+# Refresher of the hot cached domains, so they never miss the cache. It goes
+# through resolve_uncached, defined below, to share queries with lookups
+dns_refresher = RefreshAhead(dns_cache, lambda domain: resolve_uncached(domain))
+# Labels of the validated addresses, the index is swapped whole on reload
+ip_policy = PolicyStore()
 
 
 class IPSchema(BaseModel):
@@ -63,19 +140,129 @@ class IPSchema(BaseModel):
     ip: str
 
 
+class BatchLookupSchema(BaseModel):
+    """
+    Pydantic model for batch lookup requests.
+
+    Attributes:
+        domains (List[str]): The domain names to resolve.
+    """
+
+    domains: List[str] = Field(..., min_length=1, max_length=LOOKUP_BATCH_MAX_DOMAINS)
+
+
+class StreamLookupSchema(BaseModel):
+    """
+    Pydantic model for streamed batch lookup requests.
+
+    Attributes:
+        domains (List[str]): The domain names to resolve.
+    """
+
+    domains: List[str] = Field(..., min_length=1, max_length=LOOKUP_STREAM_MAX_DOMAINS)
+
+
 # Helper function to log successful domain queries
-def log_query(domain: str, ipv4s: list, db: Session = Depends(get_db)):
+async def log_query(domain: str, ipv4s: list):
     """
     Logs successful domain lookup queries in the database.
 
+    The row is queued on the write-behind writer, which inserts it with the
+    next batch.
+
     Args:
         domain (str): The domain name queried.
         ipv4s (list): A list of IPv4 addresses resolved from the domain.
-        db (Session): Database session to store the query log.
     """
-    query_log = QueryLog(domain=domain, client_ip=ipv4s)
-    db.add(query_log)
-    db.commit()
+    await query_log_writer.put(domain, ipv4s)
+
+
+# Helper function to log a batch of successful domain queries
+async def log_queries(rows: list):
+    """
+    Logs a batch of successful domain lookups in the database.
+
+    Args:
+        rows (list): (domain, ipv4s) pairs of the resolved domains.
+    """
+    for domain, ipv4s in rows:
+        await query_log_writer.put(domain, ipv4s)
+
+
+async def resolve_domain(domain: str) -> list:
+    """
+    Resolves a domain to its IPv4 addresses, going through the DNS cache.
+
+    Args:
+        domain (str): The domain name to resolve.
+
+    Returns:
+        list: The IPv4 addresses of the domain.
+
+    Raises:
+        socket.gaierror: If the domain name could not be resolved.
+    """
+    return (await dns_cache.resolve(domain, resolve_uncached)).addresses
+
+
+async def resolve_uncached(domain: str):
+    """
+    Resolves a domain with the resolver, without looking at the DNS cache.
+
+    Concurrent calls for the same domain share a single query and all get its
+    answer or its error.
+
+    Args:
+        domain (str): The domain name to resolve.
+
+    Returns:
+        Answer: The answer of the domain.
+
+    Raises:
+        socket.gaierror: If the domain name could not be resolved.
+    """
+    return await lookups_in_flight.do(DNSCache.key(domain), resolver.resolve, domain)
+
+
+async def resolve_many(domains: List[str], concurrency: int):
+    """
+    Resolves domains concurrently with a bounded number of workers.
+
+    Results are yielded as soon as each domain is resolved, so their order
+    does not follow the order of `domains`.
+
+    Args:
+        domains (List[str]): The domain names to resolve.
+        concurrency (int): Maximum number of domains resolved at the same time.
+
+    Yields:
+        tuple: The index of the domain in `domains` and its result, a dict with
+        either an "ipv4" list or an "error" message.
+    """
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    pending = iter(enumerate(domains))
+
+    async def worker():
+        for index, domain in pending:
+            try:
+                result = {"domain": domain, "ipv4": await resolve_domain(domain)}
+            except socket.gaierror:
+                result = {"domain": domain, "error": "Domain not found"}
+            except Exception as e:
+                logger.error(f"Domain lookup failed for {domain}: {str(e)}")
+                result = {"domain": domain, "error": "Lookup failed"}
+            await results.put((index, result))
+
+    workers = [
+        asyncio.ensure_future(worker())
+        for _ in range(max(1, min(concurrency, len(domains))))
+    ]
+    try:
+        for _ in range(len(domains)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
 
 
 # Define Prometheus metrics
@@ -88,13 +275,15 @@ VALIDATE_DURATION = Histogram(
 
 
 @router.post("/validate")
-def validate_ip(request: Request, ip_data: IPSchema):
+def validate_ip(request: Request, ip_data: IPSchema, classify: bool = False):
     """
     Validates the given IP address.
 
     Args:
         request (Request): The incoming HTTP request object.
         ip_data (IPSchema): The IP data sent in the request.
+        classify (bool): Whether to add the "labels" of the ranges (private,
+            reserved, customer lists...) containing the address.
 
     Returns:
         dict: A dictionary indicating if the IP is valid.
@@ -116,7 +305,10 @@ def validate_ip(request: Request, ip_data: IPSchema):
         ip_obj = ipaddress.ip_address(ip)
         is_valid = ip_obj.version == 4  # Check if the IP is IPv4
         logger.info(f"IP {ip} is valid: {is_valid}")  # Log the result of the validation
-        return {"ip": ip, "valid": is_valid}  # Return the result in a JSON response
+        result = {"ip": ip, "valid": is_valid}
+        if classify:
+            result["labels"] = list(ip_policy.index.classify(ip))
+        return result  # Return the result in a JSON response
     except Exception as e:
         # If the IP is invalid, log the error and return a 400 Bad Request response
         logger.error(f"Invalid IP address provided by {client_ip}: {ip}  {str(e)}")
@@ -126,6 +318,113 @@ def validate_ip(request: Request, ip_data: IPSchema):
         VALIDATE_DURATION.observe(time() - start_time)
 
 
+class BodyStreamingResponse(StreamingResponse):
+    """
+    Streaming response sent while the request body is still being read.
+
+    The base class listens for the client disconnecting by reading from the
+    request channel, which would consume body chunks the endpoint has not read
+    yet. This response only streams, and a disconnect surfaces through the
+    request stream instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+VALIDATE_BATCH_DURATION = Histogram(
+    "validate_batch_request_duration_seconds", "Duration of /validate/batch responses"
+)
+VALIDATE_BATCH_ADDRESSES = Counter(
+    "validate_batch_addresses_total",
+    "Total number of addresses checked on validate batch endpoint",
+)
+REQUEST_COUNTER_VALIDATE_BATCH = Counter(
+    "validate_batch_app_requests_total",
+    "Total number of requests on validate batch endpoint",
+)
+
+
+async def stream_validations(
+    batches, client_ip: str, start_time: float, index: Optional[RangeIndex] = None
+):
+    """
+    Validates batches of addresses and yields one NDJSON line per address.
+
+    Args:
+        batches (AsyncIterator[List[str]]): The addresses parsed from the body.
+        client_ip (str): The IP address of the client, for logging.
+        start_time (float): The time the request was received.
+        index (Optional[RangeIndex]): The index labeling valid addresses, None
+            to skip classification.
+
+    Yields:
+        str: The NDJSON lines of the addresses of each batch.
+    """
+    checked = 0
+    try:
+        async for addresses in batches:
+            lines = []
+            for ip, valid in zip(addresses, validate_ips(addresses)):
+                if valid is None:
+                    line = {"ip": ip, "valid": False, "error": "Invalid IP address"}
+                else:
+                    line = {"ip": ip, "valid": valid}
+                    if index is not None:
+                        line["labels"] = list(index.classify(ip))
+                lines.append(json.dumps(line))
+            checked += len(addresses)
+            VALIDATE_BATCH_ADDRESSES.inc(len(addresses))
+            yield "\n".join(lines) + "\n"
+        logger.info(f"Validated {checked} IP addresses from {client_ip}")
+    except ValueError as e:
+        # Headers are already sent, report the error in the stream itself
+        logger.error(f"Invalid validate batch body from {client_ip}: {str(e)}")
+        yield json.dumps({"error": "Malformed request body"}) + "\n"
+    finally:
+        VALIDATE_BATCH_DURATION.observe(time() - start_time)
+
+
+@router.post("/validate/batch")
+async def validate_batch(request: Request, classify: bool = False):
+    """
+    Validates a large number of IP addresses.
+
+    The body is either a JSON array of strings or, with a text/plain or
+    application/x-ndjson content type, one address per line. It is parsed
+    incrementally as it is received and every address gets one NDJSON line
+    in the response, in request order, with the same "valid" flag as the
+    /validate endpoint. Invalid addresses also carry an "error" field instead
+    of failing the whole request. With `classify`, valid addresses also carry
+    their "labels", all taken from the index current when the request started.
+
+    Args:
+        request (Request): The incoming HTTP request object.
+        classify (bool): Whether to add the labels of each valid address.
+
+    Returns:
+        BodyStreamingResponse: An application/x-ndjson stream of results.
+    """
+    start_time = time()  # Track the start time for measuring request duration
+    REQUEST_COUNTER_VALIDATE_BATCH.inc()  # Increment Prometheus counter
+    client_ip = request.client.host  # Capture the client's IP address
+    content_type = request.headers.get("content-type", "")
+    logger.info(f"Validate batch request from {client_ip} ({content_type})")
+
+    if content_type.startswith(("text/plain", "application/x-ndjson")):
+        batches = iter_lines(request.stream())
+    else:
+        batches = iter_json_strings(request.stream())
+    return BodyStreamingResponse(
+        stream_validations(
+            batches, client_ip, start_time, ip_policy.index if classify else None
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
 LOOKUP_DURATION = Histogram(
     "lookup_request_duration_seconds", "Duration of /lookup requests"
 )
@@ -135,14 +434,13 @@ REQUEST_COUNTER_LOOKUP = Counter(
 
 
 @router.get("/lookup")
-def lookup(domain: str, request: Request, db: Session = Depends(get_db)):
+async def lookup(domain: str, request: Request):
     """
     Performs a domain lookup to resolve IPv4 addresses.
 
     Args:
         domain (str): The domain name to resolve.
         request (Request): The incoming HTTP request object.
-        db (Session): Database session to log the domain query.
 
     Returns:
         dict: A dictionary with the domain and resolved IPv4 addresses.
@@ -159,9 +457,9 @@ def lookup(domain: str, request: Request, db: Session = Depends(get_db)):
 
     try:
         # Resolve the domain to get only IPv4 addresses
-        ipv4s = socket.gethostbyname_ex(domain)[2]
+        ipv4s = await resolve_domain(domain)
         # Log the successful domain query in the database
-        log_query(domain, ipv4s, db)  # Save query in the database
+        await log_query(domain, ipv4s)  # Save query in the database
         logger.info(
             f"Lookup success for domain {domain} by {client_ip}: {ipv4s}"
         )  # Log lookup success
@@ -175,3 +473,117 @@ def lookup(domain: str, request: Request, db: Session = Depends(get_db)):
     finally:
         # Record the time taken for the /lookup request in the Prometheus histogram
         LOOKUP_DURATION.observe(time() - start_time)
+
+
+LOOKUP_BATCH_DURATION = Histogram(
+    "lookup_batch_request_duration_seconds", "Duration of /lookup/batch requests"
+)
+REQUEST_COUNTER_LOOKUP_BATCH = Counter(
+    "lookup_batch_app_requests_total",
+    "Total number of requests on lookup batch endpoint",
+)
+
+
+@router.post("/lookup/batch")
+async def lookup_batch(request: Request, batch: BatchLookupSchema):
+    """
+    Performs domain lookups for a batch of domains.
+
+    The domains are resolved concurrently, at most LOOKUP_BATCH_CONCURRENCY at
+    a time, and every successful lookup is queued for logging.
+
+    Args:
+        request (Request): The incoming HTTP request object.
+        batch (BatchLookupSchema): The domains to resolve.
+
+    Returns:
+        dict: A dictionary with one result per domain, in request order. Each
+        result holds the domain and either its IPv4 addresses or an error.
+    """
+    start_time = time()  # Track the start time for measuring request duration
+    REQUEST_COUNTER_LOOKUP_BATCH.inc()  # Increment Prometheus counter
+    client_ip = request.client.host  # Capture the client's IP address
+    logger.info(
+        f"Batch lookup request from {client_ip} for {len(batch.domains)} domains"
+    )
+
+    try:
+        results = [None] * len(batch.domains)
+        async for index, result in resolve_many(
+            batch.domains, LOOKUP_BATCH_CONCURRENCY
+        ):
+            results[index] = result
+        # Log every successful domain query
+        rows = [(r["domain"], r["ipv4"]) for r in results if "ipv4" in r]
+        await log_queries(rows)
+        logger.info(f"Batch lookup by {client_ip}: {len(rows)}/{len(results)} resolved")
+        return {"results": results}
+    finally:
+        # Record the time taken for the request in the Prometheus histogram
+        LOOKUP_BATCH_DURATION.observe(time() - start_time)
+
+
+LOOKUP_STREAM_DURATION = Histogram(
+    "lookup_stream_request_duration_seconds", "Duration of /lookup/stream responses"
+)
+REQUEST_COUNTER_LOOKUP_STREAM = Counter(
+    "lookup_stream_app_requests_total",
+    "Total number of requests on lookup stream endpoint",
+)
+
+
+async def stream_lookups(domains: List[str], client_ip: str, start_time: float):
+    """
+    Resolves domains and yields one NDJSON line per domain as it completes.
+
+    Resolved domains are queued for logging as they arrive, and the writer
+    inserts them in batches while the response is being sent.
+
+    Args:
+        domains (List[str]): The domain names to resolve.
+        client_ip (str): The IP address of the client, for logging.
+        start_time (float): The time the request was received.
+
+    Yields:
+        str: A JSON object followed by a newline for each domain.
+    """
+    resolved = 0
+    try:
+        async for index, result in resolve_many(domains, LOOKUP_BATCH_CONCURRENCY):
+            yield json.dumps({"index": index, **result}) + "\n"
+            if "ipv4" in result:
+                await log_query(result["domain"], result["ipv4"])
+                resolved += 1
+        logger.info(f"Stream lookup by {client_ip}: {resolved}/{len(domains)} resolved")
+    finally:
+        # Record the time taken to send the whole stream
+        LOOKUP_STREAM_DURATION.observe(time() - start_time)
+
+
+@router.post("/lookup/stream")
+async def lookup_stream(request: Request, batch: StreamLookupSchema):
+    """
+    Performs domain lookups for a batch of domains and streams the results.
+
+    Each domain is written as one NDJSON line as soon as it is resolved, in
+    completion order, with its index in the request. The response is written
+    as the client reads it, so a slow client slows down the resolution instead
+    of letting results pile up in memory.
+
+    Args:
+        request (Request): The incoming HTTP request object.
+        batch (StreamLookupSchema): The domains to resolve.
+
+    Returns:
+        StreamingResponse: An application/x-ndjson stream of results.
+    """
+    start_time = time()  # Track the start time for measuring request duration
+    REQUEST_COUNTER_LOOKUP_STREAM.inc()  # Increment Prometheus counter
+    client_ip = request.client.host  # Capture the client's IP address
+    logger.info(
+        f"Stream lookup request from {client_ip} for {len(batch.domains)} domains"
+    )
+    return StreamingResponse(
+        stream_lookups(batch.domains, client_ip, start_time),
+        media_type="application/x-ndjson",
+    )
@@ -10,10 +10,19 @@ for interacting with the FastAPI application during tests.
 
 This setup allows the test functions to send HTTP requests
 to the application and assert the responses.
+
+It also provides a local stand-in DNS server so resolver tests do not
+depend on the network.
 """
 
 import os
+import socket
+import socketserver
+import struct
 import sys
+import threading
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -39,3 +48,167 @@ def client():
 
     with TestClient(app) as client:
         yield client
+
+
+class _UDPServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandInDNSServer:
+    """
+    Minimal authoritative DNS server listening on UDP and TCP on localhost.
+
+    Names present in `records` are answered with their A records, all other
+    names get NXDOMAIN. Names listed in `truncated` get an empty reply with the
+    TC flag over UDP, forcing the client to retry over TCP.
+
+    Attributes:
+        records (dict): IPv4 addresses returned for each domain name.
+        truncated (set): Names answered with a truncated reply over UDP.
+        ttl (int): TTL of the A records.
+        delay (float): Seconds to wait before answering each query.
+        queries (list): (transport, name) of every query received.
+        sources (list): The (host, port) each UDP query was sent from.
+        address (tuple): The (host, port) the server listens on.
+    """
+
+    def __init__(self, records=None, truncated=(), ttl=300, delay=0.0):
+        self.records = dict(records or {})
+        self.truncated = set(truncated)
+        self.ttl = ttl
+        self.delay = delay
+        self.queries = []
+        self.sources = []
+        server = self
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                server.sources.append(self.client_address)
+                reply = server.reply(data, "udp")
+                if reply is not None:
+                    sock.sendto(reply, self.client_address)
+
+        class TCPHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                length = struct.unpack("!H", self.rfile.read(2))[0]
+                reply = server.reply(self.rfile.read(length), "tcp")
+                self.wfile.write(struct.pack("!H", len(reply)) + reply)
+
+        self._udp = _UDPServer(("127.0.0.1", 0), UDPHandler)
+        self.address = self._udp.server_address
+        self._tcp = _TCPServer(self.address, TCPHandler)
+
+    def reply(self, query, transport):
+        """Builds the reply to a query received over `transport`."""
+        txid = query[:2]
+        offset, labels = 12, []
+        while query[offset]:
+            label_start, label_end = offset + 1, offset + 1 + query[offset]
+            labels.append(query[label_start:label_end].decode())
+            offset = label_end
+        question_end = offset + 5
+        question = query[12:question_end]
+        name = ".".join(labels).lower()
+        self.queries.append((transport, name))
+        if self.delay:
+            time.sleep(self.delay)
+
+        flags = 0x8180
+        answers = b""
+        addresses = self.records.get(name)
+        if addresses is None:
+            flags |= 3
+        elif transport == "udp" and name in self.truncated:
+            flags |= 0x0200
+        else:
+            for address in addresses:
+                answers += b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, self.ttl, 4)
+                answers += socket.inet_aton(address)
+        count = 0 if flags & 0x0203 else len(addresses)
+        return txid + struct.pack("!HHHHH", flags, 1, count, 0, 0) + question + answers
+
+    def start(self):
+        """Starts serving UDP and TCP in background threads."""
+        for server in (self._udp, self._tcp):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stops both servers and closes their sockets."""
+        for server in (self._udp, self._tcp):
+            server.shutdown()
+            server.server_close()
+
+
+@pytest.fixture
+def dns_server():
+    """
+    Fixture returning a factory of running stand-in DNS servers.
+
+    Every server created through the factory is stopped at teardown.
+    """
+    servers = []
+
+    def start(**kwargs):
+        server = StandInDNSServer(**kwargs)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def local_dns(dns_server, monkeypatch):
+    """
+    Fixture pointing the lookup endpoints at a stand-in DNS server.
+
+    Returns a factory taking the same arguments as `StandInDNSServer`. The
+    resolver and the DNS cache of the tools router are replaced for the
+    duration of the test.
+    """
+    from helpers.dns.cache import DNSCache
+    from helpers.dns.resolver import AsyncResolver
+    from helpers.dns.singleflight import SingleFlight
+    from routers import tools
+
+    def start(**kwargs):
+        server = dns_server(**kwargs)
+        resolver = AsyncResolver(nameservers=[server.address], timeout=1, hosts={})
+        monkeypatch.setattr(tools, "resolver", resolver)
+        monkeypatch.setattr(tools, "dns_cache", DNSCache())
+        monkeypatch.setattr(tools, "lookups_in_flight", SingleFlight())
+        return server
+
+    return start
+
+
+class RecordingWriter:
+    """Query log writer keeping the queued rows in memory."""
+
+    def __init__(self):
+        self.rows = []
+
+    async def put(self, domain, ipv4s):
+        self.rows.append((domain, ipv4s))
+
+
+@pytest.fixture
+def logged_queries(monkeypatch):
+    """
+    Fixture capturing the query logs queued by the tools router.
+
+    Returns the list of (domain, ipv4s) rows queued during the test.
+    """
+    from routers import tools
+
+    writer = RecordingWriter()
+    monkeypatch.setattr(tools, "query_log_writer", writer)
+    return writer.rows
@@ -0,0 +1,197 @@
+"""
+Test suite for the in-process DNS answer cache.
+
+This module contains test cases for the following scenarios:
+1. Serving repeated lookups from the cache until the record TTL expires.
+2. Caching "domain not found" errors for the negative TTL only.
+3. Not caching temporary resolution failures.
+4. Evicting the least recently used domain when the cache is full.
+5. Exposing the cache counters on the /metrics endpoint.
+6. Restoring a snapshot into a new cache, as after a restart.
+7. Starting with an empty cache when the snapshot is not a valid one.
+
+A fake clock drives expiry so no test has to sleep.
+"""
+
+import asyncio
+import socket
+
+import pytest
+
+from helpers.dns.cache import DNSCache
+from helpers.dns.resolver import Answer
+
+
+class FakeClock:
+    """Monotonic clock advanced by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResolver:
+    """Resolver returning canned results and counting its calls."""
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    async def resolve(self, domain):
+        self.calls.append(domain)
+        result = self.results[domain]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_cache_honors_ttl():
+    """
+    Test case for a positive answer.
+
+    Expected behavior:
+    - The second lookup is a hit and reports the remaining TTL.
+    - Once the TTL has elapsed the domain is resolved again.
+    """
+    clock = FakeClock()
+    cache = DNSCache(clock=clock)
+    resolver = FakeResolver({"example.com": Answer("example.com", ["1.2.3.4"], 60)})
+
+    assert asyncio.run(cache.resolve("example.com", resolver.resolve)).ttl == 60
+    clock.now += 45
+    answer = asyncio.run(cache.resolve("EXAMPLE.com.", resolver.resolve))
+    assert answer.addresses == ["1.2.3.4"]
+    assert answer.ttl == 15
+    assert resolver.calls == ["example.com"]
+
+    clock.now += 16
+    asyncio.run(cache.resolve("example.com", resolver.resolve))
+    assert resolver.calls == ["example.com", "example.com"]
+
+
+def test_cache_negative_answers():
+    """
+    Test case for a domain that does not exist.
+
+    Expected behavior:
+    - The error is raised again from the cache during the negative TTL.
+    - The domain is resolved again once the negative TTL has elapsed.
+    """
+    clock = FakeClock()
+    cache = DNSCache(negative_ttl=5, clock=clock)
+    error = socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    resolver = FakeResolver({"missing.example": error})
+
+    for _ in range(3):
+        with pytest.raises(socket.gaierror):
+            asyncio.run(cache.resolve("missing.example", resolver.resolve))
+    assert len(resolver.calls) == 1
+
+    clock.now += 6
+    with pytest.raises(socket.gaierror):
+        asyncio.run(cache.resolve("missing.example", resolver.resolve))
+    assert len(resolver.calls) == 2
+
+
+def test_cache_skips_temporary_failures():
+    """
+    Test case for a timeout or SERVFAIL.
+
+    Expected behavior:
+    - Temporary failures are not cached and every lookup is retried.
+    """
+    cache = DNSCache(clock=FakeClock())
+    error = socket.gaierror(socket.EAI_AGAIN, "Temporary failure")
+    resolver = FakeResolver({"flaky.example": error})
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            asyncio.run(cache.resolve("flaky.example", resolver.resolve))
+    assert len(resolver.calls) == 2
+
+
+def test_cache_evicts_least_recently_used():
+    """
+    Test case for a full cache.
+
+    Expected behavior:
+    - Inserting a third domain into a cache of two evicts the domain that was
+      used least recently.
+    """
+    cache = DNSCache(max_entries=2, clock=FakeClock())
+    for name in ("a.example", "b.example"):
+        cache.put(name, Answer(name, ["1.1.1.1"], 60))
+    assert cache.get("a.example") is not None  # a becomes the most recent
+    cache.put("c.example", Answer("c.example", ["1.1.1.1"], 60))
+
+    assert len(cache) == 2
+    assert cache.get("b.example") is None
+    assert cache.get("a.example") is not None
+    assert cache.get("c.example") is not None
+
+
+def test_cache_snapshot_restore(tmp_path):
+    """
+    Test case for a cache snapshotted, then restored by a new process.
+
+    Expected behavior:
+    - Entries come back with the time left on their wall clock expiry, even
+      though the monotonic clock of the new process starts elsewhere.
+    - Entries that expired while the process was down are skipped, and
+      "domain not found" entries are restored as errors.
+    - A missing snapshot file restores nothing.
+    """
+    path = str(tmp_path / "dns_cache.json")
+    clock, wall = FakeClock(), FakeClock()
+    cache = DNSCache(clock=clock, wall_clock=wall)
+    cache.put("long.example", Answer("long.example", ["1.1.1.1"], 300))
+    cache.put("short.example", Answer("short.example", ["2.2.2.2"], 20))
+    cache.put_negative("missing.example", socket.gaierror(socket.EAI_NONAME, "x"))
+    asyncio.run(cache.save(path))
+
+    clock, wall = FakeClock(), FakeClock()
+    clock.now = 5.0
+    wall.now += 25
+    restored = DNSCache(clock=clock, wall_clock=wall)
+    assert asyncio.run(restored.restore(path)) == 2
+    answer = restored.get("long.example")
+    assert answer.addresses == ["1.1.1.1"]
+    assert answer.ttl == 275
+    assert restored.get("short.example") is None
+    with pytest.raises(socket.gaierror):
+        restored.get("missing.example")
+
+    assert asyncio.run(DNSCache().restore(str(tmp_path / "none.json"))) == 0
+
+
+@pytest.mark.parametrize(
+    "content",
+    ["[]", '"snapshot"', "null", '{"version": 1, "entries": {}}', "{", ""],
+)
+def test_cache_restore_invalid_snapshot(tmp_path, content):
+    """
+    Test case for a snapshot file that is not a snapshot, such as a file
+    truncated or overwritten by another program.
+
+    Expected behavior:
+    - Nothing is restored and no error is raised, so the app still starts.
+    """
+    path = tmp_path / "dns_cache.json"
+    path.write_text(content)
+    cache = DNSCache()
+    assert asyncio.run(cache.restore(str(path))) == 0
+    assert len(cache.dump()) == 0
+
+
+def test_cache_metrics_exposed(client):
+    """
+    Test case for the cache counters on the /metrics endpoint.
+
+    Expected behavior:
+    - The hit, miss and eviction counters are exported.
+    """
+    metrics_data = client.get("/metrics").content.decode("utf-8")
+    assert "dns_cache_hits_total" in metrics_data
+    assert "dns_cache_misses_total" in metrics_data
+    assert "dns_cache_evictions_total" in metrics_data
@@ -0,0 +1,114 @@
+"""
+Test suite for the refresh-ahead of popular cached domains.
+
+This module contains test cases for the following scenarios:
+1. Renewing a hot domain shortly before it expires, while cold domains and
+   domains far from expiry are left alone.
+2. Limiting the number of refreshes per pass with the query budget.
+3. Keeping the current entry when a refresh fails.
+4. Exposing the refresh counters on the /metrics endpoint.
+
+A fake clock drives expiry so no test has to sleep.
+"""
+
+import asyncio
+import socket
+
+from helpers.dns.cache import DNSCache
+from helpers.dns.refresh import RefreshAhead
+from helpers.dns.resolver import Answer
+from tests.test_dns_cache import FakeClock, FakeResolver
+
+
+def hit(cache, domain, times):
+    """Serves a domain from the cache `times` times."""
+    for _ in range(times):
+        assert cache.get(domain) is not None
+
+
+def test_refresh_hot_domain_before_expiry():
+    """
+    Test case for a popular domain about to expire.
+
+    Expected behavior:
+    - Only hot domains within the refresh window are re-resolved.
+    - The renewed entry is served past the original expiry.
+    - The entry must be hit again before it is refreshed a second time.
+    """
+    clock = FakeClock()
+    cache = DNSCache(clock=clock)
+    for name in ("hot.example", "cold.example"):
+        cache.put(name, Answer(name, ["1.1.1.1"], 60))
+    hit(cache, "hot.example", 3)
+    hit(cache, "cold.example", 1)
+    resolver = FakeResolver({"hot.example": Answer("hot.example", ["2.2.2.2"], 60)})
+    refresher = RefreshAhead(cache, resolver.resolve, window=10, min_hits=2)
+
+    assert asyncio.run(refresher.refresh_once()) == 0  # 60s left, not due yet
+    clock.now += 52
+    assert asyncio.run(refresher.refresh_once()) == 1
+    assert resolver.calls == ["hot.example"]
+
+    clock.now += 10
+    assert cache.get("hot.example").addresses == ["2.2.2.2"]
+    assert cache.get("cold.example") is None
+
+    clock.now += 42
+    assert asyncio.run(refresher.refresh_once()) == 0  # Hit once since renewal
+
+
+def test_refresh_budget():
+    """
+    Test case for more due domains than the budget allows.
+
+    Expected behavior:
+    - The most hit domains are refreshed first, within the budget.
+    """
+    clock = FakeClock()
+    cache = DNSCache(clock=clock)
+    results = {}
+    for i in range(5):
+        name = f"d{i}.example"
+        cache.put(name, Answer(name, ["1.1.1.1"], 60))
+        hit(cache, name, i + 1)
+        results[name] = Answer(name, ["2.2.2.2"], 60)
+    resolver = FakeResolver(results)
+    refresher = RefreshAhead(cache, resolver.resolve, min_hits=1, budget=2)
+
+    clock.now += 55
+    assert asyncio.run(refresher.refresh_once()) == 2
+    assert resolver.calls == ["d4.example", "d3.example"]
+
+
+def test_refresh_failure_keeps_entry():
+    """
+    Test case for a refresh failing upstream.
+
+    Expected behavior:
+    - The current answer is served until it expires, then it is dropped.
+    """
+    clock = FakeClock()
+    cache = DNSCache(clock=clock)
+    cache.put("flaky.example", Answer("flaky.example", ["1.1.1.1"], 60))
+    hit(cache, "flaky.example", 2)
+    error = socket.gaierror(socket.EAI_AGAIN, "Temporary failure")
+    refresher = RefreshAhead(cache, FakeResolver({"flaky.example": error}).resolve)
+
+    clock.now += 55
+    assert asyncio.run(refresher.refresh_once()) == 0
+    assert cache.get("flaky.example").addresses == ["1.1.1.1"]
+    clock.now += 5
+    assert cache.get("flaky.example") is None
+
+
+def test_refresh_metrics_exposed(client):
+    """
+    Test case for the refresh counters on the /metrics endpoint.
+
+    Expected behavior:
+    - The refresh hit, query and skip counters are exported.
+    """
+    metrics_data = client.get("/metrics").content.decode("utf-8")
+    assert "dns_refresh_hits_total" in metrics_data
+    assert "dns_refresh_queries_total" in metrics_data
+    assert "dns_refresh_skipped_total" in metrics_data
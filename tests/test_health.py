@@ -9,9 +9,17 @@ indicates the service is running.
 3. These tests make use of FastAPI's TestClient to simulate HTTP
  requests and check the application's responses.
 
+4. The /livez and /readyz endpoints and the background prober report the
+ latest checks of the services.
+
 The client fixture is used to initialize the TestClient for testing.
 """
 
+import asyncio
+
+from helpers.health.prober import HealthProber
+from routers import health
+
 
 def test_read_health_check(client):
     """
@@ -56,3 +64,100 @@ def test_read_health_check(client):
 
     # Optionally, you could also check the type of latency to be float
     assert isinstance(services[0]["latency"], float), "Latency is not a float"
+
+
+def test_liveness_readiness(client):
+    """
+    Test case for the /livez and /readyz endpoints.
+
+    Expected behavior:
+    - The app is alive, and ready once the database has been checked.
+    """
+    response = client.get("/livez")
+    assert response.status_code == 200
+    assert response.json()["status"] == "alive"
+
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "services": {"database": "healthy"}}
+
+
+def test_not_ready(client, monkeypatch):
+    """
+    Test case for the health endpoints while a critical service is down.
+
+    Expected behavior:
+    - /readyz answers 503 and /health reports the service unhealthy, from the
+      last check, while /livez still answers.
+    """
+
+    async def unreachable():
+        raise ConnectionError("database down")
+
+    prober = HealthProber()
+    prober.register("database", unreachable)
+    monkeypatch.setattr(health, "prober", prober)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["services"] == {"database": "unknown"}
+
+    client.portal.call(prober.check)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["services"] == {"database": "unhealthy"}
+    data = client.get("/health").json()
+    assert data["status"] == "unhealthy"
+    assert data["services"][0]["latency"] is None
+    assert data["services"][0]["checked_at"]
+    assert client.get("/livez").status_code == 200
+
+
+def test_prober():
+    """
+    Test case for the background health checks.
+
+    Expected behavior:
+    - Failing checks and checks over their timeout make their service
+      unhealthy.
+    - Only critical services decide the readiness.
+    - Each service is checked on its own interval.
+    """
+    calls = {"fast": 0, "slow": 0}
+
+    def counted(name):
+        async def check():
+            calls[name] += 1
+
+        return check
+
+    async def hung():
+        await asyncio.sleep(1)
+
+    async def failing():
+        raise ConnectionError("down")
+
+    prober = HealthProber()
+    prober.register("fast", counted("fast"), interval=0.01)
+    prober.register("slow", counted("slow"), interval=10)
+    prober.register("hung", hung, timeout=0.05, critical=False)
+    prober.register("cache", failing, critical=False)
+    assert not prober.ready()
+
+    async def run():
+        states = await prober.check()
+        watcher = asyncio.create_task(prober.run())
+        await asyncio.sleep(0.2)
+        watcher.cancel()
+        return states
+
+    states = asyncio.run(run())
+    assert {name: state.status for name, state in states.items()} == {
+        "fast": "healthy",
+        "slow": "healthy",
+        "hung": "unhealthy",
+        "cache": "unhealthy",
+    }
+    assert isinstance(states["fast"].latency, float)
+    assert prober.ready()
+    assert calls["fast"] > 3
+    assert calls["slow"] == 1
@@ -7,12 +7,42 @@ This module contains test cases for the following scenarios:
    exists in the database.
 2. Simulating a domain lookup and checking whether the application
    correctly logs or returns history data.
+3. Paging through the history with keyset cursors.
+4. Rejecting malformed cursors.
+5. Exporting the entries of a time range as NDJSON and CSV.
+6. Filtering the history by domain and time range.
+7. Answering unchanged polls of the cached first page with 304.
+8. Serializing rows straight to the JSON of the response models.
+9. Failing an export with 500 when its query cannot be run.
 
 The client fixture is used to interact with the FastAPI application,
 allowing the test cases to send HTTP requests to the relevant endpoints
 and validate the responses.
 """
 
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from prometheus_client import REGISTRY
+from pydantic import TypeAdapter
+from sqlalchemy import delete
+
+from db.database import engine
+from db.writer import insert_query_logs
+from models.log import QueryLog
+from routers import history, tools
+from routers.history import (
+    HISTORY_COLUMNS,
+    HISTORY_PAGE_SIZE,
+    QueryLogResponse,
+    decode_cursor,
+    encode_cursor,
+    history_cache,
+    serialize_history,
+)
+
 
 def test_get_history_empty(client):
     """
@@ -30,9 +60,246 @@ def test_get_history_empty(client):
     """
     # Make the request to the /history endpoint with an empty database
     client.get("/v1/tools/lookup?domain=example.com")
+    # Query logs are written behind the request, wait for them to be inserted
+    client.portal.call(tools.query_log_writer.flush)
     response = client.get("/v1/history")
     assert response.status_code == 200
 
     # Check that the response is an empty list
     history = response.json()
     assert len(history) != 0
+
+
+def test_get_history_pages(client):
+    """
+    Test case for paging through the history with cursors.
+
+    Entries sharing the same creation time are inserted with a creation time
+    later than any other entry, so they make up the first pages.
+
+    Expected behavior:
+    - Each page holds at most `limit` entries, newest first, with the
+      queryID breaking ties.
+    - Following X-Next-Cursor visits every entry exactly once.
+    """
+    created_time = datetime(2099, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {"domain": f"page{i}.example", "client_ip": [], "created_time": created_time}
+        for i in range(5)
+    ]
+    insert_query_logs(rows)
+    try:
+        seen, cursor = [], None
+        for _ in range(3):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/v1/history", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 2
+            seen += [entry for entry in page if entry["domain"].startswith("page")]
+            cursor = response.headers.get("X-Next-Cursor")
+        assert [entry["domain"] for entry in seen] == [
+            f"page{i}.example" for i in reversed(range(5))
+        ]
+        ids = [entry["queryID"] for entry in seen]
+        assert ids == sorted(ids, reverse=True)
+    finally:
+        with engine.begin() as connection:
+            connection.execute(
+                delete(QueryLog).where(QueryLog.created_time == created_time)
+            )
+
+
+def test_get_history_filters(client):
+    """
+    Test case for the domain, since and until filters.
+
+    Expected behavior:
+    - Only the entries of the domain created in [since, until) are returned,
+      newest first, and the filters apply to the following pages too.
+    - A filter matching no entry gives an empty page, not a 404.
+    """
+    start = datetime(2097, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "domain": domain,
+            "client_ip": [],
+            "created_time": start + timedelta(minutes=i),
+        }
+        for i in range(6)
+        for domain in ("wanted.example", "other.example")
+    ]
+    insert_query_logs(rows)
+    params = {
+        "domain": "wanted.example",
+        "since": (start + timedelta(minutes=1)).isoformat(),
+        "until": (start + timedelta(minutes=5)).isoformat(),
+        "limit": 3,
+    }
+    try:
+        response = client.get("/v1/history", params=params)
+        first = response.json()
+        response = client.get(
+            "/v1/history",
+            params={**params, "cursor": response.headers["X-Next-Cursor"]},
+        )
+        assert "X-Next-Cursor" not in response.headers
+        entries = first + response.json()
+        assert {entry["domain"] for entry in entries} == {"wanted.example"}
+        assert [entry["created_time"] for entry in entries] == [
+            (start + timedelta(minutes=i)).isoformat().replace("+00:00", "Z")
+            for i in (4, 3, 2, 1)
+        ]
+
+        response = client.get("/v1/history", params={"domain": "none.example"})
+        assert response.status_code == 200
+        assert response.json() == []
+    finally:
+        with engine.begin() as connection:
+            connection.execute(delete(QueryLog).where(QueryLog.created_time >= start))
+
+
+def test_get_history_invalid_cursor(client):
+    """
+    Test case for a cursor that was not built by the endpoint.
+
+    Expected behavior:
+    - Cursors round-trip the key of an entry.
+    - A malformed cursor is rejected with 400 before querying the database.
+    """
+    created_time = datetime(2024, 9, 25, 16, 8, 53, 863417, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_time, 42)) == (created_time, 42)
+
+    response = client.get("/v1/history?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_get_history_etag(client):
+    """
+    Test case for the cached first page and its ETag.
+
+    Expected behavior:
+    - The first page carries an ETag and is cached, and a poll sending the
+      ETag back gets an empty 304 response.
+    - Writing a query log invalidates the cached page, and the next poll gets
+      the new entry with a new ETag.
+    """
+    created_time = datetime(2095, 1, 1, tzinfo=timezone.utc)
+    row = {"domain": "etag.example", "client_ip": [], "created_time": created_time}
+    insert_query_logs([row])
+    try:
+        response = client.get("/v1/history")
+        assert response.status_code == 200
+        assert response.json()[0]["domain"] == "etag.example"
+        etag = response.headers["ETag"]
+        assert history_cache.get(HISTORY_PAGE_SIZE) is not None
+
+        response = client.get("/v1/history", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+        insert_query_logs([{**row, "domain": "etag2.example"}])
+        assert history_cache.get(HISTORY_PAGE_SIZE) is None
+        response = client.get("/v1/history", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()[0]["domain"] == "etag2.example"
+        assert response.headers["ETag"] != etag
+    finally:
+        with engine.begin() as connection:
+            connection.execute(
+                delete(QueryLog).where(QueryLog.created_time == created_time)
+            )
+        history_cache.invalidate()
+
+
+def test_serialize_history():
+    """
+    Test case for the direct serialization of history rows.
+
+    Expected behavior:
+    - The JSON bytes are those of the QueryLogResponse models of the rows.
+    """
+    rows = [
+        (2, "b.example", "{1.2.3.4}", datetime(2026, 10, 18, 1, 2, 3, 456789)),
+        (1, "a.example", "{}", datetime(2026, 10, 18, tzinfo=timezone.utc)),
+    ]
+    models = TypeAdapter(List[QueryLogResponse])
+    expected = models.dump_json(
+        models.validate_python([dict(zip(HISTORY_COLUMNS, row)) for row in rows])
+    )
+    assert serialize_history(rows) == expected
+    assert serialize_history([]) == b"[]"
+
+
+def test_export_history(client):
+    """
+    Test case for the streaming export of a time range.
+
+    Expected behavior:
+    - Only the entries created in [since, until) are exported, oldest first,
+      whatever the fetch size.
+    - NDJSON gives one object per line, CSV a header line then one row per
+      entry.
+    - An unknown format is rejected with 422.
+    """
+    start = datetime(2098, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "domain": f"export{i}.example",
+            "client_ip": ["1.2.3.4"],
+            "created_time": start + timedelta(minutes=i),
+        }
+        for i in range(6)
+    ]
+    insert_query_logs(rows)
+    params = {
+        "since": (start + timedelta(minutes=1)).isoformat(),
+        "until": (start + timedelta(minutes=5)).isoformat(),
+        "fetch_size": 3,
+    }
+    try:
+        response = client.get("/v1/history/export", params=params)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["domain"] for line in lines] == [
+            f"export{i}.example" for i in range(1, 5)
+        ]
+        assert lines[0]["client_ip"] == "{1.2.3.4}"
+
+        response = client.get("/v1/history/export", params={**params, "format": "csv"})
+        assert response.headers["content-type"].startswith("text/csv")
+        table = list(csv.reader(response.text.splitlines()))
+        assert table[0] == ["queryID", "domain", "client_ip", "created_time"]
+        assert [row[1] for row in table[1:]] == [
+            f"export{i}.example" for i in range(1, 5)
+        ]
+    finally:
+        with engine.begin() as connection:
+            connection.execute(delete(QueryLog).where(QueryLog.created_time >= start))
+
+    assert client.get("/v1/history/export?format=xml").status_code == 422
+
+
+def test_export_history_database_down(client, monkeypatch):
+    """
+    Test case for an export whose query fails before any row is sent.
+
+    Expected behavior:
+    - The export fails with 500 instead of an empty 200, and is counted as an
+      error.
+    """
+
+    class DownEngine:
+        async def connect(self):
+            raise ConnectionRefusedError("database is down")
+
+    monkeypatch.setattr(history.replicas, "read_engine", lambda: DownEngine())
+    errors = REGISTRY.get_sample_value("history_app_request_errors_total")
+    response = client.get("/v1/history/export")
+    assert response.status_code == 500
+    assert REGISTRY.get_sample_value("history_app_request_errors_total") == errors + 1
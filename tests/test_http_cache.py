@@ -0,0 +1,72 @@
+"""
+Test suite for the cache of serialized responses.
+
+This module contains test cases for the following scenarios:
+1. Matching If-None-Match headers against an ETag.
+2. Expiring entries after their TTL and dropping them on invalidation.
+3. Not storing a response read before an invalidation.
+"""
+
+from helpers.http.cache import ResponseCache, etag_matches, make_etag
+from tests.test_dns_cache import FakeClock
+
+
+def test_etag_matches():
+    """
+    Test case for If-None-Match headers.
+
+    Expected behavior:
+    - The ETag matches alone, in a list, with a weak prefix, or with "*".
+    - Other or missing ETags do not match.
+    """
+    etag = make_etag(b"[]")
+    assert etag == make_etag(b"[]") != make_etag(b"[1]")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_response_cache_expiry_and_invalidation():
+    """
+    Test case for the lifetime of the entries.
+
+    Expected behavior:
+    - An entry is served until its TTL, and invalidation drops every entry.
+    - A TTL of 0 disables the cache.
+    """
+    clock = FakeClock()
+    cache = ResponseCache(2, clock=clock)
+    entry = cache.put(20, b"[]", {"X-Next-Cursor": "abc"})
+    assert cache.get(20) == entry
+    assert entry.etag == make_etag(b"[]")
+    clock.now += 2
+    assert cache.get(20) is None
+
+    cache.put(20, b"[]")
+    cache.invalidate()
+    assert cache.get(20) is None
+
+    disabled = ResponseCache(0, clock=clock)
+    disabled.put(20, b"[]")
+    assert disabled.get(20) is None
+
+
+def test_response_cache_skips_stale_reads():
+    """
+    Test case for a response read while the data was being written.
+
+    Expected behavior:
+    - A response whose data was read before an invalidation is returned but
+      not stored, and one read after it is stored.
+    """
+    cache = ResponseCache(60, clock=FakeClock())
+    generation = cache.generation
+    cache.invalidate()
+    entry = cache.put(20, b"[old]", generation=generation)
+    assert entry.body == b"[old]"
+    assert cache.get(20) is None
+
+    cache.put(20, b"[new]", generation=cache.generation)
+    assert cache.get(20).body == b"[new]"
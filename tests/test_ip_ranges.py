@@ -0,0 +1,143 @@
+"""
+Test suite for the CIDR range index classifying addresses.
+
+This module contains test cases for the following scenarios:
+1. Labeling addresses with the built-in special-purpose ranges.
+2. Combining the labels of overlapping networks, at their exact boundaries.
+3. Agreeing with a linear scan of the networks on random addresses.
+4. Loading customer lists from files and swapping the index when they change.
+5. Keeping the current index when a changed list file is invalid.
+"""
+
+import asyncio
+import ipaddress
+import os
+import random
+
+from helpers.ip.ranges import PolicyStore, RangeIndex, builtin_networks
+
+
+def networks(*pairs):
+    """Builds (network, label) pairs from (cidr, label) strings."""
+    return [(ipaddress.ip_network(cidr), label) for cidr, label in pairs]
+
+
+def test_builtin_labels():
+    """
+    Test case for the built-in ranges.
+
+    Expected behavior:
+    - Private, loopback, reserved, link-local and multicast addresses of both
+      families get their label, and public addresses get none.
+    """
+    index = RangeIndex(builtin_networks())
+    assert index.classify("10.1.2.3") == ("private",)
+    assert index.classify("192.168.0.1") == ("private",)
+    assert index.classify("127.0.0.1") == ("loopback",)
+    assert index.classify("240.0.0.1") == ("reserved",)
+    assert index.classify("169.254.1.1") == ("link_local",)
+    assert index.classify("239.1.1.1") == ("multicast",)
+    assert index.classify("fd00::1") == ("private",)
+    assert index.classify("::1") == ("loopback",)
+    assert index.classify("2001:db8::1") == ("reserved",)
+    assert index.classify("8.8.8.8") == ()
+    assert index.classify("2606:4700::1111") == ()
+
+
+def test_overlapping_networks():
+    """
+    Test case for overlapping networks of several lists.
+
+    Expected behavior:
+    - An address gets the labels of every network containing it, and the
+      labels change exactly at the first and last address of each network.
+    """
+    index = RangeIndex(
+        networks(
+            ("10.0.0.0/8", "private"),
+            ("10.1.0.0/16", "allow"),
+            ("10.1.2.0/24", "deny"),
+            ("10.1.2.0/24", "allow"),
+        )
+    )
+    assert index.classify("9.255.255.255") == ()
+    assert index.classify("10.0.0.0") == ("private",)
+    assert index.classify("10.0.255.255") == ("private",)
+    assert index.classify("10.1.0.0") == ("allow", "private")
+    assert index.classify("10.1.2.0") == ("allow", "deny", "private")
+    assert index.classify("10.1.2.255") == ("allow", "deny", "private")
+    assert index.classify("10.1.3.0") == ("allow", "private")
+    assert index.classify("10.255.255.255") == ("private",)
+    assert index.classify("11.0.0.0") == ()
+    assert index.classify("255.255.255.255") == ()
+
+
+def test_matches_linear_scan():
+    """
+    Test case comparing the index with a linear scan of the networks.
+
+    Expected behavior:
+    - For random networks and addresses, the index gives the same labels as
+      checking every network.
+    """
+    rng = random.Random(8)
+    pairs = []
+    for _ in range(500):
+        prefix = rng.randint(8, 32)
+        address = ipaddress.IPv4Address(rng.getrandbits(32))
+        network = ipaddress.ip_network(f"{address}/{prefix}", strict=False)
+        pairs.append((network, rng.choice(["allow", "deny", "partner"])))
+    index = RangeIndex(pairs)
+    samples = [ipaddress.IPv4Address(rng.getrandbits(32)) for _ in range(2000)]
+    samples += [network.network_address for network, _ in pairs]
+    samples += [network.broadcast_address for network, _ in pairs]
+    for address in samples:
+        expected = tuple(sorted({label for n, label in pairs if address in n}))
+        assert index.classify(str(address)) == expected
+
+
+def test_policy_store_reload(tmp_path):
+    """
+    Test case for customer lists loaded from files.
+
+    Expected behavior:
+    - The list files are loaded with the built-in ranges, comments ignored.
+    - Nothing is rebuilt while the files are unchanged, and a changed file
+      swaps in a new index.
+    """
+    deny = tmp_path / "deny.txt"
+    deny.write_text("# blocked\n203.0.114.0/24\n\n198.51.100.7  # single\n")
+    store = PolicyStore({"deny": str(deny)})
+    first = store.load()
+    assert store.index.classify("203.0.114.9") == ("deny",)
+    assert store.index.classify("198.51.100.7") == ("deny", "reserved")
+    assert store.index.classify("10.0.0.1") == ("private",)
+
+    assert asyncio.run(store.reload_if_changed()) is False
+    assert store.index is first
+
+    deny.write_text("8.8.8.0/24\n")
+    os.utime(deny, (0, os.stat(deny).st_mtime + 10))
+    assert asyncio.run(store.reload_if_changed()) is True
+    assert store.index is not first
+    assert store.index.classify("8.8.8.8") == ("deny",)
+    assert store.index.classify("203.0.114.9") == ()
+
+
+def test_policy_store_keeps_index_on_error(tmp_path):
+    """
+    Test case for a list file changed into an invalid one.
+
+    Expected behavior:
+    - The reload fails and the previous index keeps serving lookups.
+    """
+    allow = tmp_path / "allow.txt"
+    allow.write_text("1.1.1.0/24\n")
+    store = PolicyStore({"allow": str(allow)})
+    first = store.load()
+
+    allow.write_text("1.1.1.0/24\nnot-a-network\n")
+    os.utime(allow, (0, os.stat(allow).st_mtime + 10))
+    assert asyncio.run(store.reload_if_changed()) is False
+    assert store.index is first
+    assert store.index.classify("1.1.1.1") == ("allow",)
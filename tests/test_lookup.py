@@ -6,12 +6,16 @@ This module contains test cases for the following scenarios:
    details, such as the domain name and associated IPv4 addresses.
 2. Handling an invalid domain name lookup, ensuring the appropriate
    error status code and message are returned.
+3. Looking up a batch of domains, with per-domain results and errors.
+4. Streaming batch lookup results as NDJSON.
 
 The client fixture is used to interact with the FastAPI application,
 allowing the test cases to simulate HTTP requests to the relevant
 endpoints and validate their responses.
 """
 
+import json
+
 
 def test_lookup_valid_domain(client):
     """
@@ -54,3 +58,70 @@ def test_lookup_invalid_domain(client):
     response = client.get("/v1/tools/lookup?domain=invalid-domain")
     assert response.status_code == 400
     assert response.json() == {"detail": "Domain not found"}
+
+
+def test_lookup_batch(client, local_dns, logged_queries):
+    """
+    Test case for a batch lookup mixing known and unknown domains.
+
+    This test ensures that:
+    1. A POST request is made to the /v1/tools/lookup/batch endpoint.
+    2. Every domain gets its own result, in request order.
+    3. Every resolved domain is queued for logging.
+
+    Expected behavior:
+    - Status code should be 200 (OK).
+    - Known domains have their IPv4 addresses, unknown ones an error.
+    - One query log is queued per resolved domain.
+    """
+    records = {f"host{i}.example": [f"10.0.0.{i}"] for i in range(50)}
+    local_dns(records=records)
+
+    domains = list(records) + ["missing.example"]
+    response = client.post("/v1/tools/lookup/batch", json={"domains": domains})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["domain"] for result in results] == domains
+    assert results[0] == {"domain": "host0.example", "ipv4": ["10.0.0.0"]}
+    assert results[-1] == {"domain": "missing.example", "error": "Domain not found"}
+    assert sorted(logged_queries) == sorted(records.items())
+
+
+def test_lookup_batch_empty(client):
+    """
+    Test case for a batch lookup without any domain.
+
+    Expected behavior:
+    - Status code should be 422 (Unprocessable Entity).
+    """
+    response = client.post("/v1/tools/lookup/batch", json={"domains": []})
+    assert response.status_code == 422
+
+
+def test_lookup_stream(client, local_dns, logged_queries):
+    """
+    Test case for a streamed batch lookup.
+
+    This test ensures that:
+    1. A POST request is made to the /v1/tools/lookup/stream endpoint.
+    2. One NDJSON line is returned per domain, with its index in the request.
+    3. The resolved domains are queued for logging while streaming.
+
+    Expected behavior:
+    - Status code should be 200 (OK) with an application/x-ndjson body.
+    - Every domain appears exactly once in the stream.
+    - One query log is queued per resolved domain.
+    """
+    records = {f"host{i}.example": [f"10.0.1.{i}"] for i in range(25)}
+    local_dns(records=records)
+
+    domains = list(records) + ["missing.example"]
+    response = client.post("/v1/tools/lookup/stream", json={"domains": domains})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(len(domains)))
+    by_domain = {line["domain"]: line for line in lines}
+    assert by_domain["host3.example"]["ipv4"] == ["10.0.1.3"]
+    assert by_domain["missing.example"]["error"] == "Domain not found"
+    assert len(logged_queries) == 25
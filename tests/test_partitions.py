@@ -0,0 +1,153 @@
+"""
+Test suite for the maintenance of the query log partitions.
+
+This module contains test cases for the following scenarios:
+1. Planning the partitions of the current and next periods.
+2. Planning around partitions that do not match the period length.
+3. Dropping the partitions older than the retention.
+4. Creating partitions in the database, moving their rows out of the default
+   partition, and pruning the other partitions from time range queries.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select, text
+
+from db.database import engine
+from db.partitions import (
+    Partition,
+    drop_partition,
+    maintain_partitions,
+    period_start,
+    plan_partitions,
+)
+from db.writer import insert_query_logs
+from models.log import QueryLog
+
+
+def utc(*args):
+    """Returns an aware UTC datetime."""
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_plan_partitions_ahead():
+    """
+    Test case for the partitions created ahead of the clock.
+
+    Expected behavior:
+    - The current period and the next `ahead` ones are created, aligned on
+      UTC midnight, except those that already exist.
+    """
+    now = utc(2026, 10, 18, 17, 30)
+    create, drop = plan_partitions([], now, days=1, ahead=2, retention_days=0)
+    assert create == [
+        (utc(2026, 10, 18), utc(2026, 10, 19)),
+        (utc(2026, 10, 19), utc(2026, 10, 20)),
+        (utc(2026, 10, 20), utc(2026, 10, 21)),
+    ]
+    assert drop == []
+
+    existing = [Partition("query_log_p20261018", *create[0])]
+    create, _ = plan_partitions(existing, now, days=1, ahead=2, retention_days=0)
+    assert create[0] == (utc(2026, 10, 19), utc(2026, 10, 20))
+    assert len(create) == 2
+
+
+def test_plan_partitions_gaps():
+    """
+    Test case for existing partitions not aligned with the periods.
+
+    Expected behavior:
+    - Weekly periods start on the same weekday as the epoch.
+    - Only the parts of a period not covered by the legacy partition, or by
+      partitions of a previous period length, are created.
+    """
+    assert period_start(utc(2026, 10, 18, 12), days=7) == utc(2026, 10, 15)
+
+    existing = [
+        Partition("query_log_legacy", None, utc(2026, 10, 17)),
+        Partition("query_log_p20261020", utc(2026, 10, 20), utc(2026, 10, 21)),
+    ]
+    create, _ = plan_partitions(
+        existing, utc(2026, 10, 18), days=7, ahead=1, retention_days=0
+    )
+    assert create == [
+        (utc(2026, 10, 17), utc(2026, 10, 20)),
+        (utc(2026, 10, 21), utc(2026, 10, 22)),
+        (utc(2026, 10, 22), utc(2026, 10, 29)),
+    ]
+
+
+def test_plan_partitions_retention():
+    """
+    Test case for the partitions past the retention.
+
+    Expected behavior:
+    - Only partitions whose whole range is older than the retention are
+      dropped, the legacy one included, and a retention of 0 keeps them all.
+    """
+    existing = [
+        Partition("query_log_legacy", None, utc(2026, 9, 1)),
+        Partition("query_log_p20260917", utc(2026, 9, 17), utc(2026, 9, 18)),
+        Partition("query_log_p20260918", utc(2026, 9, 18), utc(2026, 9, 19)),
+    ]
+    now = utc(2026, 10, 18, 12)
+    _, drop = plan_partitions(existing, now, days=1, ahead=0, retention_days=30)
+    assert drop == ["query_log_legacy", "query_log_p20260917"]
+    _, drop = plan_partitions(existing, now, days=1, ahead=0, retention_days=0)
+    assert drop == []
+
+
+def test_maintain_partitions():
+    """
+    Test case for a maintenance pass against the database.
+
+    Expected behavior:
+    - The partitions of the planned periods are created, and the rows of
+      their range logged in the default partition are moved into them.
+    - A second pass has nothing to do.
+    - A time range query only scans the partition of its range.
+    """
+    start = utc(2090, 1, 1)
+    logged = start + timedelta(hours=12)
+    insert_query_logs([{"domain": "partitioned.example", "created_time": logged}])
+    created = []
+    try:
+        created, dropped = maintain_partitions(
+            now=start, days=1, ahead=1, retention_days=0
+        )
+        assert created == ["query_log_p20900101", "query_log_p20900102"]
+        assert dropped == []
+        assert maintain_partitions(now=start, days=1, ahead=1, retention_days=0) == (
+            [],
+            [],
+        )
+
+        with engine.connect() as connection:
+            table = connection.execute(
+                text(
+                    "SELECT query_log.tableoid::regclass::text FROM query_log "
+                    'JOIN domain USING ("domainID") '
+                    "WHERE name = 'partitioned.example'"
+                )
+            ).scalar()
+            assert table == "query_log_p20900101"
+
+            statement = select(QueryLog).where(
+                QueryLog.created_time >= start,
+                QueryLog.created_time < start + timedelta(days=1),
+            )
+            compiled = statement.compile(engine)
+            plan = "\n".join(
+                connection.exec_driver_sql(
+                    "EXPLAIN (COSTS OFF) " + str(compiled), compiled.params
+                ).scalars()
+            )
+            assert "query_log_p20900101" in plan
+            assert "query_log_p20900102" not in plan
+            assert "query_log_default" not in plan
+    finally:
+        with engine.begin() as connection:
+            for name in created:
+                drop_partition(connection, name)
+            connection.execute(delete(QueryLog).where(QueryLog.created_time == logged))
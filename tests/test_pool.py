@@ -0,0 +1,132 @@
+"""
+Test suite for the configuration, telemetry and warm-up of the DB pools.
+
+This module contains test cases for the following scenarios:
+1. Warming up the pools of sync and async engines, and exporting their
+   connections, connect times and checkout waits.
+2. Counting the checkouts given up after the pool timeout.
+3. Warming up the pools of the app at startup.
+"""
+
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db import database
+from db.pool import TimedQueuePool, instrument, pool_options, warm_up
+
+
+def sample(name, pool):
+    """Returns the value of a pool metric sample, 0 when not exported yet."""
+    return REGISTRY.get_sample_value(name, {"pool": pool}) or 0
+
+
+def test_sync_pool():
+    """
+    Test case for the pool of a sync engine.
+
+    Expected behavior:
+    - The pool has the configured class and the given size.
+    - Warming up opens the connections concurrently, up to the pool size, and
+      leaves them idle in the pool, each connect being observed.
+    - Checkouts of idle connections are observed as waits, and checked-out
+      connections are exported.
+    """
+    engine = instrument(
+        create_engine(database.DATABASE_URL, **pool_options("test-sync", pool_size=3))
+    )
+    try:
+        assert isinstance(engine.pool, TimedQueuePool)
+        connects = sample("db_pool_connect_duration_seconds_count", "test-sync")
+        assert asyncio.run(warm_up(engine, 10)) == 3
+        assert sample("db_pool_idle", "test-sync") == 3
+        assert sample("db_pool_connect_duration_seconds_count", "test-sync") == (
+            connects + 3
+        )
+
+        waits = sample("db_pool_checkout_wait_seconds_count", "test-sync")
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT 1")).scalar() == 1
+            assert sample("db_pool_checked_out", "test-sync") == 1
+            assert sample("db_pool_overflow", "test-sync") == 0
+        assert sample("db_pool_checkout_wait_seconds_count", "test-sync") == waits + 1
+        # No new connection was needed
+        assert sample("db_pool_connect_duration_seconds_count", "test-sync") == (
+            connects + 3
+        )
+    finally:
+        engine.dispose()
+
+
+def test_async_pool():
+    """
+    Test case for the pool of an async engine.
+
+    Expected behavior:
+    - Warming up opens the connections on the event loop and leaves them idle.
+    - Nothing is opened when the warm-up is disabled.
+    """
+    engine = instrument(
+        create_async_engine(
+            database.async_url(database.DATABASE_URL),
+            **pool_options("test-async", asynchronous=True, pool_size=2),
+        )
+    )
+
+    async def run():
+        try:
+            assert await warm_up(engine, 0) == 0
+            assert engine.pool.checkedin() == 0
+            assert await warm_up(engine, 2) == 2
+            assert sample("db_pool_idle", "test-async") == 2
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_pool_timeout():
+    """
+    Test case for a checkout finding the pool exhausted.
+
+    Expected behavior:
+    - The checkout fails after the pool timeout and is counted.
+    """
+    engine = instrument(
+        create_engine(
+            database.DATABASE_URL,
+            **pool_options(
+                "test-timeout", pool_size=1, max_overflow=0, pool_timeout=0.1
+            ),
+        )
+    )
+    timeouts = sample("db_pool_checkout_timeouts_total", "test-timeout")
+    try:
+        with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        assert sample("db_pool_checkout_timeouts_total", "test-timeout") == (
+            timeouts + 1
+        )
+    finally:
+        engine.dispose()
+
+
+def test_pools_warmed_up(client):
+    """
+    Test case for the warm-up of the pools of the app.
+
+    Expected behavior:
+    - Once started, the pools of the primary hold open connections, and their
+      telemetry is exported.
+    """
+    assert database.engine.pool.checkedin() + database.engine.pool.checkedout() > 0
+    assert database.async_engine.pool.checkedin() > 0
+    response = client.get("/metrics")
+    assert 'db_pool_checked_out{pool="primary"}' in response.text
+    assert 'db_pool_connect_duration_seconds_count{pool="primary-sync"}' in (
+        response.text
+    )
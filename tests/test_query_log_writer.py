@@ -0,0 +1,197 @@
+"""
+Test suite for the write-behind query log writer.
+
+This module contains test cases for the following scenarios:
+1. Writing queued rows in batches once a batch is full.
+2. Writing a partial batch once its oldest row reaches the flush interval.
+3. Draining every queued row when the writer is stopped.
+4. Dropping rows when the queue is full and the policy is "drop".
+5. Spilling rows to disk when the database is down and the policy is "spill",
+   then replaying them once writes succeed again.
+6. Resuming a replay interrupted by a failure or a restart without losing or
+   duplicating rows.
+
+The writers under test use an in-memory insert function instead of the
+database.
+"""
+
+import asyncio
+import json
+
+from db.writer import QueryLogWriter
+
+
+class FakeDatabase:
+    """Insert function recording each batch, optionally failing."""
+
+    def __init__(self):
+        self.batches = []
+        self.down = False
+
+    def __call__(self, rows):
+        if self.down:
+            raise ConnectionError("database is down")
+        self.batches.append([row["domain"] for row in rows])
+
+
+def test_writer_flushes_by_size():
+    """
+    Test case for rows arriving faster than the flush interval.
+
+    Expected behavior:
+    - Rows are written in full batches without waiting for the interval.
+    """
+    database = FakeDatabase()
+    writer = QueryLogWriter(batch_size=10, flush_interval=60, insert=database)
+
+    async def scenario():
+        writer.start()
+        for i in range(25):
+            await writer.put(f"host{i}.example", ["1.1.1.1"])
+        await asyncio.sleep(0.1)
+        flushed = [len(batch) for batch in database.batches]
+        await writer.stop()
+        return flushed
+
+    assert asyncio.run(scenario()) == [10, 10]
+    assert [len(batch) for batch in database.batches] == [10, 10, 5]
+
+
+def test_writer_flushes_by_age():
+    """
+    Test case for a trickle of rows.
+
+    Expected behavior:
+    - A partial batch is written once the flush interval has elapsed.
+    """
+    database = FakeDatabase()
+    writer = QueryLogWriter(batch_size=100, flush_interval=0.05, insert=database)
+
+    async def scenario():
+        writer.start()
+        await writer.put("example.com", ["1.1.1.1"])
+        await asyncio.sleep(0.2)
+        flushed = list(database.batches)
+        await writer.stop()
+        return flushed
+
+    assert asyncio.run(scenario()) == [["example.com"]]
+
+
+def test_writer_drops_on_overflow():
+    """
+    Test case for a full queue with the "drop" policy.
+
+    Expected behavior:
+    - Rows that do not fit in the queue are discarded without blocking.
+    """
+    database = FakeDatabase()
+    writer = QueryLogWriter(queue_size=5, overflow="drop", insert=database)
+
+    async def scenario():
+        writer.start()
+        for i in range(20):  # The writer task does not run between puts
+            await writer.put(f"host{i}.example", ["1.1.1.1"])
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert sum(len(batch) for batch in database.batches) == 5
+
+
+def test_writer_spills_and_replays(tmp_path):
+    """
+    Test case for a database outage with the "spill" policy.
+
+    Expected behavior:
+    - Rows that fail to be written are kept in the spill file.
+    - They are written once the database is back, and the file is removed.
+    """
+    database = FakeDatabase()
+    spill_path = tmp_path / "spill.ndjson"
+    writer = QueryLogWriter(
+        flush_interval=0.01,
+        overflow="spill",
+        spill_path=str(spill_path),
+        insert=database,
+    )
+
+    async def scenario():
+        writer.start()
+        database.down = True
+        await writer.put("a.example", ["1.1.1.1"])
+        await asyncio.sleep(0.1)
+        assert spill_path.exists()
+        database.down = False
+        await writer.put("b.example", ["2.2.2.2"])
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert sorted(sum(database.batches, [])) == ["a.example", "b.example"]
+    assert not spill_path.exists()
+
+
+def test_writer_resumes_interrupted_replay(tmp_path):
+    """
+    Test case for a replay file left by a previous run, failing midway.
+
+    Expected behavior:
+    - The replay file is replayed when the writer starts, before the spill file.
+    - On a failed batch it keeps only the rows not written yet, which are
+      written by the next replay, once each.
+    - Both files are removed once every row is written.
+    """
+    spill_path = tmp_path / "spill.ndjson"
+    replay_path = tmp_path / "spill.ndjson.replay"
+    created = "2024-01-01T00:00:00+00:00"
+    replay_path.write_text(
+        "".join(
+            json.dumps({"domain": d, "client_ip": [], "created_time": created}) + "\n"
+            for d in ("a.example", "b.example", "c.example")
+        )
+    )
+    spilled = {"domain": "d.example", "client_ip": [], "created_time": created}
+    spill_path.write_text(json.dumps(spilled) + "\n")
+    attempts, remaining = [], []
+
+    def insert(rows):
+        attempts.append(rows[0]["domain"])
+        if len(attempts) == 2:
+            raise ConnectionError("database is down")
+        if len(attempts) == 3:
+            remaining.extend(json.loads(line)["domain"] for line in replay_path.open())
+
+    writer = QueryLogWriter(
+        batch_size=1, overflow="spill", spill_path=str(spill_path), insert=insert
+    )
+
+    async def scenario():
+        writer.start()
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert remaining == ["b.example", "c.example"]
+    assert attempts == ["a.example", "b.example", "b.example", "c.example", "d.example"]
+    assert not replay_path.exists()
+    assert not spill_path.exists()
+
+
+def test_writer_flush_waits_for_rows():
+    """
+    Test case for an explicit flush.
+
+    Expected behavior:
+    - Every row queued before the flush is written when it returns, without
+      waiting for the flush interval.
+    """
+    database = FakeDatabase()
+    writer = QueryLogWriter(batch_size=100, flush_interval=60, insert=database)
+
+    async def scenario():
+        writer.start()
+        await writer.put("example.com", ["1.1.1.1"])
+        await writer.flush()
+        flushed = list(database.batches)
+        await writer.stop()
+        return flushed
+
+    assert asyncio.run(scenario()) == [["example.com"]]
@@ -0,0 +1,147 @@
+"""
+Test suite for the routing of reads to read replicas.
+
+This module contains test cases for the following scenarios:
+1. Falling back to the primary until a check finds a healthy replica.
+2. Going round-robin over the healthy replicas, leaving out the lagging and
+   unreachable ones.
+3. Measuring the lag of caught-up replicas, leaving out those whose WAL
+   receiver disconnected from the primary.
+4. Checking local database stand-ins for real and serving read-only endpoints
+   from them.
+"""
+
+import asyncio
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db import database
+from db.replicas import DB_READS_ROUTED, ReplicaSet, lag_of
+
+
+def routed(target):
+    """Returns the number of read sessions routed to `target` so far."""
+    return DB_READS_ROUTED.labels(target=target)._value.get()
+
+
+def stand_in(host, port=5432, database_name="replica"):
+    """Returns an engine to a replica stand-in, not connected until used."""
+    url = database.async_url(database.DATABASE_URL).set(
+        host=host, port=port, database=database_name
+    )
+    return create_async_engine(url, connect_args={"timeout": 2})
+
+
+def test_replica_routing():
+    """
+    Test case for the choice of the read engine.
+
+    Expected behavior:
+    - Reads go to the primary before the first check.
+    - Healthy replicas are used in turn, lagging or unreachable ones are left
+      out, and reads fall back to the primary when no replica is usable.
+    """
+    primary = stand_in("primary")
+    first, second = stand_in("replica1"), stand_in("replica2")
+    lags = {first: 0.5, second: 0.0}
+
+    async def measure_lag(engine):
+        lag = lags[engine]
+        if lag is None:
+            raise ConnectionError("replica down")
+        return lag
+
+    replicas = ReplicaSet(primary, [first, second], max_lag=1, measure_lag=measure_lag)
+    assert replicas.read_engine() is primary
+
+    assert asyncio.run(replicas.check()) == {
+        "replica1:5432/replica": True,
+        "replica2:5432/replica": True,
+    }
+    picked = {replicas.read_engine(), replicas.read_engine()}
+    assert picked == {first, second}
+
+    lags[first] = 30.0
+    asyncio.run(replicas.check())
+    assert replicas.healthy() == [second]
+    assert {replicas.read_engine() for _ in range(3)} == {second}
+
+    lags[second] = None
+    asyncio.run(replicas.check())
+    assert replicas.read_engine() is primary
+
+
+def test_disconnected_receiver():
+    """
+    Test case for the lag of replicas that replayed all the WAL they received.
+
+    Expected behavior:
+    - A replica streaming from the primary, which it heard from recently, has
+      no lag.
+    - A replica whose WAL receiver disconnected, or stopped hearing from the
+      primary, gets the age of its last replayed transaction, and is left out
+      when it never replayed one.
+    """
+    streaming = {
+        "in_recovery": True,
+        "caught_up": True,
+        "receiver_status": "streaming",
+        "receipt_age": 1.0,
+        "replay_age": 600.0,
+    }
+    states = {
+        stand_in("replica1"): streaming,
+        stand_in("replica2"): {**streaming, "receiver_status": None},
+        stand_in("replica3"): {**streaming, "receipt_age": 3600.0},
+        stand_in("replica4"): {
+            **streaming,
+            "receiver_status": "waiting",
+            "replay_age": None,
+        },
+    }
+
+    async def measure_lag(engine):
+        return lag_of(states[engine])
+
+    replicas = ReplicaSet(
+        stand_in("primary"), list(states), max_lag=5, measure_lag=measure_lag
+    )
+    assert asyncio.run(replicas.check()) == {
+        "replica1:5432/replica": True,
+        "replica2:5432/replica": False,
+        "replica3:5432/replica": False,
+        "replica4:5432/replica": False,
+    }
+    assert lag_of({**streaming, "in_recovery": False}) == 0
+
+
+def test_replica_stand_ins(client, monkeypatch):
+    """
+    Test case for local databases standing in for replicas.
+
+    Expected behavior:
+    - Two reachable stand-ins, which are not in recovery, have no lag and are
+      used, while an unreachable one is left out.
+    - Read-only endpoints are served from the stand-ins.
+    """
+    url = make_url(database.DATABASE_URL)
+    live = [
+        stand_in(host, url.port, url.database) for host in ("localhost", "127.0.0.1")
+    ]
+    dead = stand_in("127.0.0.1", 1, url.database)
+    monkeypatch.setattr(database.replicas, "replicas", live + [dead])
+    # Connections are bound to a loop, check on the loop of the app
+    states = client.portal.call(database.replicas.check)
+    assert list(states.values()) == [True, True, False]
+    assert database.replicas.healthy() == live
+
+    before = routed("replica")
+    response = client.get("/v1/stats/domains")
+    assert response.status_code == 200
+    assert routed("replica") == before + 1
+
+    client.portal.call(database.replicas.dispose)
+    monkeypatch.setattr(database.replicas, "replicas", [])
+    client.portal.call(database.replicas.check)
+    assert database.replicas.read_engine() is database.async_engine
@@ -0,0 +1,284 @@
+"""
+Test suite for the normalized resolutions and the /resolutions endpoints.
+
+This module contains test cases for the following scenarios:
+1. Parsing the resolved addresses of a lookup.
+2. Grouping successive lookups of a domain answered with the same addresses
+   into one resolution, across batches, and serving them in the history.
+3. Only recording the changes of the answers in the "changes" mode, and
+   serving them as the change history of a domain.
+4. Finding the domains resolved to an address or into a network.
+5. Rejecting invalid addresses.
+6. Storing the lookups of a domain under one name whatever its case and
+   trailing dot.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, select
+
+from db.database import engine
+from db.resolutions import address_set
+from db.writer import QueryLogWriter, insert_query_logs
+from models.log import QueryLog
+from models.resolution import Domain, Resolution, ResolutionAddress
+
+
+def forget(domains):
+    """Deletes the query logs, resolutions and domains written by a test."""
+    ids = select(Domain.domainID).where(Domain.name.in_(domains))
+    with engine.begin() as connection:
+        connection.execute(delete(QueryLog).where(QueryLog.domainID.in_(ids)))
+        connection.execute(delete(Resolution).where(Resolution.domainID.in_(ids)))
+        connection.execute(delete(Domain).where(Domain.name.in_(domains)))
+
+
+def test_address_set():
+    """
+    Test case for the parsing of resolved addresses.
+
+    Expected behavior:
+    - Addresses are deduplicated and compared by value, invalid ones are left
+      out.
+    """
+    assert address_set(["198.51.100.1", "2001:db8::1", "2001:DB8:0::1", "x"]) == (
+        address_set(["2001:db8::1", "198.51.100.1"])
+    )
+    assert address_set(None) == frozenset()
+
+
+def test_record_resolutions(client):
+    """
+    Test case for the resolutions recorded by the query log writer.
+
+    Expected behavior:
+    - Successive lookups answered with the same addresses, in any order, share
+      a resolution, extended by later batches, and any other answer starts a
+      new one, even if an earlier resolution had the same addresses.
+    - Each resolution counts its lookups.
+    - The history returns the domain and the addresses of each entry.
+    """
+    start = datetime(2095, 1, 1, tzinfo=timezone.utc)
+    first, second = ["198.51.100.1", "198.51.100.2"], ["198.51.100.3"]
+    answers = [first, first[::-1], second, first]
+    rows = [
+        {
+            "domain": "resolved.example",
+            "client_ip": addresses,
+            "created_time": start + timedelta(minutes=i),
+        }
+        for i, addresses in enumerate(answers)
+    ]
+    # Lookups are taken in time order whatever their order in the batch
+    insert_query_logs(rows[::-1])
+    insert_query_logs(
+        [{**rows[0], "created_time": start + timedelta(minutes=len(answers))}]
+    )
+    try:
+        with engine.connect() as connection:
+            resolutions = connection.execute(
+                select(
+                    Resolution.resolutionID,
+                    Resolution.first_seen,
+                    Resolution.last_seen,
+                    Resolution.lookups,
+                )
+                .join(Domain, Domain.domainID == Resolution.domainID)
+                .where(Domain.name == "resolved.example")
+                .order_by(Resolution.first_seen)
+            ).all()
+            assert [tuple(row)[1:] for row in resolutions] == [
+                (start, start + timedelta(minutes=1), 2),
+                (start + timedelta(minutes=2), start + timedelta(minutes=2), 1),
+                (start + timedelta(minutes=3), start + timedelta(minutes=4), 2),
+            ]
+            addresses = connection.execute(
+                select(ResolutionAddress.address).where(
+                    ResolutionAddress.resolutionID == resolutions[-1].resolutionID
+                )
+            ).scalars()
+            assert sorted(addresses) == first
+            latest = connection.execute(
+                select(Domain.resolutionID).where(Domain.name == "resolved.example")
+            ).scalar()
+            assert latest == resolutions[-1].resolutionID
+
+        response = client.get(
+            "/v1/history",
+            params={"domain": "resolved.example", "since": start.isoformat()},
+        )
+        assert [
+            (entry["domain"], entry["client_ip"].strip("{}").split(","))
+            for entry in response.json()
+        ] == [("resolved.example", first)] * 2 + [
+            ("resolved.example", second),
+            ("resolved.example", first),
+            ("resolved.example", first),
+        ]
+    finally:
+        forget(["resolved.example"])
+
+
+def test_domain_names_folded(client):
+    """
+    Test case for domain names given in different cases.
+
+    Expected behavior:
+    - Lookups of a domain in any case, with or without a trailing dot, share
+      its domain row and its resolution.
+    - The change history and the history find the domain in any case.
+    """
+    start = datetime(2095, 5, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "domain": domain,
+            "client_ip": ["198.51.100.9"],
+            "created_time": start + timedelta(minutes=i),
+        }
+        for i, domain in enumerate(["Case.Example.", "case.example", "CASE.example"])
+    ]
+    insert_query_logs(rows)
+    try:
+        with engine.connect() as connection:
+            names = connection.execute(
+                select(Domain.name).where(Domain.name.ilike("case.example%"))
+            ).scalars()
+            assert list(names) == ["case.example"]
+
+        response = client.get(
+            "/v1/resolutions/changes", params={"domain": "Case.EXAMPLE"}
+        )
+        assert [change["lookups"] for change in response.json()] == [3]
+        response = client.get(
+            "/v1/history",
+            params={"domain": "CASE.example.", "since": start.isoformat()},
+        )
+        assert [entry["domain"] for entry in response.json()] == ["case.example"] * 3
+    finally:
+        forget(["case.example"])
+
+
+def test_changes_mode(client):
+    """
+    Test case for the "changes" mode of the query log writer.
+
+    Expected behavior:
+    - Lookups are not logged one by one, only a change of the answer adds a
+      resolution, and the other lookups are counted in the latest one.
+    - The change history of the domain lists its answers, the latest first.
+    - Unknown modes are rejected.
+    """
+    start = datetime(2095, 3, 1, tzinfo=timezone.utc)
+    first, second = ["198.51.100.7"], ["198.51.100.8", "2001:db8::8"]
+    rows = [
+        {
+            "domain": "changing.example",
+            "client_ip": addresses,
+            "created_time": start + timedelta(minutes=i),
+        }
+        for i, addresses in enumerate([first, first, second, second, second])
+    ]
+    insert_query_logs(rows[:3], mode="changes")
+    insert_query_logs(rows[3:], mode="changes")
+    insert_query_logs(
+        [{**rows[0], "created_time": start + timedelta(minutes=5)}], mode="changes"
+    )
+    try:
+        with engine.connect() as connection:
+            logged = connection.execute(
+                select(QueryLog.queryID).where(QueryLog.created_time >= start)
+            ).all()
+            assert logged == []
+
+        response = client.get(
+            "/v1/resolutions/changes", params={"domain": "changing.example"}
+        )
+        assert response.status_code == 200
+        assert [
+            (change["addresses"], change["lookups"]) for change in response.json()
+        ] == [(first, 1), (second, 3), (first, 2)]
+        assert response.json()[1]["first_seen"] == (
+            (start + timedelta(minutes=2)).isoformat().replace("+00:00", "Z")
+        )
+        assert response.json()[1]["last_seen"] == (
+            (start + timedelta(minutes=4)).isoformat().replace("+00:00", "Z")
+        )
+
+        response = client.get(
+            "/v1/resolutions/changes", params={"domain": "unknown.example"}
+        )
+        assert response.json() == []
+    finally:
+        forget(["changing.example"])
+
+    with pytest.raises(ValueError):
+        QueryLogWriter(mode="sometimes")
+
+
+def test_reverse_lookup(client):
+    """
+    Test case for the /resolutions/reverse endpoint.
+
+    Expected behavior:
+    - An address gives the domains resolved to it, a network the domains
+      resolved to any address in it, the most recently seen first.
+    - Domains resolved to other addresses are left out.
+    """
+    start = datetime(2095, 2, 1, tzinfo=timezone.utc)
+    answers = {
+        "one.reverse.example": ["203.0.113.10"],
+        "two.reverse.example": ["203.0.113.10", "203.0.113.200"],
+        "six.reverse.example": ["2001:db8:113::6"],
+        "far.reverse.example": ["192.0.2.1"],
+    }
+    insert_query_logs(
+        [
+            {
+                "domain": domain,
+                "client_ip": addresses,
+                "created_time": start + timedelta(minutes=i),
+            }
+            for i, (domain, addresses) in enumerate(answers.items())
+        ]
+    )
+    try:
+        response = client.get("/v1/resolutions/reverse", params={"ip": "203.0.113.10"})
+        assert response.status_code == 200
+        assert [entry["domain"] for entry in response.json()] == [
+            "two.reverse.example",
+            "one.reverse.example",
+        ]
+        assert response.json()[1] == {
+            "domain": "one.reverse.example",
+            "address": "203.0.113.10",
+            "first_seen": start.isoformat().replace("+00:00", "Z"),
+            "last_seen": start.isoformat().replace("+00:00", "Z"),
+        }
+
+        response = client.get(
+            "/v1/resolutions/reverse", params={"ip": "203.0.113.0/24", "limit": 2}
+        )
+        assert [(entry["domain"], entry["address"]) for entry in response.json()] == [
+            ("two.reverse.example", "203.0.113.10"),
+            ("two.reverse.example", "203.0.113.200"),
+        ]
+
+        response = client.get(
+            "/v1/resolutions/reverse", params={"ip": "2001:db8:113::/48"}
+        )
+        assert [entry["domain"] for entry in response.json()] == ["six.reverse.example"]
+    finally:
+        forget(list(answers))
+
+
+def test_reverse_lookup_invalid(client):
+    """
+    Test case for invalid /resolutions/reverse requests.
+
+    Expected behavior:
+    - Anything but an address or a network is rejected with 400.
+    """
+    for ip in ("reverse.example", "203.0.113.0/33"):
+        response = client.get("/v1/resolutions/reverse", params={"ip": ip})
+        assert response.status_code == 400
@@ -0,0 +1,296 @@
+"""
+Test suite for the asynchronous DNS resolver used by domain lookups.
+
+This module contains test cases for the following scenarios:
+1. Resolving domains over UDP against a local stand-in DNS server.
+2. Reporting unknown domains as `socket.gaierror`, like the system resolver.
+3. Falling back to TCP when the UDP reply is truncated.
+4. Running thousands of lookups concurrently while capping in-flight queries.
+5. Reporting unreachable nameservers as a temporary failure.
+6. Hedging a slow upstream with a faster one, then ranking the faster first.
+7. Failing over from a dead upstream without waiting for its timeout.
+8. Exposing the per-upstream statistics on the /metrics endpoint.
+9. Sending each query from its own source port, with its name in random case,
+   and rejecting replies whose question does not match it exactly.
+
+The dns_server fixture starts stand-in servers on localhost, so these tests
+do not depend on the network.
+"""
+
+import asyncio
+import socket
+import time
+
+import pytest
+
+from helpers.dns.resolver import (
+    AsyncResolver,
+    _UDPProtocol,
+    build_query,
+    parse_response,
+    randomize_case,
+)
+
+
+def make_resolver(*servers, **kwargs):
+    """Builds a resolver querying the given stand-in servers only."""
+    kwargs.setdefault("timeout", 1)
+    return AsyncResolver(
+        nameservers=[server.address for server in servers], hosts={}, **kwargs
+    )
+
+
+def test_build_query_roundtrip():
+    """
+    Test case for the wire format helpers.
+
+    The query built for a name must parse back with the same transaction ID.
+    """
+    message = bytearray(build_query(4242, "example.com"))
+    message[2] |= 0x80  # Mark it as a response so it can be parsed
+    response = parse_response(bytes(message))
+    assert response.txid == 4242
+    assert response.addresses == []
+
+
+def test_resolve_udp(dns_server):
+    """
+    Test case for a domain answered over UDP.
+
+    Expected behavior:
+    - Every A record of the domain is returned with the record TTL.
+    - A single UDP query is sent.
+    """
+    server = dns_server(records={"example.com": ["1.2.3.4", "5.6.7.8"]}, ttl=120)
+    answer = asyncio.run(make_resolver(server).resolve("Example.com."))
+    assert answer.addresses == ["1.2.3.4", "5.6.7.8"]
+    assert answer.ttl == 120
+    assert server.queries == [("udp", "example.com")]
+
+
+def test_resolve_unknown_domain(dns_server):
+    """
+    Test case for a domain that does not exist.
+
+    Expected behavior:
+    - The resolver raises `socket.gaierror` with EAI_NONAME.
+    """
+    server = dns_server()
+    with pytest.raises(socket.gaierror) as error:
+        asyncio.run(make_resolver(server).resolve("invalid-domain"))
+    assert error.value.errno == socket.EAI_NONAME
+
+
+def test_resolve_truncated_falls_back_to_tcp(dns_server):
+    """
+    Test case for a reply truncated over UDP.
+
+    Expected behavior:
+    - The query is retried over TCP and the full answer is returned.
+    """
+    server = dns_server(records={"big.example": ["9.9.9.9"]}, truncated={"big.example"})
+    answer = asyncio.run(make_resolver(server).resolve("big.example"))
+    assert answer.addresses == ["9.9.9.9"]
+    assert server.queries == [("udp", "big.example"), ("tcp", "big.example")]
+
+
+def test_resolve_many_concurrently(dns_server):
+    """
+    Test case for thousands of lookups running on one event loop.
+
+    Expected behavior:
+    - Every lookup gets the answer for its own domain.
+    - No more than `max_inflight` queries are outstanding at any time.
+    """
+    records = {f"host{i}.example": [f"10.0.{i // 256}.{i % 256}"] for i in range(2000)}
+    server = dns_server(records=records)
+    resolver = make_resolver(server, max_inflight=64, timeout=5)
+    query = resolver.query
+    inflight = {"now": 0, "peak": 0}
+
+    async def counting_query(*args):
+        inflight["now"] += 1
+        inflight["peak"] = max(inflight["peak"], inflight["now"])
+        try:
+            return await query(*args)
+        finally:
+            inflight["now"] -= 1
+
+    resolver.query = counting_query
+
+    async def resolve_all():
+        answers = await asyncio.gather(*(resolver.resolve(name) for name in records))
+        await resolver.close()
+        return answers
+
+    answers = asyncio.run(resolve_all())
+    assert [answer.addresses for answer in answers] == list(records.values())
+    assert inflight["peak"] <= 64
+
+
+def test_queries_from_random_ports(dns_server):
+    """
+    Test case for the source ports of the queries.
+
+    Expected behavior:
+    - Each query is sent from a new socket, so from its own port.
+    - No socket is left open once the queries are answered.
+    """
+    server = dns_server(records={"example.com": ["1.2.3.4"]})
+    resolver = make_resolver(server)
+
+    async def run():
+        for _ in range(5):
+            await resolver.resolve("example.com")
+        return len(resolver._transports)
+
+    assert asyncio.run(run()) == 0
+    assert len(server.sources) == 5
+    assert len({port for _, port in server.sources}) == 5
+
+
+def test_randomize_case():
+    """
+    Test case for the 0x20 encoding of query names.
+
+    Expected behavior:
+    - Only the case of the letters of the name changes, the header, digits,
+      label lengths and question type do not.
+    - The case differs between queries of the same name.
+    """
+    message = build_query(4242, "www1.example.com")
+    randomized = {randomize_case(message) for _ in range(20)}
+    assert len(randomized) > 1
+    for query in randomized:
+        assert query.lower() == message
+        assert query[:12] == message[:12] and query[-4:] == message[-4:]
+
+
+def test_reply_question_must_match_case():
+    """
+    Test case for the matching of a reply to its query.
+
+    Expected behavior:
+    - A reply with the query ID but its name in another case, as forged by an
+      attacker not seeing the query, is ignored.
+    - A reply echoing the question exactly completes the query.
+    """
+    query = randomize_case(build_query(4242, "example.com"))
+    while query.lower() == query:
+        query = randomize_case(build_query(4242, "example.com"))
+    reply = bytearray(query)
+    reply[2] |= 0x80
+
+    async def run():
+        protocol = _UDPProtocol(query)
+        protocol.datagram_received(bytes(reply).lower(), None)
+        forged = protocol.reply.done()
+        protocol.datagram_received(bytes(reply), None)
+        return forged, protocol.reply.done()
+
+    assert asyncio.run(run()) == (False, True)
+
+
+def test_resolve_unreachable_nameserver():
+    """
+    Test case for a nameserver that never answers.
+
+    Expected behavior:
+    - The resolver gives up after its timeout and raises EAI_AGAIN.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        silent.bind(("127.0.0.1", 0))
+        resolver = AsyncResolver(
+            nameservers=[silent.getsockname()], timeout=0.1, attempts=1, hosts={}
+        )
+        with pytest.raises(socket.gaierror) as error:
+            asyncio.run(resolver.resolve("example.com"))
+    assert error.value.errno == socket.EAI_AGAIN
+
+
+def test_hedge_slow_upstream(dns_server):
+    """
+    Test case for a slow nameserver listed before a fast one.
+
+    Expected behavior:
+    - The first lookup hedges the slow upstream and gets the fast reply well
+      before the slow one would have answered.
+    - The fast upstream is then ranked first and answers alone.
+    """
+    records = {"example.com": ["1.2.3.4"], "other.example": ["5.6.7.8"]}
+    slow = dns_server(records=records, delay=0.5)
+    fast = dns_server(records=records)
+    resolver = make_resolver(slow, fast, timeout=0.4)
+
+    async def lookups():
+        started = time.monotonic()
+        first = await resolver.resolve("example.com")
+        elapsed = time.monotonic() - started
+        second = await resolver.resolve("other.example")
+        await resolver.close()
+        return first, elapsed, second
+
+    first, elapsed, second = asyncio.run(lookups())
+    assert first.addresses == ["1.2.3.4"]
+    assert elapsed < 0.4
+    assert second.addresses == ["5.6.7.8"]
+    assert resolver.ranked() == [fast.address, slow.address]
+    assert fast.queries == [("udp", "example.com"), ("udp", "other.example")]
+    assert slow.queries == [("udp", "example.com")]
+
+
+def test_failover_from_dead_upstream(dns_server):
+    """
+    Test case for a nameserver that never answers, listed first.
+
+    Expected behavior:
+    - Lookups are answered by the healthy upstream after the hedge delay,
+      not after the timeout of the dead one.
+    - Once the dead upstream has failed it is ranked last.
+    """
+    server = dns_server(records={"example.com": ["1.2.3.4"]})
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        silent.bind(("127.0.0.1", 0))
+        dead = silent.getsockname()
+        resolver = AsyncResolver(
+            nameservers=[dead, server.address], timeout=0.2, attempts=1, hosts={}
+        )
+
+        async def lookup():
+            started = time.monotonic()
+            answer = await resolver.resolve("example.com")
+            elapsed = time.monotonic() - started
+            await resolver.close()
+            return answer, elapsed
+
+        answer, elapsed = asyncio.run(lookup())
+    assert answer.addresses == ["1.2.3.4"]
+    assert elapsed < 0.2
+    assert resolver.ranked() == [server.address, dead]
+
+
+def test_upstream_metrics_exposed(client):
+    """
+    Test case for the per-upstream statistics on the /metrics endpoint.
+
+    Expected behavior:
+    - The upstream query counters and hedging counters are exported.
+    """
+    metrics_data = client.get("/metrics").content.decode("utf-8")
+    assert "dns_upstream_queries_total" in metrics_data
+    assert "dns_hedged_queries_total" in metrics_data
+    assert "dns_hedge_wins_total" in metrics_data
+
+
+def test_lookup_endpoint_uses_resolver(client, local_dns):
+    """
+    Test case for the /v1/tools/lookup endpoint backed by the async resolver.
+
+    Expected behavior:
+    - An unknown domain answered by the stand-in server returns 400.
+    """
+    server = local_dns()
+    response = client.get("/v1/tools/lookup?domain=missing.example")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Domain not found"}
+    assert server.queries == [("udp", "missing.example")]
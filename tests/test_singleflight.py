@@ -0,0 +1,127 @@
+"""
+Test suite for the coalescing of concurrent identical lookups.
+
+This module contains test cases for the following scenarios:
+1. Concurrent callers for the same key sharing a single call and its result.
+2. Concurrent callers all receiving the exception of the shared call.
+3. A cancelled caller not cancelling the call for the other callers.
+4. Concurrent lookups of a hot domain sending one query to the nameserver.
+5. Exposing the coalescing counters on the /metrics endpoint.
+"""
+
+import asyncio
+import socket
+
+import pytest
+
+from helpers.dns.singleflight import SingleFlight
+from routers import tools
+
+
+def test_singleflight_shares_result():
+    """
+    Test case for concurrent callers of the same key.
+
+    Expected behavior:
+    - The function runs once and every caller gets its result.
+    - A call made after the first one finished runs the function again.
+    """
+    group = SingleFlight()
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def scenario():
+        results = await asyncio.gather(*(group.do("key", work, 21) for _ in range(100)))
+        again = await group.do("key", work, 1)
+        return results, again
+
+    results, again = asyncio.run(scenario())
+    assert results == [42] * 100
+    assert again == 2
+    assert calls == [21, 1]
+    assert len(group) == 0
+
+
+def test_singleflight_shares_exception():
+    """
+    Test case for a shared call that fails.
+
+    Expected behavior:
+    - Every caller gets the error of the single call.
+    """
+    group = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+    async def scenario():
+        return await asyncio.gather(
+            *(group.do("key", fail) for _ in range(10)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(result, socket.gaierror) for result in results)
+
+
+def test_singleflight_survives_cancelled_caller():
+    """
+    Test case for a caller cancelled while waiting.
+
+    Expected behavior:
+    - Cancelling the first caller does not cancel the shared call, and the
+      other caller still gets the result.
+    """
+    group = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(group.do("key", work))
+        second = asyncio.ensure_future(group.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_hot_domain_single_query(local_dns):
+    """
+    Test case for a spike of lookups on one domain.
+
+    Expected behavior:
+    - 200 concurrent lookups of the same domain send a single query upstream.
+    """
+    server = local_dns(records={"hot.example": ["7.7.7.7"]}, delay=0.05)
+
+    async def spike():
+        return await asyncio.gather(
+            *(tools.resolve_domain("hot.example") for _ in range(200))
+        )
+
+    assert asyncio.run(spike()) == [["7.7.7.7"]] * 200
+    assert server.queries == [("udp", "hot.example")]
+
+
+def test_singleflight_metrics_exposed(client):
+    """
+    Test case for the coalescing counters on the /metrics endpoint.
+
+    Expected behavior:
+    - The dedup counter and the waiters gauge are exported.
+    """
+    metrics_data = client.get("/metrics").content.decode("utf-8")
+    assert "dns_singleflight_dedup_total" in metrics_data
+    assert "dns_singleflight_waiters" in metrics_data
@@ -0,0 +1,133 @@
+"""
+Test suite for the per-statement instrumentation and the slow-query log.
+
+This module contains test cases for the following scenarios:
+1. Normalizing statements so their executions share a label whatever their
+   parameters.
+2. Observing the duration and rows of the statements of sync and async
+   engines.
+3. Logging the slow statements with redacted parameters and a sampled plan,
+   within the rate limit, without affecting their transaction.
+"""
+
+import asyncio
+import logging
+
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db import database
+from db.statements import SlowQueryLog, normalize, redact, trace_statements
+
+
+def observed(name, statement):
+    """Returns the value of a statement metric sample, 0 when not exported."""
+    return REGISTRY.get_sample_value(name, {"statement": statement}) or 0
+
+
+def test_normalize():
+    """
+    Test case for the normalization of statements.
+
+    Expected behavior:
+    - Literals and placeholders of both drivers are replaced, IN lists of any
+      length and multi-row VALUES are collapsed, and whitespace is folded.
+    - Numbers in identifiers are kept.
+    """
+    assert normalize(
+        "SELECT a FROM t\n  WHERE x IN (%(x_1)s, %(x_2)s) AND y = 'it''s' LIMIT 10"
+    ) == normalize("SELECT a FROM t WHERE x IN ($1, $2, $3) AND y = 'z' LIMIT 5")
+    assert normalize("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4)") == (
+        "INSERT INTO t (a, b) VALUES (?, ...), ..."
+    )
+    assert normalize("SELECT * FROM query_log_20950101 WHERE n > 1.5") == (
+        "SELECT * FROM query_log_20950101 WHERE n > ?"
+    )
+
+
+def test_redact():
+    """
+    Test case for the redaction of bound parameters.
+
+    Expected behavior:
+    - Only the types of the values are kept.
+    """
+    assert redact({"domain": "secret.example", "n": 3}) == {
+        "domain": "<str>",
+        "n": "<int>",
+    }
+    assert redact(("secret.example",)) == ["<str>"]
+    assert redact([{"a": 1}, {"a": 2}], executemany=True) == (
+        "2 parameter sets, first {'a': '<int>'}"
+    )
+
+
+def test_slow_query_log(caplog):
+    """
+    Test case for the statements of a sync engine.
+
+    Expected behavior:
+    - The duration and rows of each statement are observed under its label.
+    - Slow statements are logged with their plan and without their parameter
+      values, up to the limit, and the transaction goes on.
+    """
+    slow_log = SlowQueryLog(threshold=0.01, limit=1, explain_rate=1)
+    engine = trace_statements(create_engine(database.DATABASE_URL), slow_log)
+    statement = "SELECT ?, pg_sleep(?) FROM generate_series(?, ...)"
+    count = observed("db_statement_duration_seconds_count", statement)
+    rows = observed("db_statement_rows_sum", statement)
+    try:
+        with caplog.at_level(logging.WARNING), engine.begin() as connection:
+            query = text("SELECT :secret, pg_sleep(0.02) FROM generate_series(1, 2)")
+            for _ in range(2):
+                connection.execute(query, {"secret": "hidden.example"}).all()
+            assert connection.execute(text("SELECT 1")).scalar() == 1
+        assert observed("db_statement_duration_seconds_count", statement) == count + 2
+        assert observed("db_statement_rows_sum", statement) == rows + 4
+        logged = [
+            record.getMessage()
+            for record in caplog.records
+            if record.getMessage().startswith("Slow query")
+        ]
+        assert len(logged) == 1
+        assert statement in logged[0]
+        assert "{'secret': '<str>'}" in logged[0]
+        assert "hidden.example" not in logged[0]
+        assert "Function Scan on generate_series" in logged[0]
+    finally:
+        engine.dispose()
+
+
+def test_async_statements(caplog):
+    """
+    Test case for the statements of an async engine.
+
+    Expected behavior:
+    - Statements are observed, and slow ones explained, on the event loop.
+    """
+    slow_log = SlowQueryLog(threshold=0.01, limit=10, explain_rate=1)
+    engine = trace_statements(
+        create_async_engine(database.async_url(database.DATABASE_URL)), slow_log
+    )
+    statement = "SELECT pg_sleep(?)"
+    count = observed("db_statement_duration_seconds_count", statement)
+
+    async def run():
+        try:
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT pg_sleep(0.02)"))
+                await connection.execute(text("SELECT pg_sleep(0.02)"))
+        finally:
+            await engine.dispose()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+    assert observed("db_statement_duration_seconds_count", statement) == count + 2
+    logged = [
+        record.getMessage()
+        for record in caplog.records
+        if record.getMessage().startswith("Slow query")
+    ]
+    assert len(logged) == 2
+    assert all("Result" in message for message in logged)
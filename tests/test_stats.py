@@ -0,0 +1,190 @@
+"""
+Test suite for the statistics rollups and the /stats endpoints.
+
+This module contains test cases for the following scenarios:
+1. Counting a batch of query logs per minute and per domain and day.
+2. Serving the queries per minute of a time range from the rollups, kept up
+   to date by successive batches.
+3. Serving the most queried domains of the last days.
+4. Rejecting invalid time ranges.
+5. Reading times given without a UTC offset as UTC.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from db.database import engine
+from db.rollups import rollup_counts
+from db.writer import insert_query_logs
+from models.log import QueryLog
+from models.resolution import Domain
+from models.stats import DomainStatsDaily, QueryStatsMinute
+
+
+def test_rollup_counts():
+    """
+    Test case for the counts of a batch.
+
+    Expected behavior:
+    - Rows are counted per UTC minute, and per UTC day and domain with the
+      latest query time, whatever the time zone of their creation time.
+    """
+    paris = timezone(timedelta(hours=2))
+    times = [
+        datetime(2026, 10, 19, 1, 0, 5, tzinfo=paris),
+        datetime(2026, 10, 18, 23, 0, 59, tzinfo=timezone.utc),
+        datetime(2026, 10, 18, 23, 1, tzinfo=timezone.utc),
+    ]
+    names = ["a.example", "a.example", "b.example"]
+    rows = [
+        {"domain": domain, "created_time": created_time}
+        for domain, created_time in zip(names, times)
+    ]
+    minutes, domains = rollup_counts(rows)
+    assert minutes == {
+        datetime(2026, 10, 18, 23, 0, tzinfo=timezone.utc): 2,
+        datetime(2026, 10, 18, 23, 1, tzinfo=timezone.utc): 1,
+    }
+    day = datetime(2026, 10, 18).date()
+    assert domains == {
+        (day, "a.example"): (2, times[1]),
+        (day, "b.example"): (1, times[2]),
+    }
+
+
+def test_query_stats(client):
+    """
+    Test case for the /stats/queries endpoint.
+
+    Expected behavior:
+    - The minutes with queries of the range are returned in order, with the
+      counts of every batch written during them.
+    """
+    start = datetime(2096, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {"domain": "stats.example", "created_time": start + timedelta(seconds=s)}
+        for s in (0, 10, 70, 3600)
+    ]
+    insert_query_logs(rows[:2])
+    insert_query_logs(rows[2:])
+    try:
+        response = client.get(
+            "/v1/stats/queries",
+            params={
+                "since": start.isoformat(),
+                "until": (start + timedelta(hours=1)).isoformat(),
+            },
+        )
+        assert response.status_code == 200
+        assert [
+            (datetime.fromisoformat(entry["bucket"]), entry["queries"])
+            for entry in response.json()
+        ] == [(start, 2), (start + timedelta(minutes=1), 1)]
+    finally:
+        with engine.begin() as connection:
+            connection.execute(delete(QueryLog).where(QueryLog.created_time >= start))
+            connection.execute(
+                delete(QueryStatsMinute).where(QueryStatsMinute.bucket >= start)
+            )
+            connection.execute(
+                delete(DomainStatsDaily).where(DomainStatsDaily.day >= start.date())
+            )
+
+
+def test_domain_stats(client):
+    """
+    Test case for the /stats/domains endpoint.
+
+    Expected behavior:
+    - Domains queried today are ranked by number of queries, with the time of
+      their last query.
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    rows = [{"domain": "top.stats.example", "created_time": now}] * 3
+    rows.append({"domain": "low.stats.example", "created_time": now})
+    insert_query_logs(rows)
+    try:
+        response = client.get("/v1/stats/domains", params={"limit": 1000})
+        assert response.status_code == 200
+        ranked = [
+            entry
+            for entry in response.json()
+            if entry["domain"].endswith(".stats.example")
+        ]
+        assert [(entry["domain"], entry["queries"]) for entry in ranked] == [
+            ("top.stats.example", 3),
+            ("low.stats.example", 1),
+        ]
+        assert datetime.fromisoformat(ranked[0]["last_seen"]) == now
+    finally:
+        domains = ("top.stats.example", "low.stats.example")
+        with engine.begin() as connection:
+            connection.execute(
+                delete(QueryLog).where(
+                    QueryLog.domainID.in_(
+                        select(Domain.domainID).where(Domain.name.in_(domains))
+                    )
+                )
+            )
+            connection.execute(
+                delete(DomainStatsDaily).where(DomainStatsDaily.domain.in_(domains))
+            )
+            connection.execute(
+                QueryStatsMinute.__table__.update()
+                .where(QueryStatsMinute.bucket == now.replace(second=0))
+                .values(queries=QueryStatsMinute.queries - len(rows))
+            )
+
+
+def test_query_stats_invalid_range(client):
+    """
+    Test case for the time range of /stats/queries.
+
+    Expected behavior:
+    - Empty ranges and ranges longer than STATS_MAX_MINUTES are rejected.
+    """
+    until = datetime(2096, 1, 1, tzinfo=timezone.utc)
+    for since in (until, until - timedelta(days=30)):
+        response = client.get(
+            "/v1/stats/queries",
+            params={"since": since.isoformat(), "until": until.isoformat()},
+        )
+        assert response.status_code == 400
+
+
+def test_query_stats_naive_times(client):
+    """
+    Test case for times given without a UTC offset.
+
+    Expected behavior:
+    - They are read as UTC, alone or mixed with an aware time, instead of
+      failing the comparison with the aware default.
+    """
+    start = datetime(2096, 1, 1, tzinfo=timezone.utc)
+    row = {"domain": "naive.stats.example", "created_time": start}
+    insert_query_logs([row])
+    try:
+        naive = start.replace(tzinfo=None).isoformat()
+        aware_until = (start + timedelta(hours=1)).isoformat()
+        response = client.get(
+            "/v1/stats/queries", params={"since": naive, "until": aware_until}
+        )
+        assert response.status_code == 200
+        assert [
+            datetime.fromisoformat(entry["bucket"]) for entry in response.json()
+        ] == [start]
+
+        # Alone, a naive since is compared with the aware default until, now
+        recent = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)
+        response = client.get("/v1/stats/queries", params={"since": recent.isoformat()})
+        assert response.status_code == 200
+    finally:
+        with engine.begin() as connection:
+            connection.execute(delete(QueryLog).where(QueryLog.created_time >= start))
+            connection.execute(
+                delete(QueryStatsMinute).where(QueryStatsMinute.bucket >= start)
+            )
+            connection.execute(
+                delete(DomainStatsDaily).where(DomainStatsDaily.day >= start.date())
+            )
@@ -9,12 +9,21 @@ This module contains test cases for the following scenarios:
    message and status code are returned.
 3. Validating a valid IPv6 address, with the expectation that it
    might return a "valid" flag based on the application’s business logic.
+4. Validating a stream of addresses sent as a JSON array or as
+   newline-delimited text, with one result line per address.
+5. Checking that the bulk validation engine agrees with the ipaddress module.
+6. Adding the classification labels of addresses when asked to.
 
 The client fixture is used to interact with the FastAPI application,
 allowing the test cases to simulate HTTP requests and validate
 responses.
 """
 
+import ipaddress
+import json
+
+from helpers.ip.validator import validate_ips
+
 
 def test_validate_ip_valid_ipv4(client):
     """
@@ -87,3 +96,127 @@ def test_validate_ip_valid_ipv6(client):
         "ip": "2001:0db8:85a3:0000:0000:8a2e:0370:7334",
         "valid": False,
     }
+
+
+def test_validate_batch_json_array(client):
+    """
+    Test case for a batch of addresses sent as a JSON array.
+
+    Expected behavior:
+    - Status code should be 200 (OK) with one NDJSON line per address.
+    - Each address has the same "valid" flag as /v1/tools/validate, and
+      invalid addresses carry an error instead of failing the request.
+    """
+    addresses = ["192.168.1.1", "999.999.999.999", "2001:db8::1", "not-an-ip"]
+    response = client.post("/v1/tools/validate/batch", json=addresses)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [
+        {"ip": "192.168.1.1", "valid": True},
+        {"ip": "999.999.999.999", "valid": False, "error": "Invalid IP address"},
+        {"ip": "2001:db8::1", "valid": False},
+        {"ip": "not-an-ip", "valid": False, "error": "Invalid IP address"},
+    ]
+
+
+def test_validate_batch_text_lines(client):
+    """
+    Test case for a large batch sent as newline-delimited text in chunks.
+
+    Expected behavior:
+    - Every address is validated, in order, whatever the chunk boundaries.
+    """
+    addresses = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(20000)]
+    body = "\n".join(addresses).encode()
+    bounds = ((start, start + 1000) for start in range(0, len(body), 1000))
+    chunks = (body[start:end] for start, end in bounds)
+    response = client.post(
+        "/v1/tools/validate/batch",
+        content=chunks,
+        headers={"content-type": "text/plain"},
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["ip"] for line in lines] == addresses
+    assert all(line["valid"] for line in lines)
+
+
+def test_validate_batch_malformed_body(client):
+    """
+    Test case for a body that is not a JSON array of strings.
+
+    Expected behavior:
+    - The results parsed so far are returned, followed by an error line.
+    """
+    response = client.post(
+        "/v1/tools/validate/batch",
+        content=b'["1.1.1.1", 42]',
+        headers={"content-type": "application/json"},
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1] == {"error": "Malformed request body"}
+
+
+def test_validate_ips_matches_ipaddress():
+    """
+    Test case for the bulk validation engine.
+
+    Expected behavior:
+    - For each sample, the engine gives the same outcome as the ipaddress
+      module used by /v1/tools/validate.
+    """
+    samples = [
+        "0.0.0.0",
+        "255.255.255.255",
+        "256.1.1.1",
+        "1.2.3",
+        "1.2.3.4.5",
+        "01.2.3.4",
+        "1.2.3.04",
+        " 1.2.3.4",
+        "1.2.3.4\n",
+        "١.٢.٣.٤",
+        "::1",
+        "::ffff:1.2.3.4",
+        "fe80::1%eth0",
+        "2001:db8:::1",
+        "",
+        "example.com",
+    ]
+
+    def expected(sample):
+        try:
+            return ipaddress.ip_address(sample).version == 4
+        except ValueError:
+            return None
+
+    assert validate_ips(samples) == [expected(sample) for sample in samples]
+
+
+def test_validate_classify(client):
+    """
+    Test case for classification labels on both validate endpoints.
+
+    Expected behavior:
+    - With classify=true, valid addresses carry the labels of the ranges
+      containing them, and invalid addresses carry none.
+    """
+    response = client.post(
+        "/v1/tools/validate?classify=true", json={"ip": "192.168.1.1"}
+    )
+    assert response.json() == {
+        "ip": "192.168.1.1",
+        "valid": True,
+        "labels": ["private"],
+    }
+
+    addresses = ["8.8.8.8", "127.0.0.1", "2001:db8::1", "bad"]
+    response = client.post("/v1/tools/validate/batch?classify=true", json=addresses)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [
+        {"ip": "8.8.8.8", "valid": True, "labels": []},
+        {"ip": "127.0.0.1", "valid": True, "labels": ["loopback"]},
+        {"ip": "2001:db8::1", "valid": False, "labels": ["reserved"]},
+        {"ip": "bad", "valid": False, "error": "Invalid IP address"},
+    ]